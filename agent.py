@@ -1,31 +1,48 @@
 import os
-import sqlite3
+import uuid
+from functools import lru_cache
 from typing import TypedDict, Annotated, List, Optional
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_ollama.chat_models import ChatOllama
-from pydantic import BaseModel, Field, model_validator
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from pydantic import BaseModel, Field, create_model, model_validator
 from typing import Any
 from tools import (
     search_patient_tool,
     add_new_patient_tool,
     find_slots_tool,
+    hold_slot_tool,
     book_appointment_tool,
-    send_confirmation_email_tool
+    send_confirmation_email_tool,
+    recheck_slots,
 )
+from booking import BOOKING_SUCCESSFUL, SLOT_TAKEN
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END, START
-from langgraph.checkpoint.sqlite import SqliteSaver
+from checkpointer import CHECKPOINT_DB, PrunableSqliteSaver
+from extraction_cache import ExtractionCache
+from llm_backend import LLMUnavailableError, get_backend
+from fast_extract import extract_fields
+from slot_prefetch import SlotPrefetcher
+from slot_index import slot_label
+from slot_holds import HOLD_TTL_SECONDS
+from instrumentation import timed
+from prompts import GREETING
 
 # --- 1. Define LLM and Pydantic Models for Extraction ---
-llm = ChatOllama(model="phi3:mini", format="json", temperature=0)
+# Calls go through the backend manager (concurrency cap, timeouts, circuit breaker, metrics);
+# the model is preloaded in the background so the first patient doesn't pay the load time.
+llm = get_backend().start_warmup().llm
 
-class PatientDetails(BaseModel):
-    full_name: Optional[str] = Field(default=None, description="The patient's full name.")
-    date_of_birth: Optional[str] = Field(default=None, description="The patient's date of birth in YYYY-MM-DD format.")
-    email: Optional[str] = Field(default=None, description="The patient's email address.")
-    phone_number: Optional[str] = Field(default=None, description="The patient's phone number.")
+def set_llm(new_llm: Any) -> None:
+    """Swaps the extraction model (e.g. for a mock in load tests) and drops chains and results built with the old one."""
+    global llm
+    llm = new_llm
+    get_llm_extractor.cache_clear()
+    extraction_cache.clear()
 
+class ExtractionModel(BaseModel):
     @model_validator(mode='before')
     @classmethod
     def sanitize_lists(cls, data: Any) -> Any:
@@ -35,50 +52,168 @@ class PatientDetails(BaseModel):
                     data[field] = " ".join(map(str, value))
         return data
 
-class InsuranceDetails(BaseModel):
+class BookingDetails(ExtractionModel):
+    """Everything the patient has to tell us for a booking; each step extracts only the fields it asks for."""
+    full_name: Optional[str] = Field(default=None, description="The patient's full name.")
+    date_of_birth: Optional[str] = Field(default=None, description="The patient's date of birth in YYYY-MM-DD format.")
+    email: Optional[str] = Field(default=None, description="The patient's email address.")
+    phone_number: Optional[str] = Field(default=None, description="The patient's phone number.")
     insurance_carrier: Optional[str] = Field(default=None, description="The patient's insurance provider.")
     member_id: Optional[str] = Field(default=None, description="The patient's insurance member ID.")
 
-    @model_validator(mode='before')
-    @classmethod
-    def sanitize_lists(cls, data: Any) -> Any:
-        if isinstance(data, dict):
-            for field, value in data.items():
-                if isinstance(value, list):
-                    data[field] = " ".join(map(str, value))
-        return data
+PATIENT_FIELDS = ("full_name", "date_of_birth", "email", "phone_number")
+CONTACT_FIELDS = ("email", "phone_number")
+INSURANCE_FIELDS = ("insurance_carrier", "member_id")
+
+@lru_cache(maxsize=None)
+def get_fields_model(pydantic_model: Any, field_names: tuple) -> Any:
+    """Returns a model restricted to `field_names`, so the LLM is only asked for what is still missing."""
+    if set(field_names) == set(pydantic_model.model_fields):
+        return pydantic_model
+    fields = {name: (pydantic_model.model_fields[name].annotation, pydantic_model.model_fields[name]) for name in field_names}
+    return create_model(f"{pydantic_model.__name__}Missing", __base__=ExtractionModel, **fields)
 
+@lru_cache(maxsize=None)
 def get_llm_extractor(pydantic_model: Any) -> Any:
+    """Builds the extraction chain for a model once; later calls reuse the compiled chain."""
     parser = PydanticOutputParser(pydantic_object=pydantic_model)
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", "You are an expert extraction algorithm. Only extract values from the text. Do not guess. Your output MUST be a JSON object that adheres to the provided schema below.\n\nSCHEMA:\n{format_instructions}"),
+            ("system", "Extract the patient's details from the text. Only use values stated in the text; do not guess."),
             ("human", "TEXT:\n{user_message}"),
         ]
     )
-    return prompt.partial(format_instructions=parser.get_format_instructions()) | llm | parser
+    # Ollama constrains decoding to the JSON schema passed as `format`, so the schema isn't repeated in the prompt.
+    return prompt | llm.bind(format=pydantic_model.model_json_schema()) | parser
+
+extraction_cache = ExtractionCache()
+
+def run_extractor(pydantic_model: Any, user_message: str) -> Any:
+    """Runs an extraction, serving repeated (model, message) pairs from the cache."""
+    cached = extraction_cache.get(pydantic_model, user_message)
+    if cached is not None:
+        return cached
+    extracted_data = get_llm_extractor(pydantic_model).invoke({"user_message": user_message})
+    extraction_cache.put(pydantic_model, user_message, extracted_data)
+    return extracted_data
+
+async def arun_extractor(pydantic_model: Any, user_message: str) -> Any:
+    cached = extraction_cache.get(pydantic_model, user_message)
+    if cached is not None:
+        return cached
+    extracted_data = await get_llm_extractor(pydantic_model).ainvoke({"user_message": user_message})
+    extraction_cache.put(pydantic_model, user_message, extracted_data)
+    return extracted_data
+
+def report_status(text: str) -> None:
+    """Shows a progress line to callers streaming with stream_mode="custom"; a no-op otherwise."""
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:  # called outside a graph run
+        return
+    writer({"status": text})
+
+def _rule_fields(user_message: str, known: dict, fields, required_fields) -> tuple:
+    """Regex pass of extract_details: returns (found, missing); missing is empty when the LLM can be skipped."""
+    found = extract_fields(user_message, fields)
+    have = {**known, **found}
+    missing = tuple(name for name in fields if not have.get(name))
+    if all(have.get(name) for name in required_fields):
+        missing = ()
+    return found, missing
+
+def extract_details(user_message: str, known: dict, fields, required_fields=()) -> dict:
+    """
+    Returns the `fields` stated in the message, regex rules first. If any of `required_fields` is
+    still unknown, one LLM call fills the `fields` not `known` yet. Only the current step's fields
+    are read: "Oscar Jones" is not a carrier and a member ID is not a phone number.
+    """
+    found, missing = _rule_fields(user_message, known, fields, required_fields)
+    if not missing:
+        return found
+    report_status("Reading your details...")
+    try:
+        llm_data = run_extractor(get_fields_model(BookingDetails, missing), user_message)
+    except LLMUnavailableError as e:
+        # Degrade to what the rules found; the graph asks again for anything still missing.
+        print(f"LLM unavailable, using rule-based extraction only: {e}")
+        return found
+    return {**llm_data.dict(exclude_none=True), **found}
+
+async def aextract_details(user_message: str, known: dict, fields, required_fields=()) -> dict:
+    found, missing = _rule_fields(user_message, known, fields, required_fields)
+    if not missing:
+        return found
+    report_status("Reading your details...")
+    try:
+        llm_data = await arun_extractor(get_fields_model(BookingDetails, missing), user_message)
+    except LLMUnavailableError as e:
+        print(f"LLM unavailable, using rule-based extraction only: {e}")
+        return found
+    return {**llm_data.dict(exclude_none=True), **found}
+
+def _merge_patient_details(state, found: dict) -> dict:
+    """Folds newly stated fields into `details` and copies the patient fields into patient_info."""
+    details = {**state.get("details", {}), **found}
+    patient_info = state.get("patient_info", {})
+    patient_info.update({name: details[name] for name in PATIENT_FIELDS if details.get(name)})
+    return {"details": details, "patient_info": patient_info}
+
+def insurance_is_known(state) -> bool:
+    details = state.get("details", {})
+    return all(details.get(name) for name in INSURANCE_FIELDS)
+
+# Slots only depend on the appointment length, so both lengths are fetched while the patient
+# is being identified; the slot nodes reuse the ones nobody has booked or held since.
+slot_prefetcher = SlotPrefetcher(lambda duration: find_slots_tool.invoke({"duration": duration}),
+                                 recheck=recheck_slots,
+                                 afetch=lambda duration: find_slots_tool.ainvoke({"duration": duration}))
+
+def _thread_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return (config or {}).get("configurable", {}).get("thread_id")
 
 # --- 2. Define the State for the Graph ---
+# Nodes only read the latest message and decide_entry_point checks len(messages) > 3, so the
+# graph state keeps a bounded window; the UI holds the full transcript.
+MIN_MESSAGE_WINDOW = 4
+MESSAGE_WINDOW = max(MIN_MESSAGE_WINDOW, int(os.getenv("MESSAGE_WINDOW", "12")))
+
+def append_messages(existing: List[BaseMessage], new: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Appends `new` and drops messages older than MESSAGE_WINDOW, so each step copies at most the window.
+    Dropped messages stay readable in the checkpointer's message archive, keyed by the ids set here.
+    """
+    if not new:
+        return existing
+    for message in new:
+        if message.id is None:
+            message.id = str(uuid.uuid4())
+    keep = MESSAGE_WINDOW - len(new)
+    if keep <= 0:
+        return list(new[-MESSAGE_WINDOW:])
+    return existing[-keep:] + list(new)
+
 class GraphState(TypedDict):
-    messages: Annotated[List[BaseMessage], lambda x, y: x + y]
+    messages: Annotated[List[BaseMessage], append_messages]
     patient_info: dict
     booking_info: dict
+    details: dict  # every BookingDetails field the patient has stated so far
     is_new_patient: Optional[bool]
+    confirm_identity: Optional[bool]  # asked the patient to confirm a close-but-inexact record match
+    selected_schedule_id: Optional[int]  # the slot the patient just picked, set by the UI with their message
     final_confirmation: Optional[str]
     email_status: Optional[str]
 
 # --- 3. Define the Nodes of the Graph ---
 def greet_patient(state: GraphState):
-    message = AIMessage(content="Hello! To book an appointment, please provide your **full name** and **date of birth** (YYYY-MM-DD). You can also include your email and phone number to speed things up.")
+    message = AIMessage(content=GREETING)
     return {"messages": [message]}
 
-def extract_patient_details(state: GraphState):
+def extract_patient_details(state: GraphState, config: RunnableConfig):
+    slot_prefetcher.start(_thread_id(config))
     user_message = state["messages"][-1].content
-    extractor = get_llm_extractor(PatientDetails)
-    extracted_data = extractor.invoke({"user_message": user_message})
-    current_patient_info = state.get("patient_info", {})
-    current_patient_info.update(extracted_data.dict(exclude_unset=True, exclude_none=True))
-    return {"patient_info": current_patient_info}
+    found = extract_details(user_message, state.get("details", {}), PATIENT_FIELDS, ("full_name", "date_of_birth"))
+    return _merge_patient_details(state, found)
 
 #
 # =========================================================================================
@@ -88,15 +223,26 @@ def extract_patient_details(state: GraphState):
 #
 def check_patient_record(state: GraphState):
     patient_info = state["patient_info"]
-    full_name, dob = patient_info.get("full_name"), patient_info.get("date_of_birth")
+    full_name = patient_info.get("full_name")
     
-    search_result = search_patient_tool.invoke({"full_name": full_name, "date_of_birth": dob})
-    if search_result["status"] == "Patient Not Found":
+    report_status("Searching patient records...")
+    search_result = search_patient_tool.invoke(_search_payload(patient_info))
+    return _patient_record_result(state, full_name, search_result)
+
+def _search_payload(patient_info):
+    return {name: patient_info.get(name) for name in PATIENT_FIELDS}
+
+def _patient_record_result(state, full_name, search_result):
+    if search_result["status"] == "Confirmation Needed" and not state.get("confirm_identity"):
+        # Only a similar name shares this DOB: it may be someone else, so show nothing from the record.
+        message = AIMessage(content="I found a record with a similar name and that date of birth. To confirm it's yours, could you please provide the **email** or **phone number** on file?")
+        return {"messages": [message], "is_new_patient": None, "confirm_identity": True}
+    if search_result["status"] != "Patient Found":
+        # Not found, or the close match wasn't confirmed: register the patient as new.
         message = AIMessage(content=f"I couldn't find a record for {full_name}. We'll need to create a new one.")
-        return {"messages": [message], "is_new_patient": True}
-    else:
-        message = AIMessage(content=f"Welcome back, {search_result['full_name']}!")
-        return {"messages": [message], "patient_info": search_result, "is_new_patient": False}
+        return {"messages": [message], "is_new_patient": True, "confirm_identity": None}
+    message = AIMessage(content=f"Welcome back, {search_result['full_name']}!")
+    return {"messages": [message], "patient_info": search_result, "is_new_patient": False, "confirm_identity": None}
 
 #
 # =========================================================================================
@@ -108,73 +254,205 @@ def ask_for_details(state: GraphState):
     return {"messages": [message]}
     
 def request_missing_info(state: GraphState):
-    message = AIMessage(content="Could you also please provide your **email** and **phone number** to complete your profile?")
+    patient_info = state.get("patient_info", {})
+    missing = [label for name, label in (("email", "**email**"), ("phone_number", "**phone number**")) if not patient_info.get(name)]
+    message = AIMessage(content=f"Could you also please provide your {' and '.join(missing)} to complete your profile?")
     return {"messages": [message]}
 
-def create_new_patient_and_find_slots(state: GraphState):
+def extract_contact_details(state: GraphState, config: RunnableConfig):
+    slot_prefetcher.start(_thread_id(config))  # no-op if this conversation's prefetch is still fresh
     user_message = state["messages"][-1].content
-    extractor = get_llm_extractor(PatientDetails)
-    extracted_data = extractor.invoke({"user_message": user_message})
-    patient_info = state["patient_info"]
-    patient_info.update(extracted_data.dict(exclude_unset=True, exclude_none=True))
-    new_patient = add_new_patient_tool.invoke(patient_info)
+    return _merge_patient_details(state, extract_details(user_message, state.get("details", {}), CONTACT_FIELDS, CONTACT_FIELDS))
+
+def create_new_patient_and_find_slots(state: GraphState, config: RunnableConfig):
+    thread_id = _thread_id(config)
+    slot_prefetcher.start(thread_id)
+    report_status("Creating your patient profile...")
+    new_patient = add_new_patient_tool.invoke({name: state["patient_info"].get(name) for name in PATIENT_FIELDS})
+    report_status("Finding available slots...")
+    slots = slot_prefetcher.get(thread_id, 60)
+    return _new_patient_result(new_patient, slots)
+
+def _new_patient_result(new_patient, slots):
     messages = [AIMessage(content="Thank you, your profile is complete. New patient appointments are **60 minutes**."), AIMessage(content="Let me find available slots for you...")]
-    slots = find_slots_tool.invoke({"duration": 60})
     booking_info = {'duration': 60, 'slots': slots.get('available_slots', [])}
     return {"patient_info": new_patient, "booking_info": booking_info, "messages": messages}
     
-def find_slots_for_returning_patient(state: GraphState):
+def find_slots_for_returning_patient(state: GraphState, config: RunnableConfig):
+    report_status("Finding available slots...")
+    return _returning_patient_result(slot_prefetcher.get(_thread_id(config), 30))
+
+def _returning_patient_result(slots):
     messages = [AIMessage(content="Returning patient appointments are **30 minutes**."), AIMessage(content="Let me find available slots for you...")]
-    slots = find_slots_tool.invoke({"duration": 30})
     booking_info = {'duration': 30, 'slots': slots.get('available_slots', [])}
     return {"booking_info": booking_info, "messages": messages}
 
 def book_appointment_and_confirm(state: GraphState):
-    user_message = state["messages"][-1].content
-    extractor = get_llm_extractor(InsuranceDetails)
-    insurance_data = extractor.invoke({"user_message": user_message})
-    carrier, member_id = insurance_data.insurance_carrier or "Self-Pay", insurance_data.member_id or "N/A"
-    booking_payload = {"patient_id": state['patient_info']['patient_id'], "doctor_name": state['booking_info']['doctor_name'], "appointment_time": state['booking_info']['appointment_time'], "duration": state['booking_info']['duration'], "insurance_carrier": carrier, "member_id": member_id}
-    final_booking = book_appointment_tool.invoke(booking_payload)
-    if final_booking.get("status") == "Booking Successful":
+    details = state.get("details", {})
+    if not insurance_is_known(state):
+        details = {**details, **extract_details(state["messages"][-1].content, details, INSURANCE_FIELDS, INSURANCE_FIELDS)}
+    report_status("Booking your appointment...")
+    final_booking = book_appointment_tool.invoke(_booking_payload(state, details))
+    if final_booking.get("status") == SLOT_TAKEN:
+        # Someone else got the slot first: drop the selection and re-offer fresh slots.
+        duration = state['booking_info']['duration']
+        return {**_slot_taken_result(duration, find_slots_tool.invoke({"duration": duration})), "details": details}
+    if final_booking.get("status") == BOOKING_SUCCESSFUL:
+        report_status("Sending your confirmation email...")
         email_result = send_confirmation_email_tool.invoke({"patient_id": state['patient_info']['patient_id'], "appointment_time": state['booking_info']['appointment_time']})
-        confirmation_message = f"""### ✅ Appointment Confirmed!\nYour appointment is successfully booked.\n- **Patient:** {state['patient_info']['full_name']}\n- **With:** {state['booking_info']['doctor_name']}\n- **At:** {state['booking_info']['appointment_time']}"""
-        return {"final_confirmation": confirmation_message, "email_status": email_result.get("email_status")}
-    else:
-        message = AIMessage(content="There was an issue confirming your booking. Please try again.")
-        return {"messages": [message]}
+        return _booking_confirmed_result(state, email_result)
+    return _booking_failed_result()
 
-def process_slot_selection(state: GraphState):
-    chosen_slot = state["messages"][-1].content.replace("I'll take the slot: ", "")
-    parts = chosen_slot.split(" at ")
-    booking_info = state.get("booking_info", {})
-    booking_info.update({'doctor_name': parts[0], 'appointment_time': parts[1]})
-    message = AIMessage(content="Great! To finalize, could you please provide your **insurance carrier** and **member ID**? (If you are a self-payer, you can just say so).")
+def _booking_payload(state, details):
+    carrier, member_id = details.get("insurance_carrier") or "Self-Pay", details.get("member_id") or "N/A"
+    slot = state['booking_info']['slot']
+    return {"patient_id": state['patient_info']['patient_id'], "schedule_ids": slot['schedule_ids'], "doctor_name": slot['doctor_name'], "start_time": slot['start_time'], "duration": state['booking_info']['duration'], "insurance_carrier": carrier, "member_id": member_id, "hold_token": state['booking_info'].get('hold_token')}
+
+def _slot_taken_result(duration, slots):
+    booking_info = {'duration': duration, 'slots': slots.get('available_slots', [])}
+    message = AIMessage(content="I'm sorry, that slot was just taken by another patient. Please choose one of the updated slots below.")
     return {"booking_info": booking_info, "messages": [message]}
 
+def _booking_confirmed_result(state, email_result):
+    confirmation_message = f"""### ✅ Appointment Confirmed!\nYour appointment is successfully booked.\n- **Patient:** {state['patient_info']['full_name']}\n- **With:** {state['booking_info']['doctor_name']}\n- **At:** {state['booking_info']['appointment_time']}"""
+    return {"final_confirmation": confirmation_message, "email_status": email_result.get("email_status")}
+
+def _booking_failed_result():
+    message = AIMessage(content="There was an issue confirming your booking. Please try again.")
+    return {"messages": [message]}
+
+def slot_selection_input(slot: dict) -> dict:
+    """Graph input for picking one of booking_info["slots"]; the message is only there for the transcript."""
+    message = HumanMessage(content=f"I'll take the slot: {slot['doctor_name']} at {slot_label(slot)}", id=str(uuid.uuid4()))
+    return {"messages": [message], "selected_schedule_id": slot["schedule_id"]}
+
+def _selected_slot(state):
+    booking_info = state.get("booking_info", {})
+    return booking_info, next((slot for slot in booking_info.get("slots", []) if slot["schedule_id"] == state.get("selected_schedule_id")), None)
+
+def _hold_token(config: Optional[RunnableConfig]) -> str:
+    return _thread_id(config) or str(uuid.uuid4())
+
+def _hold_payload(slot, hold_token):
+    return {"hold_token": hold_token, "schedule_ids": slot['schedule_ids']}
+
+def _slot_unavailable_result(booking_info):
+    # Also drop any earlier pick, so nothing gets booked until the patient chooses again.
+    booking_info = {'duration': booking_info.get('duration'), 'slots': booking_info.get('slots', [])}
+    message = AIMessage(content="That slot is no longer on offer. Please choose one of the slots below.")
+    return {"booking_info": booking_info, "selected_schedule_id": None, "messages": [message]}
+
+def _slot_selected_result(state, booking_info, slot, hold_token):
+    booking_info = {**booking_info, 'slot': slot, 'doctor_name': slot['doctor_name'], 'appointment_time': slot_label(slot), 'hold_token': hold_token}
+    if insurance_is_known(state):
+        # Insurance was given before the previous pick was taken; decide_after_slot_selection books right away.
+        return {"booking_info": booking_info, "selected_schedule_id": None}
+    message = AIMessage(content=f"Great! I'm holding this slot for you for {HOLD_TTL_SECONDS // 60} minutes. To finalize, could you please provide your **insurance carrier** and **member ID**? (If you are a self-payer, you can just say so).")
+    return {"booking_info": booking_info, "selected_schedule_id": None, "messages": [message]}
+
+def process_slot_selection(state: GraphState, config: RunnableConfig):
+    booking_info, slot = _selected_slot(state)
+    if slot is None:
+        return _slot_unavailable_result(booking_info)
+    hold_token = _hold_token(config)
+    if not insurance_is_known(state):
+        # The patient still has to type their insurance; hold the slot so nobody takes it meanwhile.
+        hold = hold_slot_tool.invoke(_hold_payload(slot, hold_token))
+        if hold.get("status") == SLOT_TAKEN:
+            duration = booking_info['duration']
+            return {**_slot_taken_result(duration, find_slots_tool.invoke({"duration": duration})), "selected_schedule_id": None}
+    return _slot_selected_result(state, booking_info, slot, hold_token)
+
+# --- 3b. Async variants of the I/O-bound nodes (used by ainvoke/astream) ---
+async def aextract_patient_details(state: GraphState, config: RunnableConfig):
+    slot_prefetcher.start(_thread_id(config))
+    user_message = state["messages"][-1].content
+    found = await aextract_details(user_message, state.get("details", {}), PATIENT_FIELDS, ("full_name", "date_of_birth"))
+    return _merge_patient_details(state, found)
+
+async def acheck_patient_record(state: GraphState):
+    patient_info = state["patient_info"]
+    full_name = patient_info.get("full_name")
+    report_status("Searching patient records...")
+    search_result = await search_patient_tool.ainvoke(_search_payload(patient_info))
+    return _patient_record_result(state, full_name, search_result)
+
+async def aextract_contact_details(state: GraphState, config: RunnableConfig):
+    slot_prefetcher.start(_thread_id(config))
+    user_message = state["messages"][-1].content
+    return _merge_patient_details(state, await aextract_details(user_message, state.get("details", {}), CONTACT_FIELDS, CONTACT_FIELDS))
+
+async def acreate_new_patient_and_find_slots(state: GraphState, config: RunnableConfig):
+    thread_id = _thread_id(config)
+    slot_prefetcher.start(thread_id)
+    report_status("Creating your patient profile...")
+    new_patient = await add_new_patient_tool.ainvoke({name: state["patient_info"].get(name) for name in PATIENT_FIELDS})
+    report_status("Finding available slots...")
+    slots = await slot_prefetcher.aget(thread_id, 60)
+    return _new_patient_result(new_patient, slots)
+
+async def afind_slots_for_returning_patient(state: GraphState, config: RunnableConfig):
+    report_status("Finding available slots...")
+    return _returning_patient_result(await slot_prefetcher.aget(_thread_id(config), 30))
+
+async def abook_appointment_and_confirm(state: GraphState):
+    details = state.get("details", {})
+    if not insurance_is_known(state):
+        details = {**details, **await aextract_details(state["messages"][-1].content, details, INSURANCE_FIELDS, INSURANCE_FIELDS)}
+    report_status("Booking your appointment...")
+    final_booking = await book_appointment_tool.ainvoke(_booking_payload(state, details))
+    if final_booking.get("status") == SLOT_TAKEN:
+        duration = state['booking_info']['duration']
+        return {**_slot_taken_result(duration, await find_slots_tool.ainvoke({"duration": duration})), "details": details}
+    if final_booking.get("status") == BOOKING_SUCCESSFUL:
+        report_status("Sending your confirmation email...")
+        email_result = await send_confirmation_email_tool.ainvoke({"patient_id": state['patient_info']['patient_id'], "appointment_time": state['booking_info']['appointment_time']})
+        return _booking_confirmed_result(state, email_result)
+    return _booking_failed_result()
+
+async def aprocess_slot_selection(state: GraphState, config: RunnableConfig):
+    booking_info, slot = _selected_slot(state)
+    if slot is None:
+        return _slot_unavailable_result(booking_info)
+    hold_token = _hold_token(config)
+    if not insurance_is_known(state):
+        hold = await hold_slot_tool.ainvoke(_hold_payload(slot, hold_token))
+        if hold.get("status") == SLOT_TAKEN:
+            duration = booking_info['duration']
+            return {**_slot_taken_result(duration, await find_slots_tool.ainvoke({"duration": duration})), "selected_schedule_id": None}
+    return _slot_selected_result(state, booking_info, slot, hold_token)
+
 # --- 4. Define Conditional Logic ---
+def contact_details_are_sufficient(state: GraphState):
+    # add_new_patient_tool needs both; keep asking (e.g. when the LLM is down and the rules found only one).
+    patient_info = state["patient_info"]
+    if not patient_info.get("email") or not patient_info.get("phone_number"):
+        return "request_missing_info"
+    return "create_new_patient"
+
 def decide_after_check(state: GraphState):
+    if state.get("is_new_patient") is None:
+        return "confirm_identity"
     if state["is_new_patient"]:
-        patient_info = state["patient_info"]
-        if not patient_info.get("email") or not patient_info.get("phone_number"):
-            return "request_missing_info"
-        else:
-            return "create_new_patient"
+        return contact_details_are_sufficient(state)
     else:
         return "find_slots_returning"
 
 def decide_entry_point(state: GraphState):
     if not state.get("messages"):
         return "greet_patient"
-    last_message = state["messages"][-1]
-    if "I'll take the slot:" in last_message.content:
+    if state.get("selected_schedule_id") is not None:
         return "process_slot_selection"
     if state.get("booking_info", {}).get("appointment_time"):
         return "book_appointment"
     if state.get("is_new_patient") is True and len(state["messages"]) > 3:
-        return "create_new_patient"
+        return "extract_contact_details"
     return "extract_patient_details"
 
+def decide_after_slot_selection(state: GraphState):
+    selected = state.get("booking_info", {}).get("appointment_time")
+    return "book_appointment" if selected and insurance_is_known(state) else END
+
 #
 # =========================================================================================
 # FIX #3: A NEW conditional function to validate details after extraction.
@@ -190,20 +468,27 @@ def details_are_sufficient(state: GraphState):
 # --- 5. Build the Graph ---
 workflow = StateGraph(GraphState)
 
-workflow.add_node("greet_patient", greet_patient)
-workflow.add_node("extract_patient_details", extract_patient_details)
-workflow.add_node("check_patient_record", check_patient_record)
-workflow.add_node("ask_for_details", ask_for_details) # Add the new node
-workflow.add_node("request_missing_info", request_missing_info)
-workflow.add_node("create_new_patient", create_new_patient_and_find_slots)
-workflow.add_node("find_slots_returning", find_slots_for_returning_patient)
-workflow.add_node("process_slot_selection", process_slot_selection)
-workflow.add_node("book_appointment", book_appointment_and_confirm)
+def timed_node(name: str, func, afunc=None):
+    """Node runnable whose sync and async bodies are recorded as instrumentation spans."""
+    func = timed("node", name, func)
+    return RunnableLambda(func, afunc=timed("node", name, afunc)) if afunc else func
+
+
+workflow.add_node("greet_patient", timed_node("greet_patient", greet_patient))
+workflow.add_node("extract_patient_details", timed_node("extract_patient_details", extract_patient_details, aextract_patient_details))
+workflow.add_node("check_patient_record", timed_node("check_patient_record", check_patient_record, acheck_patient_record))
+workflow.add_node("ask_for_details", timed_node("ask_for_details", ask_for_details)) # Add the new node
+workflow.add_node("request_missing_info", timed_node("request_missing_info", request_missing_info))
+workflow.add_node("extract_contact_details", timed_node("extract_contact_details", extract_contact_details, aextract_contact_details))
+workflow.add_node("create_new_patient", timed_node("create_new_patient", create_new_patient_and_find_slots, acreate_new_patient_and_find_slots))
+workflow.add_node("find_slots_returning", timed_node("find_slots_returning", find_slots_for_returning_patient, afind_slots_for_returning_patient))
+workflow.add_node("process_slot_selection", timed_node("process_slot_selection", process_slot_selection, aprocess_slot_selection))
+workflow.add_node("book_appointment", timed_node("book_appointment", book_appointment_and_confirm, abook_appointment_and_confirm))
 
 workflow.add_conditional_edges(START, decide_entry_point, {
     "greet_patient": "greet_patient",
     "process_slot_selection": "process_slot_selection",
-    "create_new_patient": "create_new_patient",
+    "extract_contact_details": "extract_contact_details",
     "extract_patient_details": "extract_patient_details",
     "book_appointment": "book_appointment",
 })
@@ -226,17 +511,25 @@ workflow.add_conditional_edges(
 )
 
 workflow.add_conditional_edges("check_patient_record", decide_after_check, {
+    "confirm_identity": END,
     "request_missing_info": "request_missing_info",
     "create_new_patient": "create_new_patient",
     "find_slots_returning": "find_slots_returning",
 })
 
+workflow.add_conditional_edges("extract_contact_details", contact_details_are_sufficient, {
+    "request_missing_info": "request_missing_info",
+    "create_new_patient": "create_new_patient",
+})
+
 workflow.add_edge("request_missing_info", END) 
 workflow.add_edge("create_new_patient", END) 
 workflow.add_edge("find_slots_returning", END) 
-workflow.add_edge("process_slot_selection", END) 
+workflow.add_conditional_edges("process_slot_selection", decide_after_slot_selection, {
+    "book_appointment": "book_appointment",
+    END: END,
+})
 workflow.add_edge("book_appointment", END)
 
-conn = sqlite3.connect(":memory:", check_same_thread=False)
-memory = SqliteSaver(conn=conn)
+memory = PrunableSqliteSaver(CHECKPOINT_DB).start_compaction()
 agent_runnable = workflow.compile(checkpointer=memory)
\ No newline at end of file
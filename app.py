@@ -1,10 +1,30 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import hashlib
+import hmac
+import importlib
+import json
+import os
+import secrets
+import threading
+import time
 import uuid
 from collections import defaultdict
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage
 
-from agent import agent_runnable
-from tools import generate_admin_report
+import instrumentation
+from prompts import GREETING
+from report_export import FORMATS, get_export_job, start_export_job
+from slot_holds import hold_stats
+from slot_index import slot_label
+
+DB_FILE = "data/clinic.db"
+# The conversation's thread_id lives in a signed cookie rather than the URL, so a shared link,
+# the browser history or a proxy log is not enough to reopen someone's booking.
+SESSION_COOKIE = "clinic_session"
+SESSION_MAX_AGE = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600)))  # as long as the checkpoint is kept
+
+instrumentation.start_metrics_server()  # /metrics when METRICS_PORT is set
 
 st.set_page_config(
     page_title="AI Medical Appointment Scheduling Agent",
@@ -27,17 +47,112 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.fragment(run_every=1)
+def admin_report_status():
+    """Polls the background export started from the admin panel."""
+    job = get_export_job(st.session_state.get("report_job_id"))
+    if job is None:
+        return
+    if job.status == "failed":
+        st.error(f"Report failed: {job.error}")
+    elif job.status == "done":
+        st.success(f"Report generated: `{job.path}` ({job.rows_done} rows)")
+    else:
+        total = job.rows_total if job.rows_total is not None else "?"
+        st.progress(job.fraction, text=f"Exporting {job.rows_done}/{total} rows...")
+
+@st.fragment(run_every=5)
+def latency_breakdown():
+    """Live per-node, per-tool and LLM latency from the instrumentation registry."""
+    snapshot = instrumentation.snapshot()
+    spans = [span for span in snapshot["spans"] if span["count"]]
+    if not spans:
+        st.caption("No spans recorded yet.")
+        return
+    # A markdown table rather than st.dataframe, which would import pandas on every page.
+    rows = ["| span | calls | p50 ms | p95 ms | errors |", "|---|---:|---:|---:|---:|"]
+    rows += [f"| {span['kind']} {span['name']} | {span['count']} | {span['p50_ms']:.1f} | {span['p95_ms']:.1f} | {span['errors']} |"
+             for span in spans]
+    st.markdown("\n".join(rows))
+    for model, tokens in snapshot["tokens"].items():
+        st.caption(f"{model}: {tokens['prompt']} prompt / {tokens['completion']} completion tokens")
+    holds = hold_stats()
+    if holds["placed"] or holds["conflicts"]:
+        rate = f"{holds['conversion_rate']:.0%}" if holds["conversion_rate"] is not None else "n/a"
+        st.caption(f"Slot holds: {holds['placed']} placed, {holds['converted']} booked, {holds['expired']} expired, "
+                   f"{holds['conflicts']} refused; conversion {rate}")
+    st.download_button("Prometheus metrics", instrumentation.prometheus_text(), "metrics.txt", "text/plain")
+    st.download_button("JSON metrics", json.dumps(snapshot, indent=2), "metrics.json", "application/json")
+
+# agent.py imports langchain, langgraph and the tools and compiles the graph, which takes
+# longer than rendering the page. It is loaded once per process, in the background after
+# the first render, and a new conversation's greeting is written without running the graph.
+@st.cache_resource
+def load_agent():
+    """The compiled graph (and, through agent.py, the warmed-up LLM backend), shared by all sessions."""
+    return importlib.import_module("agent").agent_runnable
+
+@st.cache_resource
+def preload_agent():
+    thread = threading.Thread(target=importlib.import_module, args=("agent",), name="agent-preload", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def session_secret() -> bytes:
+    """SESSION_SECRET signs session cookies; without it a per-process key is used and sessions end on restart."""
+    secret = os.getenv("SESSION_SECRET")
+    return secret.encode() if secret else secrets.token_bytes(32)
+
+def sign_session(thread_id, issued):
+    mac = hmac.new(session_secret(), f"{thread_id}.{issued}".encode(), hashlib.sha256).hexdigest()
+    return f"{thread_id}.{issued}.{mac}"
+
+def session_thread_id():
+    """The thread_id of a valid, unexpired session cookie sent by the browser; None otherwise."""
+    value = st.context.cookies.get(SESSION_COOKIE)
+    if not value:
+        return None
+    try:
+        thread_id, issued, _ = value.rsplit(".", 2)
+        issued = int(issued)
+    except ValueError:
+        return None
+    if time.time() - issued > SESSION_MAX_AGE or not hmac.compare_digest(value, sign_session(thread_id, issued)):
+        return None
+    return thread_id
+
+def write_session_cookie():
+    """Stores the current thread_id in the session cookie (Streamlit can read cookies but not set them)."""
+    value = sign_session(st.session_state.thread_id, int(time.time()))
+    components.html(
+        f"<script>document.cookie = '{SESSION_COOKIE}={value}; path=/; max-age={SESSION_MAX_AGE}; SameSite=Strict'"
+        " + (window.parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height=0,
+    )
+
 def reset_conversation():
-    """Resets the conversation state."""
+    """Resets the conversation state. The greeting is sent to the graph with the patient's first message."""
     st.session_state.thread_id = str(uuid.uuid4())
-    st.session_state.messages = []
+    st.session_state.session_cookie_pending = True
+    greeting = AIMessage(content=GREETING, id=str(uuid.uuid4()))
+    st.session_state.messages = [greeting]
+    st.session_state.pending_greeting = greeting
     st.session_state.agent_state = {}
-    
-    # **FIXED LINE** Provide an empty list for messages on the first run.
-    initial_state = agent_runnable.invoke({"messages": []}, config={"configurable": {"thread_id": st.session_state.thread_id}})
-    
-    st.session_state.messages.extend(initial_state['messages'])
-    st.session_state.agent_state = initial_state
+
+def resume_conversation(thread_id):
+    """Restores a conversation from its checkpoint (e.g. after a server restart); False if none exists.
+    The checkpoint only holds the recent message window; the transcript comes from the message archive."""
+    agent = load_agent()
+    snapshot = agent.get_state({"configurable": {"thread_id": thread_id}})
+    if not snapshot.values.get("messages"):
+        return False
+    st.session_state.thread_id = thread_id
+    st.session_state.session_cookie_pending = True  # renews the cookie's expiry
+    st.session_state.messages = agent.checkpointer.transcript(thread_id) or list(snapshot.values["messages"])
+    st.session_state.agent_state = snapshot.values
+    st.session_state.pending_greeting = None
+    return True
 
 def display_dashboard(state):
     """Displays the live status dashboard from the agent's state."""
@@ -72,7 +187,13 @@ def display_dashboard(state):
 st.title("🩺 AI Medical Appointment Scheduling Agent")
 
 if "thread_id" not in st.session_state:
-    reset_conversation()
+    # Links from before the session cookie carried the thread_id; it no longer opens anything.
+    st.query_params.pop("thread_id", None)
+    thread_id = session_thread_id()
+    if not (thread_id and resume_conversation(thread_id)):
+        reset_conversation()
+if st.session_state.pop("session_cookie_pending", False):
+    write_session_cookie()
 
 chat_col, dashboard_col = st.columns([2, 1])
 
@@ -82,52 +203,91 @@ with dashboard_col:
 with chat_col:
     with st.sidebar:
         st.header("Admin Panel")
+        report_format = st.selectbox("Format", FORMATS)
+        report_doctor = st.text_input("Doctor (optional)")
+        report_dates = st.date_input("Date range (optional)", value=())
+        only_new = st.checkbox("Only appointments since last export")
         if st.button("Generate Admin Report"):
-            with st.spinner("Generating report..."):
-                report_path = generate_admin_report()
-                st.success(f"Report generated: `{report_path}`")
+            filters = {"doctor_name": report_doctor or None, "incremental": only_new}
+            if len(report_dates) == 2:
+                filters["start_date"], filters["end_date"] = report_dates
+            st.session_state.report_job_id = start_export_job(DB_FILE, f"admin_report.{report_format}", report_format, **filters)
+        admin_report_status()
+        st.header("Latency")
+        if instrumentation.ENABLED:
+            latency_breakdown()
+        else:
+            st.caption("Instrumentation is off (INSTRUMENTATION=0).")
         st.header("Controls")
         if st.button("Start New Booking"):
             reset_conversation()
             st.rerun()
+        if timing := st.session_state.get("last_turn_timing"):
+            st.caption(f"Last turn: first output {timing['first_output_ms']:.0f} ms, total {timing['total_ms']:.0f} ms")
 
     for msg in st.session_state.messages:
         role = "user" if isinstance(msg, HumanMessage) else "assistant"
         with st.chat_message(role):
             st.markdown(msg.content)
 
-    def run_agent(messages):
+    def run_agent(messages, **inputs):
+        """Streams the turn: status lines and each node's replies show up as soon as they are produced."""
         config = {"configurable": {"thread_id": st.session_state.thread_id}}
-        with st.spinner("Thinking..."):
-            final_state = agent_runnable.invoke({"messages": messages}, config)
+        if greeting := st.session_state.pending_greeting:
+            messages = [greeting] + messages
+        started, first_output = time.perf_counter(), None
+        final_state, replies = st.session_state.agent_state, []
+        with st.chat_message("assistant"):
+            status = st.status("Thinking...")
+            for mode, chunk in load_agent().stream({"messages": messages, **inputs}, config, stream_mode=["custom", "updates", "values"]):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+                if mode == "custom":
+                    status.update(label=chunk.get("status", "Thinking..."))
+                    first_output = first_output or time.perf_counter() - started
+                    continue
+                for update in chunk.values():
+                    for msg in (update or {}).get("messages", []):
+                        replies.append(msg)
+                        st.markdown(msg.content)
+                        first_output = first_output or time.perf_counter() - started
+            status.update(label="Done", state="complete")
+        total = time.perf_counter() - started
+        st.session_state.last_turn_timing = {"first_output_ms": (first_output or total) * 1000, "total_ms": total * 1000}
         st.session_state.agent_state = final_state
-        st.session_state.messages = final_state["messages"]
+        st.session_state.pending_greeting = None
+        # The graph only keeps a window of recent messages; the transcript gets this turn's replies.
+        st.session_state.messages.extend(replies)
         st.rerun()
 
     slots = st.session_state.agent_state.get("booking_info", {}).get("slots", [])
+    # Checkpoints from before slots were records hold display strings; those can't be booked by id.
+    slots = [slot for slot in slots if isinstance(slot, dict)]
     if slots:
         with st.chat_message("assistant"):
             st.markdown("Please select one of the available slots below:")
             grouped_slots = defaultdict(list)
             for slot in slots:
-                doctor, slot_time = slot.split(" at ")
-                grouped_slots[doctor].append((slot_time, slot))
+                grouped_slots[slot["doctor_name"]].append(slot)
             
-            for doctor, times in grouped_slots.items():
+            for doctor, doctor_slots in grouped_slots.items():
                 st.markdown(f"**{doctor}**")
                 cols = st.columns(3)
-                for i, (slot_time, full_slot) in enumerate(times):
-                    if cols[i % 3].button(slot_time, key=full_slot):
-                        user_message = HumanMessage(content=f"I'll take the slot: {full_slot}")
-                        st.session_state.messages.append(user_message)
-                        run_agent([user_message])
+                for i, slot in enumerate(doctor_slots):
+                    if cols[i % 3].button(slot_label(slot), key=f"slot-{slot['schedule_id']}"):
+                        # The ScheduleID goes straight to the graph; the message is for the transcript.
+                        from agent import slot_selection_input
+                        selection = slot_selection_input(slot)
+                        st.session_state.messages.extend(selection["messages"])
+                        run_agent(selection["messages"], selected_schedule_id=selection["selected_schedule_id"])
 
     if final_confirmation := st.session_state.agent_state.get("final_confirmation"):
         with st.chat_message("assistant"):
             st.success("Booking complete!", icon="✅")
             st.markdown(final_confirmation)
         if email_status := st.session_state.agent_state.get("email_status"):
-            if email_status == "Sent":
+            if email_status in ("Sent", "Queued"):
                 with st.chat_message("assistant"):
                     st.markdown("A confirmation email with your intake form is on its way. We look forward to seeing you!")
             else:
@@ -136,6 +296,8 @@ with chat_col:
         st.session_state.agent_state["final_confirmation"] = None
 
     if prompt := st.chat_input("Your response..."):
-        user_message = HumanMessage(content=prompt)
+        user_message = HumanMessage(content=prompt, id=str(uuid.uuid4()))
         st.session_state.messages.append(user_message)
-        run_agent([user_message])
\ No newline at end of file
+        run_agent([user_message])
+
+preload_agent()
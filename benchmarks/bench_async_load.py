@@ -0,0 +1,165 @@
+# benchmarks/bench_async_load.py
+#
+# How many concurrent conversations one worker process can hold. Runs the same booking
+# conversation (greeting, details via LLM, slot pick, insurance via LLM + booking) N times
+# concurrently against a mock LLM with fixed latency, once with agent_runnable.invoke on a
+# bounded thread pool (the sync path) and once with agent_runnable.ainvoke on one event loop.
+# --mock-server replaces the in-process mock LLM with mock_ollama.py, so calls go through the
+# real ChatOllama client and llm_backend's concurrency cap (LLM_MAX_CONCURRENCY).
+# Usage: python benchmarks/bench_async_load.py --concurrency 10 50 200 --llm-latency 0.5
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("EMAIL_WORKERS", "0")  # queue confirmation emails but never send them
+os.environ.setdefault("EMAIL_FROM", "bench@example.com")
+os.environ.setdefault("EMAIL_HOST", "localhost")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class MockLLM(BaseChatModel):
+    """Answers extraction prompts with fixed JSON after `latency` seconds, blocking or async."""
+
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock-extractor"
+
+    def _answer(self, messages) -> ChatResult:
+        text = messages[-1].content
+        number = re.search(r"conversation (\d+)", text)
+        tag = number.group(1) if number else "0"
+        payload = {"full_name": f"Load Tester {tag}", "date_of_birth": "1985-06-15", "email": f"load{tag}@example.com",
+                   "phone_number": "5550100100", "insurance_carrier": "Aetna", "member_id": f"M{tag}"}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(payload)))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._answer(messages)
+
+
+def seed_schedules(db_file, doctors=20, days=14):
+    from migrations import migrate
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    migrate(conn)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    rows = []
+    for doctor in range(doctors):
+        for day in range(days):
+            for cell in range(18, 34):  # 09:00 - 17:00
+                slot = start + timedelta(days=day, minutes=30 * cell)
+                rows.append((f"Dr. Bench {doctor}", slot.strftime('%Y-%m-%d %H:%M'), (slot + timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M')))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO DoctorSchedules (DoctorName, StartTime, EndTime, Status) VALUES (?, ?, ?, 'Available')", rows)
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def turns(number):
+    from agent import slot_selection_input
+    yield lambda state: {"messages": []}
+    yield lambda state: {"messages": [HumanMessage(content=f"Hi, I'd like to book a visit (conversation {number})", id=str(uuid.uuid4()))]}
+    yield lambda state: slot_selection_input(state['booking_info']['slots'][number % len(state['booking_info']['slots'])])
+    yield lambda state: {"messages": [HumanMessage(content=f"Insurance details are on my card, conversation {number}", id=str(uuid.uuid4()))]}
+
+
+def run_sync(agent_runnable, number, latencies):
+    config = {"configurable": {"thread_id": f"sync-{number}-{uuid.uuid4()}"}}
+    state = {}
+    for turn in turns(number):
+        if state.get("final_confirmation"):
+            break  # insurance came with the details, so the booking was made at slot selection
+        started = time.perf_counter()
+        state = agent_runnable.invoke(turn(state), config)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_async(agent_runnable, number, latencies):
+    config = {"configurable": {"thread_id": f"async-{number}-{uuid.uuid4()}"}}
+    state = {}
+    for turn in turns(number):
+        if state.get("final_confirmation"):
+            break  # insurance came with the details, so the booking was made at slot selection
+        started = time.perf_counter()
+        state = await agent_runnable.ainvoke(turn(state), config)
+        latencies.append(time.perf_counter() - started)
+
+
+def report(mode, concurrency, elapsed, latencies):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"{mode:>6} {concurrency:>6} {len(latencies) / elapsed:>9.1f} {statistics.median(latencies) * 1000:>9.0f} {p95 * 1000:>9.0f} {elapsed:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per mock LLM call")
+    parser.add_argument("--threads", type=int, default=16, help="thread budget of the sync worker")
+    parser.add_argument("--mock-server", action="store_true", help="serve the LLM from mock_ollama.py over HTTP")
+    parser.add_argument("--server-parallel", type=int, default=4, help="requests the mock server runs at once")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_async_")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    seed_schedules(os.path.join("data", "clinic.db"))
+
+    if args.mock_server:
+        import mock_ollama
+        server = mock_ollama.serve(0, latency=args.llm_latency, parallel=args.server_parallel, synthesize=True)
+        os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    import agent
+    if args.mock_server:
+        from llm_backend import get_backend
+        get_backend().warm.wait(10)
+    else:
+        agent.set_llm(MockLLM(latency=args.llm_latency))
+
+    print(f"{'mode':>6} {'convs':>6} {'turns/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'total s':>8}")
+    for concurrency in args.concurrency:
+        agent.extraction_cache.clear()
+        latencies = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            for future in [pool.submit(run_sync, agent.agent_runnable, number, latencies) for number in range(concurrency)]:
+                future.result()
+        report("sync", concurrency, time.perf_counter() - started, latencies)
+
+        agent.extraction_cache.clear()
+        latencies = []
+
+        async def run_all():
+            await asyncio.gather(*(run_async(agent.agent_runnable, number, latencies) for number in range(concurrency)))
+
+        started = time.perf_counter()
+        asyncio.run(run_all())
+        report("async", concurrency, time.perf_counter() - started, latencies)
+    if args.mock_server:
+        print(f"LLM backend: {get_backend().metrics()}")
+    print(f"(data in {workdir})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/bench_booking.py
+#
+# Hammers booking.book_slot from many threads and processes that all compete for a small
+# set of hot slots, then checks the database for double bookings.
+# Usage: python benchmarks/bench_booking.py --workers 16 --slots 50 --attempts 200
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+
+
+def build_database(path, slots, patients):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.executemany("INSERT INTO Patients (PatientID, FullName, DateOfBirth) VALUES (?, ?, '1990-01-01')",
+                     [(patient_id, f"Bench Patient {patient_id}") for patient_id in range(1, patients + 1)])
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    rows = []
+    for i in range(slots):
+        slot_start = start + timedelta(minutes=30 * i)
+        rows.append((f"Dr. Hot{i % 3}", slot_start.strftime('%Y-%m-%d %H:%M'), (slot_start + timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M')))
+    conn.executemany("INSERT INTO DoctorSchedules (DoctorName, StartTime, EndTime) VALUES (?, ?, ?)", rows)
+    conn.close()
+    return [(doctor, start_time) for doctor, start_time, _ in rows]
+
+
+def run_worker(db_file, slots, attempts, seed):
+    # Imported here so every process builds its own connection pool.
+    from booking import book_slot, BOOKING_SUCCESSFUL, SLOT_TAKEN
+    rng = random.Random(seed)
+    counts = {"success": 0, "taken": 0, "error": 0}
+    started = time.perf_counter()
+    for attempt in range(attempts):
+        doctor, start_time = rng.choice(slots)
+        result = book_slot(db_file, seed + 1, doctor, start_time, 30, "Bench", "B-1")
+        if result["status"] == BOOKING_SUCCESSFUL:
+            counts["success"] += 1
+        elif result["status"] == SLOT_TAKEN:
+            counts["taken"] += 1
+        else:
+            counts["error"] += 1
+    counts["elapsed"] = time.perf_counter() - started
+    return counts
+
+
+def _thread_worker(results, *args):
+    results.append(run_worker(*args))
+
+
+def verify(db_file):
+    conn = sqlite3.connect(db_file)
+    double_booked = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT DoctorName, AppointmentTime FROM Appointments GROUP BY DoctorName, AppointmentTime HAVING COUNT(*) > 1)"
+    ).fetchone()[0]
+    appointments = conn.execute("SELECT COUNT(*) FROM Appointments").fetchone()[0]
+    booked_rows = conn.execute("SELECT COUNT(*) FROM DoctorSchedules WHERE Status = 'Booked'").fetchone()[0]
+    conn.close()
+    return double_booked, appointments, booked_rows
+
+
+def run(mode, workers, slot_count, attempts):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        slots = build_database(db_file, slot_count, workers)
+        started = time.perf_counter()
+        if mode == "threads":
+            results = []
+            threads = [threading.Thread(target=_thread_worker, args=(results, db_file, slots, attempts, seed)) for seed in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            with multiprocessing.get_context("spawn").Pool(workers) as pool:
+                results = pool.starmap(run_worker, [(db_file, slots, attempts, seed) for seed in range(workers)])
+        # Measured inside the workers so process start-up is not counted as booking time.
+        elapsed = max(result["elapsed"] for result in results) if results else time.perf_counter() - started
+        totals = {key: sum(result[key] for result in results) for key in ("success", "taken", "error")}
+        double_booked, appointments, booked_rows = verify(db_file)
+        total_attempts = workers * attempts
+        print(f"[{mode}] {workers} workers x {attempts} attempts on {slot_count} slots in {elapsed:.2f}s "
+              f"({total_attempts / elapsed:,.0f} attempts/s): {totals}")
+        print(f"[{mode}] appointments={appointments} booked_rows={booked_rows} double_bookings={double_booked}")
+        ok = len(results) == workers and double_booked == 0 and appointments == totals["success"] == booked_rows
+        print(f"[{mode}] {'OK' if ok else 'FAILED'}: every slot was booked at most once")
+        return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--slots", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=200)
+    args = parser.parse_args()
+    ok = all([
+        run("threads", args.workers, args.slots, args.attempts),
+        run("processes", args.workers, args.slots, args.attempts),
+    ])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
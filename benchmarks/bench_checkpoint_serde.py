@@ -0,0 +1,78 @@
+# benchmarks/bench_checkpoint_serde.py
+#
+# Compares LangGraph's default JsonPlusSerializer with checkpoint_serde.DeltaSerializer on
+# synthetic booking conversations: bytes written per checkpoint (for the delta serializer,
+# the header plus any new blobs) and serialize/deserialize time per checkpoint.
+# Usage: python benchmarks/bench_checkpoint_serde.py --turns 10 25 50 100
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from checkpoint_serde import DeltaSerializer, MemoryBlobStore
+
+
+def conversation_checkpoints(turns):
+    """One checkpoint per turn, shaped like the agent's GraphState after that turn."""
+    messages = []
+    slots = [f"Dr. {name} at 2026-10-{day:02d} {hour:02d}:00 AM" for name in ("Smith", "Jones", "Lee") for day, hour in ((20, 9), (21, 10), (22, 11))]
+    for turn in range(turns):
+        messages = messages + [
+            HumanMessage(content=f"Turn {turn}: my name is Jane Doe, born 1990-04-12, email jane@example.com"),
+            AIMessage(content=f"Thanks! Here are the available slots for turn {turn}. Please pick one of the options below."),
+        ]
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {
+            "messages": messages,
+            "patient_info": {"full_name": "Jane Doe", "date_of_birth": "1990-04-12", "email": "jane@example.com", "patient_id": 42},
+            "booking_info": {"duration": 60, "slots": slots},
+            "patient_status": "returning",
+        }
+        checkpoint["channel_versions"] = {name: turn + 1 for name in checkpoint["channel_values"]}
+        yield checkpoint
+
+
+def measure(serializer, checkpoints, store=None):
+    written, dump_time, payloads = 0, 0.0, []
+    for checkpoint in checkpoints:
+        before = sum(len(data) for _, data in store.blobs.values()) if store else 0
+        started = time.perf_counter()
+        payload = serializer.dumps_typed(checkpoint)
+        dump_time += time.perf_counter() - started
+        after = sum(len(data) for _, data in store.blobs.values()) if store else 0
+        written += len(payload[1]) + after - before
+        payloads.append(payload)
+    started = time.perf_counter()
+    for payload in payloads:
+        serializer.loads_typed(payload)
+    load_time = time.perf_counter() - started
+    count = len(payloads)
+    return written / count, dump_time / count * 1000, load_time / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 25, 50, 100])
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'serializer':>12} {'bytes/ckpt':>11} {'dump ms':>8} {'load ms':>8}")
+    for turns in args.turns:
+        checkpoints = list(conversation_checkpoints(turns))
+        variants = [("default", JsonPlusSerializer(), None)]
+        for name, compress in (("delta", False), ("delta+zstd", True)):
+            store = MemoryBlobStore()
+            variants.append((name, DeltaSerializer(store, compress=compress), store))
+        for name, serializer, store in variants:
+            size, dump_ms, load_ms = measure(serializer, checkpoints, store)
+            print(f"{turns:>6} {name:>12} {size:>11.0f} {dump_ms:>8.3f} {load_ms:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
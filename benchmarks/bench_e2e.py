@@ -0,0 +1,383 @@
+# benchmarks/bench_e2e.py
+#
+# End-to-end conversation benchmark. Scripted patients book appointments through
+# agent.agent_runnable from start to confirmation. New patients use generated identities;
+# returning patients are drawn from the database. A deterministic fake chat model answers
+# extraction prompts with the patient's own values, as far as they appear in the text. The
+# clinic database is generated by setup_database.generate at the requested size.
+#
+# Reports p50/p95/p99 latency per turn, per graph node and per tool, LLM calls per booking,
+# clinic DB statements per turn, peak RSS and bookings per second. Results are written as
+# JSON with --output; --compare prints the change against an earlier result file.
+# Usage: python benchmarks/bench_e2e.py --patients 5000 --doctors 20 --bookings 200 --concurrency 8 --output e2e.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("EMAIL_WORKERS", "0")  # queue confirmation emails but never send them
+os.environ.setdefault("EMAIL_FROM", "bench@example.com")
+os.environ.setdefault("EMAIL_HOST", "localhost")
+
+from faker import Faker
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import instrumentation
+import slot_holds
+
+# Carriers the regex rules know and ones only the LLM can pick up.
+CARRIERS = ["Aetna", "Cigna", "Humana", "Blue Shield of California", "Harvard Pilgrim", "Self-Pay"]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))] * 1000
+
+    return {"count": len(ordered), "p50_ms": rank(0.50), "p95_ms": rank(0.95), "p99_ms": rank(0.99)}
+
+
+# --- Fake LLM and timing ---
+class FakeChatModel(BaseChatModel):
+    """Answers with every registered patient value that appears verbatim in the text; counts calls and prompt size."""
+
+    latency: float = 0.0
+    values: dict = {}  # lowercased value -> (field, value)
+    calls: int = 0
+    prompt_chars: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-extractor"
+
+    def register(self, persona: dict) -> None:
+        for field in ("full_name", "date_of_birth", "email", "phone_number", "insurance_carrier", "member_id"):
+            self.values[persona[field].lower()] = (field, persona[field])
+
+    def _answer(self, messages) -> ChatResult:
+        text = str(messages[-1].content).lower()
+        answer = {field: value for key, (field, value) in list(self.values.items()) if key in text}
+        self.calls += 1
+        self.prompt_chars += sum(len(str(message.content)) for message in messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(answer)))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(messages)
+
+
+class TimingHandler(BaseCallbackHandler):
+    """Records wall time of every graph node run and tool call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self.nodes = {}
+        self.tools = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # The node itself is the run tagged with its graph step; nested runnables inherit the metadata only.
+        if node and kwargs.get("name") == node and any(tag.startswith("graph:step:") for tag in tags or ()):
+            with self._lock:
+                self._started[run_id] = (self.nodes, node, time.perf_counter())
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            self._started[run_id] = (self.tools, name, time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            entry = self._started.pop(run_id, None)
+            if entry:
+                bucket, name, started = entry
+                bucket.setdefault(name, []).append(time.perf_counter() - started)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+class QueryCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, statement):
+        with self._lock:
+            self.count += 1
+
+
+# --- Database and patients ---
+def build_database(path, patients, doctors, days, history_days, seed):
+    import setup_database
+    setup_database.generate(path, patients, doctors, days, history_days, seed=seed, reset=True)
+
+
+def new_persona(fake, number):
+    born = date(1940, 1, 1) + timedelta(days=fake.random_int(0, 65 * 365))
+    first, last = fake.first_name(), fake.last_name()
+    return {
+        "full_name": f"{first} {last}", "date_of_birth": born.isoformat(),
+        "email": f"{first}.{last}.{number}@example.com".lower(), "phone_number": f"555-{number // 10000 % 1000:03d}-{number % 10000:04d}",
+        "insurance_carrier": CARRIERS[number % len(CARRIERS)], "member_id": f"MBR{number:07d}",
+    }
+
+
+def returning_personas(db_file, count, rng):
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT PatientID, FullName, DateOfBirth, Email, PhoneNumber FROM Patients").fetchall()
+    conn.close()
+    personas = []
+    for patient_id, full_name, dob, email, phone in rng.sample(rows, min(count, len(rows))):
+        personas.append({"full_name": full_name, "date_of_birth": dob, "email": email or "", "phone_number": phone or "",
+                         "insurance_carrier": CARRIERS[patient_id % len(CARRIERS)], "member_id": f"RET{patient_id:07d}"})
+    return personas
+
+
+def reply_for(state, persona):
+    """The patient's answer to the agent's last message, as graph input."""
+    text = state["messages"][-1].content.lower() if state.get("messages") else ""
+    booking_info = state.get("booking_info", {})
+    if "insurance carrier" in text:
+        if persona["insurance_carrier"] == "Self-Pay":
+            reply = "I'm a self-payer"
+        else:
+            reply = f"I'm covered by {persona['insurance_carrier']}, my member number is {persona['member_id']}"
+    elif ("email" in text or "phone number" in text) and "full name" not in text:
+        reply = f"Sure, it's {persona['email']} and {persona['phone_number']}"
+    elif booking_info.get("slots") and not booking_info.get("appointment_time"):
+        from agent import slot_selection_input
+        return slot_selection_input(random.choice(booking_info["slots"]))
+    else:
+        reply = f"Hi, my name is {persona['full_name']}, born {persona['date_of_birth']}"
+    return {"messages": [HumanMessage(content=reply, id=str(uuid.uuid4()))]}
+
+
+# --- Conversations ---
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = []
+        self.bookings = {"new": 0, "returning": 0, "failed": 0}
+        self.slot_conflicts = 0  # the chosen slot was gone at selection or booking time
+
+    def add_turn(self, seconds, state):
+        with self._lock:
+            self.turns.append(seconds)
+            if state.get("messages") and "slot was just taken" in state["messages"][-1].content:
+                self.slot_conflicts += 1
+
+    def add_booking(self, kind):
+        with self._lock:
+            self.bookings[kind] += 1
+
+
+def _outcome(state, max_turns_left):
+    if state.get("final_confirmation"):
+        return "new" if state.get("is_new_patient") else "returning"
+    return None if max_turns_left else "failed"
+
+
+def run_conversation(agent_runnable, persona, callbacks, results, max_turns=10):
+    config = {"configurable": {"thread_id": f"e2e-{uuid.uuid4()}"}, "callbacks": callbacks}
+    state, reply = {}, {"messages": []}
+    for turn in range(max_turns):
+        started = time.perf_counter()
+        state = agent_runnable.invoke(reply, config)
+        results.add_turn(time.perf_counter() - started, state)
+        outcome = _outcome(state, max_turns - turn - 1)
+        if outcome:
+            return results.add_booking(outcome)
+        reply = reply_for(state, persona)
+
+
+async def arun_conversation(agent_runnable, persona, callbacks, results, max_turns=10):
+    config = {"configurable": {"thread_id": f"e2e-{uuid.uuid4()}"}, "callbacks": callbacks}
+    state, reply = {}, {"messages": []}
+    for turn in range(max_turns):
+        started = time.perf_counter()
+        state = await agent_runnable.ainvoke(reply, config)
+        results.add_turn(time.perf_counter() - started, state)
+        outcome = _outcome(state, max_turns - turn - 1)
+        if outcome:
+            return results.add_booking(outcome)
+        reply = reply_for(state, persona)
+
+
+# --- Report ---
+def summarize(args, elapsed, results, timing, llm, queries, prefetch):
+    completed = results.bookings["new"] + results.bookings["returning"]
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "bookings": results.bookings,
+        "elapsed_s": elapsed,
+        "bookings_per_second": completed / elapsed if elapsed else 0.0,
+        "turns": len(results.turns),
+        "turn_latency": percentiles(results.turns),
+        "nodes": {name: percentiles(values) for name, values in sorted(timing.nodes.items())},
+        "tools": {name: percentiles(values) for name, values in sorted(timing.tools.items())},
+        "llm_calls_per_booking": llm.calls / completed if completed else None,
+        "llm_prompt_chars_per_booking": llm.prompt_chars / completed if completed else None,
+        "db_queries_per_turn": queries.count / len(results.turns) if results.turns else None,
+        "slot_conflicts": results.slot_conflicts,
+        "slot_holds": slot_holds.hold_stats(),
+        "slot_prefetch": prefetch,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "instrumentation": instrumentation.snapshot(),
+    }
+
+
+def print_report(summary):
+    print(f"bookings: {summary['bookings']}  {summary['bookings_per_second']:.1f}/s over {summary['elapsed_s']:.2f}s")
+    print(f"LLM calls/booking: {summary['llm_calls_per_booking']:.2f}  DB queries/turn: {summary['db_queries_per_turn']:.1f}  "
+          f"peak RSS: {summary['peak_rss_mb']:.0f} MB")
+    holds = summary["slot_holds"]
+    rate = f"{holds['conversion_rate']:.0%}" if holds["conversion_rate"] is not None else "n/a"
+    print(f"slot conflicts: {summary['slot_conflicts']}  holds placed: {holds['placed']}  converted: {holds['converted']}  "
+          f"expired: {holds['expired']}  conversion rate: {rate}")
+    prefetch = summary["slot_prefetch"]
+    print(f"slot prefetch: {prefetch['hits']} hits, {prefetch['stale']} stale, {prefetch['misses']} misses  hit rate: {prefetch['hit_rate']:.0%}")
+    print(f"{'':>34} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = [("turn", summary["turn_latency"])]
+    rows += [(f"node {name}", stats) for name, stats in summary["nodes"].items()]
+    rows += [(f"tool {name}", stats) for name, stats in summary["tools"].items()]
+    for name, stats in rows:
+        print(f"{name:>34} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+
+def print_comparison(summary, baseline):
+    """Relative change of the headline metrics against an earlier result file."""
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    metrics = [
+        ("bookings/s", summary["bookings_per_second"], baseline["bookings_per_second"]),
+        ("turn p50 ms", summary["turn_latency"]["p50_ms"], baseline["turn_latency"]["p50_ms"]),
+        ("turn p95 ms", summary["turn_latency"]["p95_ms"], baseline["turn_latency"]["p95_ms"]),
+        ("turn p99 ms", summary["turn_latency"]["p99_ms"], baseline["turn_latency"]["p99_ms"]),
+        ("LLM calls/booking", summary["llm_calls_per_booking"], baseline["llm_calls_per_booking"]),
+        ("DB queries/turn", summary["db_queries_per_turn"], baseline["db_queries_per_turn"]),
+        ("peak RSS MB", summary["peak_rss_mb"], baseline["peak_rss_mb"]),
+        ("slot conflicts", summary["slot_conflicts"], baseline.get("slot_conflicts")),
+        ("prefetch hit rate", summary["slot_prefetch"]["hit_rate"], baseline.get("slot_prefetch", {}).get("hit_rate")),
+    ]
+    print(f"{'vs baseline':>20} {'now':>10} {'before':>10} {'change':>8}")
+    for name, new, old in metrics:
+        if old is None:  # not recorded by older versions of this benchmark
+            continue
+        print(f"{name:>20} {new:>10.2f} {old:>10.2f} {change(new, old):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patients", type=int, default=2000, help="patients generated by setup_database.py")
+    parser.add_argument("--doctors", type=int, default=10)
+    parser.add_argument("--days", type=int, default=30, help="days of schedule to generate")
+    parser.add_argument("--history-days", type=int, default=30, help="past days of schedules and appointments")
+    parser.add_argument("--bookings", type=int, default=100, help="conversations to run")
+    parser.add_argument("--returning", type=float, default=0.5, help="share of conversations by existing patients")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = json.load(open(args.compare)) if args.compare else None
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    Faker.seed(args.seed)
+    fake = Faker()
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    db_file = os.path.join("data", "clinic.db")
+    started = time.perf_counter()
+    build_database(db_file, args.patients, args.doctors, args.days, args.history_days, args.seed)
+    print(f"Generated database in {time.perf_counter() - started:.1f}s ({workdir})")
+
+    returning = int(args.bookings * args.returning)
+    personas = returning_personas(db_file, returning, rng)
+    personas += [new_persona(fake, number) for number in range(args.bookings - len(personas))]
+    rng.shuffle(personas)
+
+    import db
+    queries = QueryCounter()
+    db.set_trace_callback(queries)
+    import agent
+    llm = FakeChatModel(latency=args.llm_latency, values={})
+    for persona in personas:
+        llm.register(persona)
+    agent.set_llm(llm)
+    timing = TimingHandler()
+    results = Results()
+
+    started = time.perf_counter()
+    if args.mode == "sync":
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(run_conversation, agent.agent_runnable, persona, [timing], results) for persona in personas]:
+                future.result()
+    else:
+        async def run_all():
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def one(persona):
+                async with gate:
+                    await arun_conversation(agent.agent_runnable, persona, [timing], results)
+
+            await asyncio.gather(*(one(persona) for persona in personas))
+
+        asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(args, elapsed, results, timing, llm, queries, agent.slot_prefetcher.stats())
+    print_report(summary)
+    if baseline:
+        print_comparison(summary, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
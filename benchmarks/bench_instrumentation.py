@@ -0,0 +1,75 @@
+# benchmarks/bench_instrumentation.py
+#
+# Per-span overhead of instrumentation.timed. Calls a trivial function directly and through
+# the sync and async wrappers, single-threaded and from several threads at once (to include
+# lock contention on one span), and reports the added nanoseconds per call.
+# Usage: python benchmarks/bench_instrumentation.py --calls 1000000 --threads 4
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import instrumentation
+
+
+def noop(value):
+    return value
+
+
+async def anoop(value):
+    return value
+
+
+def per_call_ns(func, calls):
+    started = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def per_call_ns_async(func, calls):
+    async def run():
+        started = time.perf_counter()
+        for i in range(calls):
+            await func(i)
+        return (time.perf_counter() - started) / calls * 1e9
+    return asyncio.run(run())
+
+
+def per_call_ns_threaded(func, calls, threads):
+    share = calls // threads
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return max(pool.map(lambda _: per_call_ns(func, share), range(threads)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    if not instrumentation.ENABLED:
+        sys.exit("INSTRUMENTATION=0; nothing to measure")
+
+    wrapped = instrumentation.timed("bench", "noop", noop)
+    awrapped = instrumentation.timed("bench", "anoop", anoop)
+    rows = [
+        ("sync", per_call_ns(noop, args.calls), per_call_ns(wrapped, args.calls)),
+        ("async", per_call_ns_async(anoop, args.calls), per_call_ns_async(awrapped, args.calls)),
+        (f"sync x{args.threads} threads", per_call_ns_threaded(noop, args.calls, args.threads),
+         per_call_ns_threaded(wrapped, args.calls, args.threads)),
+    ]
+    print(f"{'mode':>18} {'bare ns':>9} {'timed ns':>9} {'overhead ns':>12}")
+    for mode, bare, timed in rows:
+        print(f"{mode:>18} {bare:>9.0f} {timed:>9.0f} {timed - bare:>12.0f}")
+    span = instrumentation.snapshot()["spans"]
+    print(f"(recorded {sum(s['count'] for s in span)} spans)")
+
+
+if __name__ == '__main__':
+    main()
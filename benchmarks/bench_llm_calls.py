@@ -0,0 +1,145 @@
+# benchmarks/bench_llm_calls.py
+#
+# LLM calls and prompt tokens per completed booking. Drives scripted new-patient
+# conversations through the graph until the booking is confirmed. The LLM is a recording
+# mock that answers with the values actually mentioned in the text, and counts each call's
+# prompt (all messages) and the JSON schema sent as Ollama's `format`. Tokens are measured
+# with tiktoken; if its encoding can't be loaded (offline), they are estimated as chars / 4.
+# Usage: python benchmarks/bench_llm_calls.py --encoding cl100k_base
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("EMAIL_WORKERS", "0")
+os.environ.setdefault("EMAIL_FROM", "bench@example.com")
+os.environ.setdefault("EMAIL_HOST", "localhost")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from bench_async_load import seed_schedules
+
+# Each scenario is one patient: the values the LLM may return, the phrase that has to be in
+# the text for it to "see" each value, and the replies to each of the agent's questions.
+SCENARIOS = {
+    "step-by-step": {
+        "values": {"full_name": "Maria Lopez", "date_of_birth": "1990-04-12", "insurance_carrier": "Blue Shield of California", "member_id": "XQZ448812"},
+        "mentions": {"full_name": "maria lopez", "date_of_birth": "12th of april", "insurance_carrier": "blue shield", "member_id": "xqz448812"},
+        "replies": {
+            "details": "hi, this is maria lopez, born on the 12th of april in 1990",
+            "contact": "sure: maria.lopez@example.com, 555-867-5309",
+            "insurance": "blue shield of california, member XQZ448812",
+        },
+    },
+    "all-at-once": {
+        "values": {"full_name": "Tom Becker", "date_of_birth": "1978-11-02", "insurance_carrier": "Blue Shield of California", "member_id": "BSC902211"},
+        "mentions": {"full_name": "tom becker", "date_of_birth": "2nd of november", "insurance_carrier": "blue shield", "member_id": "bsc902211"},
+        "replies": {
+            "details": "hello, tom becker here, born the 2nd of november 1978. tom.becker@example.com, 555-201-7788. "
+                       "I'm with blue shield of california, member BSC902211",
+            "contact": "tom.becker@example.com, 555-201-7788",
+            "insurance": "blue shield of california, member BSC902211",
+        },
+    },
+    "regex-friendly": {
+        "values": {},
+        "mentions": {},
+        "replies": {
+            "details": "My name is Ana Costa, 1985-06-15, ana.costa@example.com, 555-330-1212",
+            "contact": "ana.costa@example.com, 555-330-1212",
+            "insurance": "Aetna, member id AET123456",
+        },
+    },
+}
+
+
+class RecordingLLM(BaseChatModel):
+    """Returns the scenario values mentioned in the text and records every call's prompt and format."""
+
+    values: dict = {}
+    mentions: dict = {}
+    calls: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording-extractor"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        schema = kwargs.get("format")
+        self.calls.append({"prompt": "\n".join(str(message.content) for message in messages),
+                           "format": json.dumps(schema) if isinstance(schema, dict) else ""})
+        text = str(messages[-1].content).lower()
+        answer = {field: value for field, value in self.values.items() if self.mentions[field] in text}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(answer)))])
+
+
+def token_counter(encoding_name):
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+        return (lambda text: len(encoding.encode(text))), f"tiktoken {encoding_name}"
+    except Exception as e:
+        print(f"(tiktoken encoding unavailable: {type(e).__name__}; estimating tokens as chars / 4)")
+        return (lambda text: (len(text) + 3) // 4), "chars / 4"
+
+
+def reply_for(agent_message, state, replies):
+    """The scripted patient's answer, as graph input."""
+    text = agent_message.lower()
+    if "insurance carrier" in text:
+        reply = replies["insurance"]
+    elif "email" in text and "phone" in text and "full name" not in text:
+        reply = replies["contact"]
+    elif state.get("booking_info", {}).get("slots") and not state["booking_info"].get("appointment_time"):
+        from agent import slot_selection_input
+        return slot_selection_input(state["booking_info"]["slots"][0])
+    else:
+        reply = replies["details"]
+    return {"messages": [HumanMessage(content=reply, id=str(uuid.uuid4()))]}
+
+
+def run_conversation(agent_runnable, replies, max_turns=8):
+    """Plays the patient until the booking is confirmed; returns the number of patient messages."""
+    config = {"configurable": {"thread_id": f"calls-{uuid.uuid4()}"}}
+    state = agent_runnable.invoke({"messages": []}, config)
+    for turn in range(1, max_turns + 1):
+        state = agent_runnable.invoke(reply_for(state["messages"][-1].content, state, replies), config)
+        if state.get("final_confirmation"):
+            return turn
+    raise RuntimeError(f"booking not confirmed after {max_turns} turns; last reply: {state['messages'][-1].content}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--encoding", default="cl100k_base", help="tiktoken encoding used to count tokens")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_llm_calls_")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    seed_schedules(os.path.join("data", "clinic.db"), doctors=3, days=3)
+    import agent
+    count_tokens, method = token_counter(args.encoding)
+
+    print(f"{'scenario':>15} {'turns':>6} {'LLM calls':>10} {'prompt tok':>11} {'format tok':>11}")
+    for name in args.scenarios:
+        scenario = SCENARIOS[name]
+        llm = RecordingLLM(values=scenario["values"], mentions=scenario["mentions"], calls=[])
+        agent.set_llm(llm)
+        turns = run_conversation(agent.agent_runnable, scenario["replies"])
+        prompt_tokens = sum(count_tokens(call["prompt"]) for call in llm.calls)
+        format_tokens = sum(count_tokens(call["format"]) for call in llm.calls)
+        print(f"{name:>15} {turns:>6} {len(llm.calls):>10} {prompt_tokens:>11} {format_tokens:>11}")
+    print(f"(tokens counted with {method}; data in {workdir})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_reminders.py
+#
+# Measures reminder_manager.process_due_reminders on synthetic appointment tables of
+# increasing size: wall time, throughput and peak Python memory of the scan.
+# Usage: python benchmarks/bench_reminders.py --sizes 50000 200000 500000
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+from reminder_manager import process_due_reminders
+
+STATUSES = ["Confirmed", "Reminder 1 Sent", "Reminder 2 Sent", "Reminder 3 Sent"]
+
+
+def build_database(path, appointments, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA synchronous = OFF")
+    migrate(conn)
+    patients = max(1, appointments // 5)
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO Patients (FullName, DateOfBirth, Email, PhoneNumber) VALUES (?, '1980-01-01', ?, '555-0100')",
+                     ((f"Patient {i}", f"p{i}@example.com") for i in range(patients)))
+    now = datetime.now()
+
+    def rows():
+        for _ in range(appointments):
+            # Spread appointments from 30 days ago to 30 days ahead in every reminder status.
+            when = now + timedelta(minutes=rng.randint(-30 * 24 * 60, 30 * 24 * 60))
+            yield (rng.randint(1, patients), "Dr. Bench", when.strftime('%Y-%m-%d %H:%M'), 30, rng.choice(STATUSES), rng.randint(0, 1))
+
+    conn.executemany("INSERT INTO Appointments (PatientID, DoctorName, AppointmentTime, Duration, Status, FormsFilled) VALUES (?, ?, ?, ?, ?, ?)", rows())
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000, 500000])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    silent = lambda channel, recipient, subject, body: None
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "bench.db")
+            build_database(db_file, size, args.seed)
+            tracemalloc.start()
+            started = time.perf_counter()
+            counts = process_due_reminders(db_file, notify=silent, chunk_size=args.chunk_size, verbose=False)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            sent = sum(counts.values())
+            print(f"{size:>9,} appointments: {sent:>8,} reminders in {elapsed:6.2f}s "
+                  f"({size / elapsed:>10,.0f} appointments/s), peak scan memory {peak / 1024:,.0f} KiB, by stage {counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/bench_slot_index.py
+#
+# Latency of slot_index.find_slots (the find_slots_tool query) on a synthetic schedule, with
+# a share of the free rows under slot holds, plus the query plans it runs with after ANALYZE.
+# The first case is the query it replaced, for comparison.
+# Usage: python benchmarks/bench_slot_index.py --doctors 10000 --days 90 --history-days 30
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+from slot_holds import TIME_FORMAT as HOLD_TIME_FORMAT
+from slot_index import _slot_query, find_slots
+
+# find_slots_tool before slot_index: 30-minute cells only, and datetime() on the column rules out the index.
+BASELINE_QUERY = ("SELECT DoctorName, StartTime FROM DoctorSchedules WHERE Status = 'Available' "
+                  "AND datetime(StartTime) > datetime('now') ORDER BY StartTime LIMIT ?")
+
+
+def build_database(path, doctors, days, history_days, booked_fraction, held_fraction, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    migrate(conn)
+    # Past days too, like setup_database.py: a query that can't seek past them has to read them.
+    start_date = datetime.now().date() + timedelta(days=1 - history_days)
+    rows = 0
+    conn.execute("BEGIN")
+    for day in range(history_days + days):
+        current_date = start_date + timedelta(days=day)
+        batch = []
+        for doctor in range(doctors):
+            name = f"Dr. Bench{doctor:05d}"
+            for hour in list(range(9, 12)) + list(range(13, 17)):
+                for minute in (0, 30):
+                    end_hour, end_minute = (hour, 30) if minute == 0 else (hour + 1, 0)
+                    status = "Booked" if rng.random() < booked_fraction else "Available"
+                    batch.append((name, f"{current_date} {hour:02d}:{minute:02d}", f"{current_date} {end_hour:02d}:{end_minute:02d}", status))
+        conn.executemany("INSERT INTO DoctorSchedules (DoctorName, StartTime, EndTime, Status) VALUES (?, ?, ?, ?)", batch)
+        rows += len(batch)
+    expires_at = (datetime.now() + timedelta(hours=1)).strftime(HOLD_TIME_FORMAT)
+    conn.execute("INSERT INTO SlotHolds (ScheduleID, HoldToken, ExpiresAt) SELECT ScheduleID, 'bench-' || ScheduleID, ? "
+                 "FROM DoctorSchedules WHERE Status = 'Available' AND (ScheduleID * 2654435761) % 1000 < ?", (expires_at, int(held_fraction * 1000)))
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    return conn, rows
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"p50_ms": statistics.median(samples), "p95_ms": samples[int(len(samples) * 0.95) - 1], "max_ms": samples[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--doctors", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--history-days", type=int, default=30, help="past days of schedule")
+    parser.add_argument("--booked-fraction", type=float, default=0.6)
+    parser.add_argument("--held-fraction", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        conn, rows = build_database(os.path.join(tmp, "bench.db"), args.doctors, args.days, args.history_days,
+                                    args.booked_fraction, args.held_fraction, args.seed)
+        print(f"Built {rows:,} schedule rows in {time.perf_counter() - started:.1f}s")
+
+        doctor = f"Dr. Bench{args.doctors // 2:05d}"
+        last_day = (datetime.now() + timedelta(days=args.days)).date()
+        cases = {
+            "baseline datetime(), 10": ((BASELINE_QUERY, [10]), lambda: conn.execute(BASELINE_QUERY, (10,)).fetchall()),
+            "next 10 x 30 min": ((1, False, False), lambda: find_slots(conn, 30, 10)),
+            "next 5 x 60 min": ((2, False, False), lambda: find_slots(conn, 60, 5)),
+            "one doctor, next 10": ((1, True, False), lambda: find_slots(conn, 30, 10, doctor_name=doctor)),
+            "last day, next 5 x 60": ((2, False, True), lambda: find_slots(conn, 60, 5, start_date=last_day, end_date=last_day)),
+        }
+        for name, (query, find) in cases.items():
+            stats = timed(find, args.repeat)
+            print(f"{name:>22}: p50 {stats['p50_ms']:.3f} ms / p95 {stats['p95_ms']:.3f} ms / max {stats['max_ms']:.3f} ms")
+            sql, params = query if isinstance(query[0], str) else (_slot_query(*query), [0] * _slot_query(*query).count("?"))
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            print(f"{'':>24}{' | '.join(plan)}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
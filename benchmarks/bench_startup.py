@@ -0,0 +1,101 @@
+# benchmarks/bench_startup.py
+#
+# Cold start of app.py. Each run is a fresh interpreter (under -X importtime) that renders the
+# app once with Streamlit's AppTest and records the time to the first render (greeting shown)
+# and until the compiled graph is ready. "lazy" is app.py as it is; "eager" first imports
+# agent.py and invokes the graph for the greeting, which is what the first render used to
+# wait for. Also lists the slowest imports that happen before the first render.
+# Usage: python benchmarks/bench_startup.py --runs 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+RENDER_MARKER = "--- first render ---"
+
+
+def child(mode):
+    """Runs in the measured interpreter; prints one JSON line with its timings."""
+    started = time.perf_counter()
+    os.environ.setdefault("EMAIL_WORKERS", "0")
+    sys.path.insert(0, REPO_ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    if mode == "eager":
+        import agent
+        agent.agent_runnable.invoke({"messages": []}, {"configurable": {"thread_id": "startup-eager"}})
+    app = AppTest.from_file(os.path.join(REPO_ROOT, "app.py"), default_timeout=120).run()
+    rendered = time.perf_counter() - started
+    sys.stderr.write(f"{RENDER_MARKER}\n")
+    sys.stderr.flush()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    greeting = app.chat_message[0].markdown[0].value if app.chat_message else ""
+
+    import agent  # waits for app.py's background import, if it is still running
+    ready = time.perf_counter() - started
+    print(json.dumps({"first_render_s": rendered, "graph_ready_s": ready, "greeting": greeting.startswith("Hello!")}))
+
+
+def slow_imports(stderr, top):
+    """Top-level imports finished before the first render, slowest (cumulative) first."""
+    imports = []
+    for line in stderr.split(RENDER_MARKER)[0].splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # nested imports are indented under their parent
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return sum(ms for ms, _ in imports), sorted(imports, reverse=True)[:top]
+
+
+def measure(mode, workdir):
+    result = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child", mode],
+                            cwd=workdir, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"{mode} run failed:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["imports_ms"], timings["slowest"] = slow_imports(result.stderr, top=6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["eager", "lazy"], choices=["eager", "lazy"])
+    parser.add_argument("--child", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    from bench_async_load import seed_schedules
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    os.makedirs(os.path.join(workdir, "data"))
+    seed_schedules(os.path.join(workdir, "data", "clinic.db"), doctors=5, days=5)
+
+    print(f"{'mode':>6} {'first render s':>15} {'graph ready s':>14} {'imports ms':>11}")
+    slowest = {}
+    for mode in args.modes:
+        runs = [measure(mode, workdir) for _ in range(args.runs)]
+        if not all(run["greeting"] for run in runs):
+            raise RuntimeError(f"{mode}: greeting was not rendered")
+        median = lambda key: statistics.median(run[key] for run in runs)
+        print(f"{mode:>6} {median('first_render_s'):>15.3f} {median('graph_ready_s'):>14.3f} {median('imports_ms'):>11.0f}")
+        slowest[mode] = runs[-1]["slowest"]
+    for mode, imports in slowest.items():
+        print(f"\nslowest imports before first render ({mode}):")
+        for ms, name in imports:
+            print(f"  {ms:>8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# booking.py
+
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from db import transaction
+from slot_index import SLOT_MINUTES, TIME_FORMAT
+from slot_holds import NOT_HELD_BY_OTHERS, convert_hold, now, stats as hold_stats
+
+# Booking is a single check-and-set transaction: the schedule rows are flipped from
+# 'Available' to 'Booked' only if every one of them is still available, and the
+# appointment is inserted in the same BEGIN IMMEDIATE transaction. A concurrent
+# session that lost the race sees fewer rows updated and gets SLOT_TAKEN. Callers that
+# hold the slot's ScheduleIDs (from find_slots_tool) update those rows by primary key;
+# otherwise the rows are found by doctor and time range. Rows under another session's
+# unexpired slot hold count as taken; the booking session's own hold is converted.
+
+BOOKING_SUCCESSFUL = "Booking Successful"
+SLOT_TAKEN = "Slot Taken"
+
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.05  # seconds, doubled on every retry
+
+
+class SlotTakenError(Exception):
+    pass
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def _claim_rows(conn, doctor_name, start_time, duration, schedule_ids, hold_token):
+    """Flips the slot's Available rows to Booked; returns (rows updated, rows needed)."""
+    not_held = NOT_HELD_BY_OTHERS.format(table="DoctorSchedules")
+    if schedule_ids:
+        placeholders = ", ".join("?" * len(schedule_ids))
+        cursor = conn.execute(
+            f"UPDATE DoctorSchedules SET Status = 'Booked' WHERE ScheduleID IN ({placeholders}) AND DoctorName = ? AND Status = 'Available' AND {not_held}",
+            (*schedule_ids, doctor_name, hold_token or "", now()),
+        )
+        return cursor.rowcount, len(schedule_ids)
+    start = datetime.strptime(start_time, TIME_FORMAT)
+    end_time = (start + timedelta(minutes=duration)).strftime(TIME_FORMAT)
+    cursor = conn.execute(
+        f"UPDATE DoctorSchedules SET Status = 'Booked' WHERE DoctorName = ? AND StartTime >= ? AND StartTime < ? AND Status = 'Available' AND {not_held}",
+        (doctor_name, start_time, end_time, hold_token or "", now()),
+    )
+    return cursor.rowcount, max(1, -(-duration // SLOT_MINUTES))
+
+
+def _book_once(db_file, patient_id, doctor_name, start_time, duration, insurance_carrier, member_id, schedule_ids=None, hold_token=None):
+    """Returns (appointment id, whether a hold was converted)."""
+    with transaction(db_file, immediate=True) as conn:
+        updated, rows_needed = _claim_rows(conn, doctor_name, start_time, duration, schedule_ids, hold_token)
+        if updated != rows_needed:
+            # Raising rolls back the partial update.
+            raise SlotTakenError(f"{doctor_name} at {start_time}")
+        cursor = conn.execute(
+            "INSERT INTO Appointments (PatientID, DoctorName, AppointmentTime, Duration, InsuranceCarrier, MemberID, Status) VALUES (?, ?, ?, ?, ?, ?, 'Confirmed')",
+            (patient_id, doctor_name, start_time, duration, insurance_carrier, member_id),
+        )
+        return cursor.lastrowid, bool(hold_token) and convert_hold(conn, hold_token)
+
+
+def book_slot(db_file: str, patient_id: int, doctor_name: str, start_time: str, duration: int,
+              insurance_carrier: str, member_id: str, max_retries: int = MAX_RETRIES, schedule_ids: list = None,
+              hold_token: str = None) -> dict:
+    """
+    Books `duration` minutes with `doctor_name` from `start_time` ('YYYY-MM-DD HH:MM'). With
+    `schedule_ids` (every DoctorSchedules row the slot covers) those rows are updated by key.
+    `hold_token` lets the booking use rows held by that token and converts the hold.
+    Returns {"status": BOOKING_SUCCESSFUL, "appointment_id": ...} or {"status": SLOT_TAKEN}.
+    SQLITE_BUSY is retried with jittered exponential backoff up to `max_retries` times.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            appointment_id, converted = _book_once(db_file, patient_id, doctor_name, start_time, duration, insurance_carrier,
+                                                   member_id, schedule_ids, hold_token)
+            if converted:
+                hold_stats.add("converted")
+            return {"status": BOOKING_SUCCESSFUL, "appointment_id": appointment_id}
+        except SlotTakenError:
+            return {"status": SLOT_TAKEN}
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == max_retries:
+                return {"status": f"Error: Could not complete booking: {e}"}
+            time.sleep(RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random()))
@@ -0,0 +1,188 @@
+# checkpoint_serde.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import ormsgpack
+import zstandard
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Checkpoint serializer that only writes what changed between steps.
+#
+# LangGraph checkpoints the whole GraphState on every step, although most of it (earlier
+# messages, patient_info, booking_info with its slot list) is identical to the previous
+# checkpoint. Here every channel value, and every individual message of list-of-message
+# channels, is msgpack-encoded once into a content-addressed blob; the checkpoint itself
+# only carries the blob hashes. A new step therefore stores its new messages and changed
+# channels, plus a small header. Payloads above ZSTD_MIN_BYTES are zstd-compressed.
+#
+# Blobs live in a BlobStore (get_blobs / put_blobs); PrunableSqliteSaver provides one
+# backed by its database and garbage-collects unreferenced blobs during compaction.
+
+FORMAT_VERSION = 1
+DELTA_TYPE = "delta"
+DELTA_ZSTD_TYPE = "delta+zstd"
+INLINE_MAX_BYTES = 64  # smaller values are cheaper to inline than to reference
+ZSTD_MIN_BYTES = 512
+ZSTD_LEVEL = 3
+RAW_CACHE_SIZE = 4096  # recently used blobs kept decompressed in memory
+TOUCH_SECONDS = 60  # a blob stored this recently is not re-sent to the store
+
+# Channel value encodings inside a checkpoint header.
+_INLINE, _REF, _MESSAGES = 0, 1, 2
+
+
+def blob_hash(type_: str, data: bytes) -> bytes:
+    return hashlib.blake2b(type_.encode() + b"\0" + data, digest_size=16).digest()
+
+
+class MemoryBlobStore:
+    """In-process BlobStore, for benchmarks and tests of the serializer on its own."""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def put_blobs(self, blobs: dict) -> None:
+        self.blobs.update(blobs)
+
+    def get_blobs(self, hashes) -> dict:
+        return {h: self.blobs[h] for h in hashes if h in self.blobs}
+
+
+class DeltaSerializer:
+    """SerializerProtocol implementation; falls back to JsonPlusSerializer for anything but checkpoints."""
+
+    def __init__(self, store, compress: bool = True):
+        self.store = store
+        self.compress = compress
+        self.inner = JsonPlusSerializer()
+        self._zstd_local = threading.local()
+        self._raw = OrderedDict()
+        self._raw_lock = threading.Lock()
+        self._stored = OrderedDict()  # hash -> monotonic time it was last sent to the store
+
+    # --- Compression (zstd contexts are not thread-safe) ---
+    def _compressor(self):
+        local = self._zstd_local
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            local.decompressor = zstandard.ZstdDecompressor()
+        return local.compressor, local.decompressor
+
+    def _pack(self, type_: str, data: bytes) -> tuple:
+        if self.compress and len(data) >= ZSTD_MIN_BYTES:
+            return f"{type_}+zstd", self._compressor()[0].compress(data)
+        return type_, data
+
+    def _unpack(self, type_: str, data: bytes) -> tuple:
+        if type_.endswith("+zstd"):
+            return type_[:-len("+zstd")], self._compressor()[1].decompress(data)
+        return type_, data
+
+    # --- Blobs ---
+    def _encode_value(self, value, new_blobs: dict) -> list:
+        type_, data = self.inner.dumps_typed(value)
+        if len(data) <= INLINE_MAX_BYTES:
+            return [_INLINE, type_, data]
+        digest = blob_hash(type_, data)
+        stored_at = self._stored.get(digest)
+        if stored_at is None or time.monotonic() - stored_at > TOUCH_SECONDS:
+            new_blobs[digest] = self._pack(type_, data)
+        return [_REF, digest]
+
+    def _decode_blobs(self, hashes) -> dict:
+        # Raw blobs are cached rather than decoded values: nodes update state dicts in place.
+        raw, missing = {}, []
+        with self._raw_lock:
+            for digest in hashes:
+                if digest in self._raw:
+                    self._raw.move_to_end(digest)
+                    raw[digest] = self._raw[digest]
+                else:
+                    missing.append(digest)
+        if missing:
+            found = self.store.get_blobs(missing)
+            if len(found) != len(set(missing)):
+                raise KeyError(f"{len(set(missing)) - len(found)} checkpoint blob(s) missing from the store")
+            found = {digest: self._unpack(*blob) for digest, blob in found.items()}
+            raw.update(found)
+            with self._raw_lock:
+                self._raw.update(found)
+                while len(self._raw) > RAW_CACHE_SIZE:
+                    self._raw.popitem(last=False)
+        return {digest: self.inner.loads_typed(blob) for digest, blob in raw.items()}
+
+    # --- SerializerProtocol ---
+    def dumps(self, obj) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes):
+        return self.inner.loads(data)
+
+    def dumps_typed(self, obj) -> tuple:
+        if not (isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict) and "channel_versions" in obj):
+            return self.inner.dumps_typed(obj)
+        new_blobs, channels = {}, {}
+        for name, value in obj["channel_values"].items():
+            if isinstance(value, list) and value and all(hasattr(item, "content") and hasattr(item, "type") for item in value):
+                refs = [self._encode_value(message, new_blobs) for message in value]
+                channels[name] = [_MESSAGES, refs]
+            else:
+                channels[name] = self._encode_value(value, new_blobs)
+        if new_blobs:
+            self.store.put_blobs(new_blobs)
+            now = time.monotonic()
+            with self._raw_lock:
+                for digest in new_blobs:
+                    self._stored[digest] = now
+                    self._stored.move_to_end(digest)
+                while len(self._stored) > RAW_CACHE_SIZE:
+                    self._stored.popitem(last=False)
+        rest_type, rest = self.inner.dumps_typed({key: value for key, value in obj.items() if key != "channel_values"})
+        header = ormsgpack.packb([FORMAT_VERSION, rest_type, rest, channels])
+        if self.compress and len(header) >= ZSTD_MIN_BYTES:
+            return DELTA_ZSTD_TYPE, self._compressor()[0].compress(header)
+        return DELTA_TYPE, header
+
+    def _header(self, type_: str, data: bytes) -> list:
+        if type_ == DELTA_ZSTD_TYPE:
+            data = self._compressor()[1].decompress(data)
+        version, rest_type, rest, channels = ormsgpack.unpackb(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported checkpoint format version {version}")
+        return rest_type, rest, channels
+
+    def loads_typed(self, data: tuple):
+        type_, payload = data
+        if type_ not in (DELTA_TYPE, DELTA_ZSTD_TYPE):
+            return self.inner.loads_typed(data)
+        rest_type, rest, channels = self._header(type_, payload)
+        hashes = [ref[1] for ref in self._iter_refs(channels)]
+        blobs = self._decode_blobs(hashes) if hashes else {}
+
+        def decode(encoded):
+            if encoded[0] == _INLINE:
+                return self.inner.loads_typed((encoded[1], encoded[2]))
+            return blobs[encoded[1]]
+
+        checkpoint = self.inner.loads_typed((rest_type, rest))
+        checkpoint["channel_values"] = {
+            name: [decode(item) for item in encoded[1]] if encoded[0] == _MESSAGES else decode(encoded)
+            for name, encoded in channels.items()
+        }
+        return checkpoint
+
+    @staticmethod
+    def _iter_refs(channels: dict):
+        for encoded in channels.values():
+            for item in (encoded[1] if encoded[0] == _MESSAGES else [encoded]):
+                if item[0] == _REF:
+                    yield item
+
+    def referenced_blobs(self, type_: str, data: bytes) -> set:
+        """Blob hashes a stored checkpoint depends on (empty for non-delta payloads); used for GC."""
+        if type_ not in (DELTA_TYPE, DELTA_ZSTD_TYPE):
+            return set()
+        return {ref[1] for ref in self._iter_refs(self._header(type_, data)[2])}
@@ -0,0 +1,367 @@
+# checkpointer.py
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from checkpoint_serde import TOUCH_SECONDS, DeltaSerializer
+
+# File-backed LangGraph checkpoint store. Conversations survive restarts, every concurrent
+# caller checks out its own WAL connection instead of sharing one behind a lock, and a
+# background compactor keeps the file bounded: threads idle longer than the TTL are
+# dropped, only the newest KEEP_CHECKPOINTS versions of each thread are kept, and the
+# oldest threads are evicted while the store is over MAX_BYTES. Checkpoints are written
+# with DeltaSerializer, whose content-addressed blobs live in checkpoint_blobs and are
+# garbage-collected once no remaining checkpoint references them.
+# The graph state only keeps a window of recent messages; every message is also appended
+# to message_archive the first time a checkpoint holds it, before the window can drop it,
+# so the full transcript of a thread can be rebuilt. It is pruned together with its thread.
+
+# --- Configuration ---
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "data/checkpoints.db")
+THREAD_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+KEEP_CHECKPOINTS = int(os.getenv("CHECKPOINT_KEEP", "3"))  # resuming only needs the latest
+MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024)))
+COMPACT_INTERVAL = 300  # seconds between background compactions
+POOL_SIZE = 8  # idle connections kept for reuse
+# Unreferenced blobs touched more recently than this may belong to a put that started after the
+# mark. A blob still in use is re-touched at least every 2 * TOUCH_SECONDS, so keep this well above.
+BLOB_GRACE_SECONDS = 600
+BUSY_TIMEOUT = 5.0
+ARCHIVE_CHANNEL = "messages"  # the list-of-messages channel whose history is archived
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# thread_activity is maintained by a trigger so recording "last touched" costs no extra round trip.
+ACTIVITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_activity (
+    thread_id TEXT PRIMARY KEY,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_thread_activity_updated ON thread_activity (updated_at);
+CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+    hash BLOB PRIMARY KEY,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    touched_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS message_archive (
+    thread_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    UNIQUE (thread_id, message_id)
+);
+CREATE TRIGGER IF NOT EXISTS trg_checkpoints_activity AFTER INSERT ON checkpoints
+BEGIN
+    INSERT INTO thread_activity (thread_id, updated_at) VALUES (NEW.thread_id, CAST(strftime('%s', 'now') AS INTEGER))
+    ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at;
+END;
+"""
+
+
+class PrunableSqliteSaver(SqliteSaver):
+    """SqliteSaver over a database file with pooled connections, pruning and metrics."""
+
+    def __init__(self, db_file: str = CHECKPOINT_DB, ttl_seconds: int = THREAD_TTL_SECONDS,
+                 keep_checkpoints: int = KEEP_CHECKPOINTS, max_bytes: int = MAX_BYTES, serde=None, compress: bool = True):
+        self.db_file = db_file
+        self.ttl_seconds = ttl_seconds
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.max_bytes = max_bytes
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._setup_lock = threading.Lock()
+        self._compactor = None
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="checkpoint-io")
+        self._last_compacted_at = 0
+        self.last_compaction = {}
+        self.delta_serde = DeltaSerializer(self, compress=compress) if serde is None else None
+        # Archived messages must outlive the blobs of the checkpoints they came from, so they are stored whole.
+        self.archive_serde = JsonPlusSerializer()
+        super().__init__(conn=self._connect(), serde=serde or self.delta_serde)
+        # self.conn stays out of the pool: the base class uses it directly for setup() and list().
+        self.setup()
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # Must precede the first table so freed pages can be returned to the OS by compaction.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _checkout(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if self._idle.qsize() < POOL_SIZE:
+                self._idle.put(conn)
+            else:
+                with self._connections_lock:
+                    self._connections.remove(conn)
+                conn.close()
+
+    def setup(self) -> None:
+        with self._setup_lock:
+            if self.is_setup:
+                return
+            super().setup()
+            self.conn.executescript(ACTIVITY_SCHEMA)
+            self.conn.commit()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True):
+        # Replaces the base class's single locked connection; WAL handles reader/writer concurrency.
+        if not self.is_setup:
+            self.setup()
+        with self._checkout() as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+                if transaction:
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+    # --- Async API (the base class raises NotImplementedError): run the sync methods off the event loop ---
+    async def _offload(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def aget_tuple(self, config):
+        return await self._offload(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await self._offload(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self._offload(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await self._offload(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await self._offload(self.delete_thread, thread_id)
+
+    # --- Message archive ---
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        if ARCHIVE_CHANNEL in new_versions:
+            self.archive_messages(config["configurable"]["thread_id"], checkpoint["channel_values"].get(ARCHIVE_CHANNEL) or [])
+        return saved
+
+    def archive_messages(self, thread_id: str, messages) -> int:
+        """Appends the messages not archived yet for `thread_id` (in order); returns how many were new."""
+        messages = [message for message in messages if getattr(message, "id", None)]
+        if not messages:
+            return 0
+        thread_id = str(thread_id)
+        with self.cursor() as cur:
+            placeholders = ",".join("?" * len(messages))
+            archived = {row[0] for row in cur.execute(
+                f"SELECT message_id FROM message_archive WHERE thread_id = ? AND message_id IN ({placeholders})",
+                (thread_id, *(message.id for message in messages)))}
+            new = [(thread_id, message.id, *self.archive_serde.dumps_typed(message))
+                   for message in messages if message.id not in archived]
+            cur.executemany("INSERT OR IGNORE INTO message_archive (thread_id, message_id, type, data) VALUES (?, ?, ?, ?)", new)
+        return len(new)
+
+    def transcript(self, thread_id: str) -> list:
+        """Every archived message of `thread_id`, oldest first."""
+        with self.cursor(transaction=False) as cur:
+            rows = cur.execute("SELECT type, data FROM message_archive WHERE thread_id = ? ORDER BY rowid", (str(thread_id),)).fetchall()
+        return [self.archive_serde.loads_typed(row) for row in rows]
+
+    # --- Blob store for DeltaSerializer ---
+    def put_blobs(self, blobs: dict) -> None:
+        now = int(time.time())
+        with self.cursor() as cur:
+            # Re-storing an existing blob only refreshes touched_at (at most once per TOUCH_SECONDS).
+            cur.executemany(
+                "INSERT INTO checkpoint_blobs (hash, type, data, touched_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET touched_at = excluded.touched_at WHERE touched_at < excluded.touched_at - ?",
+                [(digest, type_, data, now, TOUCH_SECONDS) for digest, (type_, data) in blobs.items()],
+            )
+
+    def get_blobs(self, hashes) -> dict:
+        hashes = list(dict.fromkeys(hashes))
+        found = {}
+        with self.cursor(transaction=False) as cur:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for digest, type_, data in cur.execute(f"SELECT hash, type, data FROM checkpoint_blobs WHERE hash IN ({placeholders})", chunk):
+                    found[digest] = (type_, data)
+        return found
+
+    def collect_blobs(self) -> int:
+        """
+        Deletes blobs no stored checkpoint references (mark and sweep). The mark runs without the
+        write lock; the sweep only deletes blobs nobody has touched since the grace cutoff, checked
+        by the DELETE itself, so a checkpoint written during the mark keeps its blobs.
+        """
+        if self.delta_serde is None:
+            return 0
+        cutoff = int(time.time()) - BLOB_GRACE_SECONDS
+        live = set()
+        with self.cursor(transaction=False) as cur:
+            for type_, data in cur.execute("SELECT type, checkpoint FROM checkpoints WHERE type LIKE 'delta%'"):
+                live |= self.delta_serde.referenced_blobs(type_, data)
+        with self.cursor() as cur:
+            cur.execute("BEGIN IMMEDIATE")
+            candidates = cur.execute("SELECT hash FROM checkpoint_blobs WHERE touched_at < ?", (cutoff,)).fetchall()
+            dead = [(row[0], cutoff) for row in candidates if row[0] not in live]
+            cur.executemany("DELETE FROM checkpoint_blobs WHERE hash = ? AND touched_at < ?", dead)
+        return len(dead)
+
+    # --- Pruning ---
+    def _delete_threads(self, cur, thread_ids) -> int:
+        for thread_id in thread_ids:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+            cur.execute("DELETE FROM message_archive WHERE thread_id = ?", (thread_id,))
+        return len(thread_ids)
+
+    def delete_thread(self, thread_id) -> None:
+        with self.cursor() as cur:
+            self._delete_threads(cur, [str(thread_id)])
+
+    def prune_expired_threads(self) -> int:
+        cutoff = int(time.time()) - self.ttl_seconds
+        with self.cursor() as cur:
+            expired = [row[0] for row in cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,)).fetchall()]
+            return self._delete_threads(cur, expired)
+
+    def prune_old_checkpoints(self, since: int = 0) -> int:
+        """Keeps the newest `keep_checkpoints` per thread for threads active since `since` (epoch seconds)."""
+        with self.cursor() as cur:
+            # checkpoint_id is a time-ordered uuid6, the same ordering the base class uses for "latest".
+            cur.execute(
+                "DELETE FROM checkpoints WHERE rowid IN ("
+                " SELECT rowid FROM ("
+                "  SELECT rowid, ROW_NUMBER() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn"
+                "  FROM checkpoints WHERE thread_id IN (SELECT thread_id FROM thread_activity WHERE updated_at >= ?)"
+                " ) WHERE rn > ?)",
+                (since, self.keep_checkpoints),
+            )
+            deleted = cur.rowcount
+            if deleted:
+                cur.execute(
+                    "DELETE FROM writes WHERE NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id "
+                    "AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)"
+                )
+            return deleted
+
+    def prune_to_size(self) -> int:
+        """Evicts least recently active threads until the stored payloads fit in `max_bytes`."""
+        with self.cursor() as cur:
+            sizes = cur.execute(
+                "SELECT a.thread_id,"
+                " COALESCE((SELECT SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints c WHERE c.thread_id = a.thread_id), 0)"
+                " + COALESCE((SELECT SUM(LENGTH(value)) FROM writes w WHERE w.thread_id = a.thread_id), 0)"
+                " + COALESCE((SELECT SUM(LENGTH(data)) FROM message_archive m WHERE m.thread_id = a.thread_id), 0),"
+                " (SELECT COUNT(*) FROM checkpoints c WHERE c.thread_id = a.thread_id)"
+                " FROM thread_activity a ORDER BY a.updated_at"
+            ).fetchall()
+            # Shared blobs can't be attributed exactly; charge them to threads per checkpoint held.
+            blob_bytes = cur.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM checkpoint_blobs").fetchone()[0]
+            blob_share = blob_bytes / max(1, sum(count for _, _, count in sizes))
+            excess = sum(size for _, size, _ in sizes) + blob_bytes - self.max_bytes
+            evict = []
+            for thread_id, size, count in sizes:
+                if excess <= 0:
+                    break
+                evict.append(thread_id)
+                excess -= size + count * blob_share
+            return self._delete_threads(cur, evict)
+
+    def compact(self) -> dict:
+        """One pruning pass plus WAL truncation and freeing of empty pages."""
+        started = time.perf_counter()
+        since, self._last_compacted_at = self._last_compacted_at, int(time.time())
+        result = {
+            "expired_threads": self.prune_expired_threads(),
+            "old_checkpoints": self.prune_old_checkpoints(since),
+            "evicted_threads": self.prune_to_size(),
+        }
+        result["collected_blobs"] = self.collect_blobs()
+        with self._checkout() as conn:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result["duration_ms"] = (time.perf_counter() - started) * 1000
+        self.last_compaction = result
+        return result
+
+    def _run_compactor(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Checkpoint compaction error: {e}")
+
+    def start_compaction(self, interval: float = COMPACT_INTERVAL) -> "PrunableSqliteSaver":
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._run_compactor, args=(interval,), name="checkpoint-compactor", daemon=True)
+            self._compactor.start()
+        return self
+
+    # --- Metrics ---
+    def metrics(self) -> dict:
+        with self.cursor(transaction=False) as cur:
+            checkpoints, checkpoint_bytes = cur.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints").fetchone()
+            writes, write_bytes = cur.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()
+            blobs, blob_bytes = cur.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM checkpoint_blobs").fetchone()
+            archived, archive_bytes = cur.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM message_archive").fetchone()
+            threads = cur.execute("SELECT COUNT(*) FROM thread_activity").fetchone()[0]
+            page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+            page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "writes": writes,
+            "blobs": blobs,
+            "archived_messages": archived,
+            "payload_bytes": checkpoint_bytes + write_bytes + blob_bytes + archive_bytes,
+            "file_bytes": page_count * page_size,
+            "connections": len(self._connections),
+            "last_compaction": self.last_compaction,
+        }
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join(5)
+        self._executor.shutdown(wait=False)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,184 @@
+# db.py
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import migrations
+
+# --- Configuration ---
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "30"))
+BUSY_TIMEOUT = 5.0  # seconds sqlite waits on a locked database before raising
+CACHED_STATEMENTS = 256  # per-connection prepared statement cache
+
+# Applied to every pooled connection. WAL lets readers run alongside the single writer,
+# NORMAL sync is durable across application crashes in WAL mode, and the cache/mmap
+# settings keep hot pages of the (small) clinic database in memory.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # ~16 MB
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+# Optional callback(statement) installed on every connection opened after it is set;
+# benchmarks use it to count queries.
+_trace_callback = None
+
+
+def set_trace_callback(callback) -> None:
+    global _trace_callback
+    _trace_callback = callback
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of SQLite connections to one database file.
+    Connections run in autocommit mode; use `transaction()` for multi-statement writes.
+    """
+
+    def __init__(self, db_file: str, max_size: int = POOL_SIZE, acquire_timeout: float = ACQUIRE_TIMEOUT):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquisitions = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._migrated = False
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if not self._migrated:
+            # Upgrade older clinic.db files in place before the first query runs.
+            migrations.migrate(conn)
+            self._migrated = True
+        if _trace_callback is not None:
+            conn.set_trace_callback(_trace_callback)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"Timed out waiting for a database connection to {self.db_file}")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._acquisitions += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        """Borrows a connection and wraps the block in BEGIN/COMMIT, rolling back on error."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "db_file": self.db_file,
+                "max_size": self.max_size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "acquisitions": self._acquisitions,
+                "avg_wait_ms": (self._total_wait / self._acquisitions * 1000) if self._acquisitions else 0.0,
+                "max_wait_ms": self._max_wait * 1000,
+            }
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file: str) -> ConnectionPool:
+    """Returns the process-wide pool for `db_file`, creating it on first use."""
+    pool = _pools.get(db_file)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_file)
+            if pool is None:
+                pool = _pools[db_file] = ConnectionPool(db_file)
+    return pool
+
+
+def connection(db_file: str):
+    return get_pool(db_file).connection()
+
+
+def transaction(db_file: str, immediate: bool = False):
+    return get_pool(db_file).transaction(immediate=immediate)
+
+
+def pool_metrics() -> list:
+    return [pool.metrics() for pool in list(_pools.values())]
@@ -0,0 +1,305 @@
+# email_outbox.py
+
+import os
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import lru_cache
+
+from db import connection, transaction
+from instrumentation import timed
+
+# Durable outbox for outgoing mail. The booking turn only INSERTs a row into
+# EmailOutbox; background workers claim due rows, send them over a persistent SMTP
+# connection and record the result, retrying failures with exponential backoff.
+# Each claim carries a ClaimToken; a row's lease is renewed just before its send, and the
+# result is only written while the token still matches. A worker whose lease ran out (e.g.
+# behind slow sends) skips the row or leaves it alone rather than sending it twice.
+# Every claim counts as an attempt, so a message whose send keeps killing its worker is
+# dead-lettered after MAX_ATTEMPTS like one whose sends keep failing.
+# Works against any SMTP server, e.g. a local stand-in: `python -m aiosmtpd -n -l localhost:8025`
+# with EMAIL_HOST=localhost EMAIL_PORT=8025.
+
+# --- Configuration ---
+DB_FILE = "data/clinic.db"
+NUM_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+BATCH_SIZE = 10
+POLL_INTERVAL = 5.0  # seconds between outbox checks when nothing wakes the workers
+# A claimed row is retried if its worker dies before finishing. Renewed before each send, so it
+# only has to outlast one send: connect + STARTTLS + login + send, then a reconnect and resend,
+# each socket operation bounded by SMTP_TIMEOUT.
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30  # 30s, 60s, 120s, ...
+SMTP_IDLE_SECONDS = 60  # NOOP-check a pooled connection that has been idle this long
+SMTP_TIMEOUT = 30
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _now() -> str:
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def sender_address():
+    return os.getenv("EMAIL_FROM") or os.getenv("EMAIL_HOST_USER")
+
+
+# --- Enqueueing ---
+def enqueue_email(db_file: str, recipient: str, subject: str, body: str, attachment_path: str = None, patient_id: int = None) -> int:
+    with transaction(db_file) as conn:
+        cursor = conn.execute(
+            "INSERT INTO EmailOutbox (PatientID, Recipient, Subject, Body, AttachmentPath, Status, Attempts, NextAttemptAt, CreatedAt) "
+            "VALUES (?, ?, ?, ?, ?, 'Pending', 0, ?, ?)",
+            (patient_id, recipient, subject, body, attachment_path, _now(), _now()),
+        )
+        outbox_id = cursor.lastrowid
+    pool = _worker_pools.get(db_file)
+    if pool:
+        pool.wake()
+    return outbox_id
+
+
+def outbox_stats(db_file: str) -> dict:
+    with connection(db_file) as conn:
+        return dict(conn.execute("SELECT Status, COUNT(*) FROM EmailOutbox GROUP BY Status").fetchall())
+
+
+# --- Message building ---
+@lru_cache(maxsize=8)
+def _encoded_attachment(path: str, mtime: float) -> str:
+    """Reads and base64-encodes an attachment once per file version."""
+    part = MIMEBase('application', 'octet-stream')
+    with open(path, "rb") as attachment:
+        part.set_payload(attachment.read())
+    encoders.encode_base64(part)
+    return part.get_payload()
+
+
+def build_message(sender: str, recipient: str, subject: str, body: str, attachment_path: str = None) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    if attachment_path:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(_encoded_attachment(attachment_path, os.path.getmtime(attachment_path)))
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', f"attachment; filename={os.path.basename(attachment_path)}")
+        msg.attach(part)
+    return msg
+
+
+# --- SMTP ---
+class PooledSMTPConnection:
+    """One long-lived SMTP session: connects lazily, STARTTLS/login once, reconnects when dropped."""
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(os.getenv("EMAIL_HOST", "localhost"), int(os.getenv("EMAIL_PORT", "25")), timeout=SMTP_TIMEOUT)
+        server.ehlo()
+        if server.has_extn("starttls"):
+            server.starttls()
+            server.ehlo()
+        user, password = os.getenv("EMAIL_HOST_USER"), os.getenv("EMAIL_HOST_PASSWORD")
+        if user and password:
+            server.login(user, password)
+        return server
+
+    def _alive(self) -> bool:
+        if self._server is None:
+            return False
+        if time.monotonic() - self._last_used < SMTP_IDLE_SECONDS:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, msg) -> None:
+        if not self._alive():
+            self.close()
+            self._server = self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server timed out our idle session; reconnect once and resend.
+            self._server = self._connect()
+            self._server.send_message(msg)
+        self._last_used = time.monotonic()
+
+    send = timed("email", "smtp_send", send)
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+# --- Workers ---
+def _lease_until() -> str:
+    return (datetime.now() + timedelta(seconds=LEASE_SECONDS)).strftime(TIME_FORMAT)
+
+
+def claim_batch(db_file: str, claim_token: str, limit: int = BATCH_SIZE) -> list:
+    """
+    Atomically leases up to `limit` due messages to the caller's `claim_token`, counting the claim
+    as an attempt. Rows are returned with that count. A message whose lease already ran out
+    MAX_ATTEMPTS times without a result is marked Failed instead.
+    """
+    with transaction(db_file, immediate=True) as conn:
+        rows = conn.execute(
+            "SELECT OutboxID, Recipient, Subject, Body, AttachmentPath, Attempts FROM EmailOutbox "
+            "WHERE Status IN ('Pending', 'Sending') AND NextAttemptAt <= ? ORDER BY NextAttemptAt LIMIT ?",
+            (_now(), limit),
+        ).fetchall()
+        exhausted = [row for row in rows if row[5] >= MAX_ATTEMPTS]
+        claimed = [(*row[:5], row[5] + 1) for row in rows if row[5] < MAX_ATTEMPTS]
+        conn.executemany(
+            "UPDATE EmailOutbox SET Status = 'Failed', ClaimToken = NULL, "
+            "LastError = 'Lease expired without a result after ' || Attempts || ' attempts' WHERE OutboxID = ?",
+            [(row[0],) for row in exhausted],
+        )
+        lease_until = _lease_until()
+        conn.executemany(
+            "UPDATE EmailOutbox SET Status = 'Sending', Attempts = ?, NextAttemptAt = ?, ClaimToken = ? WHERE OutboxID = ?",
+            [(row[5], lease_until, claim_token, row[0]) for row in claimed],
+        )
+    for row in exhausted:
+        print(f"Outbox message {row[0]} to {row[1]} failed: lease expired without a result after {row[5]} attempts")
+    return claimed
+
+
+def renew_lease(db_file: str, outbox_id: int, claim_token: str) -> bool:
+    """Extends the caller's lease on a row; False if another worker has claimed it since."""
+    with transaction(db_file) as conn:
+        return conn.execute(
+            "UPDATE EmailOutbox SET NextAttemptAt = ? WHERE OutboxID = ? AND ClaimToken = ? AND Status = 'Sending'",
+            (_lease_until(), outbox_id, claim_token),
+        ).rowcount == 1
+
+
+def _record_result(db_file: str, outbox_id: int, claim_token: str, attempts: int, error: Exception = None) -> bool:
+    """Writes the send result if the caller still holds the row's lease; returns whether it did."""
+    with transaction(db_file) as conn:
+        if error is None:
+            cursor = conn.execute(
+                "UPDATE EmailOutbox SET Status = 'Sent', Attempts = ?, SentAt = ?, LastError = NULL, ClaimToken = NULL "
+                "WHERE OutboxID = ? AND ClaimToken = ?",
+                (attempts, _now(), outbox_id, claim_token))
+        elif attempts >= MAX_ATTEMPTS:
+            cursor = conn.execute(
+                "UPDATE EmailOutbox SET Status = 'Failed', Attempts = ?, LastError = ?, ClaimToken = NULL WHERE OutboxID = ? AND ClaimToken = ?",
+                (attempts, str(error), outbox_id, claim_token))
+        else:
+            retry_at = datetime.now() + timedelta(seconds=RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+            cursor = conn.execute(
+                "UPDATE EmailOutbox SET Status = 'Pending', Attempts = ?, NextAttemptAt = ?, LastError = ?, ClaimToken = NULL "
+                "WHERE OutboxID = ? AND ClaimToken = ?",
+                (attempts, retry_at.strftime(TIME_FORMAT), str(error), outbox_id, claim_token))
+        return cursor.rowcount == 1
+
+
+def process_batch(db_file: str, smtp: PooledSMTPConnection, limit: int = BATCH_SIZE) -> int:
+    """Sends one batch of due messages; returns how many were claimed."""
+    claim_token = uuid.uuid4().hex
+    rows = claim_batch(db_file, claim_token, limit)
+    sender = sender_address()
+    for outbox_id, recipient, subject, body, attachment_path, attempts in rows:
+        # Earlier sends in the batch may have outlasted this row's lease; don't send what someone else owns now.
+        if not renew_lease(db_file, outbox_id, claim_token):
+            print(f"Outbox message {outbox_id} was reclaimed by another worker; skipping")
+            continue
+        try:
+            smtp.send(build_message(sender, recipient, subject, body, attachment_path))
+            error = None
+            print(f"Confirmation email successfully sent to {recipient}")
+        except Exception as e:
+            smtp.close()
+            error = e
+            print(f"FAILED TO SEND EMAIL to {recipient} (attempt {attempts}): {e}")
+        if not _record_result(db_file, outbox_id, claim_token, attempts, error):
+            print(f"Outbox message {outbox_id}: lease lost during the send; result not recorded")
+    return len(rows)
+
+
+class OutboxWorkerPool:
+    def __init__(self, db_file: str, num_workers: int = NUM_WORKERS, poll_interval: float = POLL_INTERVAL):
+        self.db_file = db_file
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _run(self):
+        smtp = PooledSMTPConnection()
+        try:
+            while not self._stop.is_set():
+                try:
+                    claimed = process_batch(self.db_file, smtp)
+                except Exception as e:
+                    print(f"Email outbox worker error: {e}")
+                    claimed = 0
+                if not claimed:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+        finally:
+            smtp.close()
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+_worker_pools = {}
+_worker_pools_lock = threading.Lock()
+
+
+def start_outbox_workers(db_file: str) -> OutboxWorkerPool:
+    """Starts the background senders for `db_file` once per process."""
+    with _worker_pools_lock:
+        pool = _worker_pools.get(db_file)
+        if pool is None:
+            pool = _worker_pools[db_file] = OutboxWorkerPool(db_file).start()
+    return pool
+
+
+if __name__ == '__main__':
+    # Run the senders as a standalone process, e.g. alongside `streamlit run app.py`.
+    from dotenv import load_dotenv
+    load_dotenv()
+    print(f"--- Email outbox workers running against {DB_FILE} ---")
+    workers = start_outbox_workers(DB_FILE)
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Outbox: {outbox_stats(DB_FILE)}")
+    except KeyboardInterrupt:
+        workers.stop()
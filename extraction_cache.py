@@ -0,0 +1,75 @@
+# extraction_cache.py
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# --- Configuration ---
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 15 * 60
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(user_message: str) -> str:
+    """Collapses whitespace so that re-sent messages map to the same cache key."""
+    return _WHITESPACE_RE.sub(" ", user_message or "").strip()
+
+
+class ExtractionCache:
+    """
+    A bounded, thread-safe LRU cache with a TTL for LLM extraction results.
+    Keys are (pydantic model, normalized user message); values are model instances.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, pydantic_model: Any, user_message: str) -> tuple:
+        return (pydantic_model, normalize_message(user_message))
+
+    def get(self, pydantic_model: Any, user_message: str) -> Optional[Any]:
+        key = self._key(pydantic_model, user_message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    # Hand out a copy so callers can't mutate the cached instance.
+                    return value.model_copy()
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, pydantic_model: Any, user_message: str, value: Any) -> None:
+        key = self._key(pydantic_model, user_message)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value.model_copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
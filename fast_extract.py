@@ -0,0 +1,165 @@
+# fast_extract.py
+
+import re
+from datetime import datetime
+from typing import Iterable
+
+# Deterministic, regex-based extraction for the fields the agent collects.
+# Anything found here never has to go through the LLM, so the rules only report what they
+# can't get wrong: a name needs an introduction ("my name is ..."), because a bare run of
+# capitalized words is as likely to be "Thanks So Much" as a name.
+
+# --- Patterns ---
+EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+ISO_DATE_RE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+US_DATE_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+TEXT_DATE_RE = re.compile(
+    r"\b(?:(\d{1,2})(?:st|nd|rd|th)?\s+([A-Za-z]{3,9})\.?,?\s+(\d{4})"
+    r"|([A-Za-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4}))\b"
+)
+PHONE_RE = re.compile(r"(?<![\w-])\+?\(?\d[\d\s().-]{7,}\d(?![\w-])")
+NAME_INTRO_RE = re.compile(
+    r"(?i:\bmy name is|\bname\s*[:\-]|\bi am|\bi'm|\bthis is)\s+"
+    r"((?:[A-Z][a-zA-Z'\-]+\s+){1,3}[A-Z][a-zA-Z'\-]+)"
+)
+# Not a field extractor: see leading_name.
+NAME_ONLY_RE = re.compile(r"^\s*((?:[A-Z][a-zA-Z'\-]+\s+){1,3}[A-Z][a-zA-Z'\-]+)\s*$")
+MEMBER_ID_RE = re.compile(r"\b(?:member\s*(?:id|number|no\.?|#)|policy\s*(?:id|number|#)|id)\s*(?:is|:|#)?\s*([A-Za-z0-9-]{5,20})\b", re.IGNORECASE)
+ALNUM_ID_RE = re.compile(r"\b(?=[A-Za-z0-9-]*\d)(?=[A-Za-z0-9-]*[A-Za-z])[A-Za-z0-9-]{6,20}\b")
+SELF_PAY_RE = re.compile(r"\b(?:self[\s-]?pay(?:er|ing)?|no insurance|uninsured|paying (?:out of pocket|myself))\b", re.IGNORECASE)
+
+KNOWN_CARRIERS = {
+    "aetna": "Aetna",
+    "anthem": "Anthem",
+    "blue cross blue shield": "Blue Cross Blue Shield",
+    "blue cross": "Blue Cross Blue Shield",
+    "bcbs": "Blue Cross Blue Shield",
+    "cigna": "Cigna",
+    "humana": "Humana",
+    "kaiser permanente": "Kaiser Permanente",
+    "kaiser": "Kaiser Permanente",
+    "unitedhealthcare": "UnitedHealthcare",
+    "united healthcare": "UnitedHealthcare",
+    "united health": "UnitedHealthcare",
+    "medicare": "Medicare",
+    "medicaid": "Medicaid",
+    "molina": "Molina Healthcare",
+    "oscar": "Oscar Health",
+    "ambetter": "Ambetter",
+    "tricare": "Tricare",
+}
+CARRIER_RE = re.compile(r"\b(" + "|".join(sorted(map(re.escape, KNOWN_CARRIERS), key=len, reverse=True)) + r")\b", re.IGNORECASE)
+
+MONTHS = {name: index for index, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+
+def _valid_date(year: int, month: int, day: int):
+    try:
+        return datetime(year, month, day).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _month_number(text: str):
+    return MONTHS.get(text[:3].lower())
+
+
+# --- Field Extractors ---
+def extract_email(text: str):
+    match = EMAIL_RE.search(text)
+    return match.group(0) if match else None
+
+
+def extract_date_of_birth(text: str):
+    """Finds a date in YYYY-MM-DD, MM/DD/YYYY or 'March 5, 1990' style and returns it as YYYY-MM-DD."""
+    for match in ISO_DATE_RE.finditer(text):
+        date = _valid_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if date:
+            return date
+    for match in US_DATE_RE.finditer(text):
+        first, second, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        # US ordering first, then fall back to day-first when the month would be invalid.
+        date = _valid_date(year, first, second) or _valid_date(year, second, first)
+        if date:
+            return date
+    for match in TEXT_DATE_RE.finditer(text):
+        if match.group(1):
+            day, month, year = match.group(1), _month_number(match.group(2)), match.group(3)
+        else:
+            month, day, year = _month_number(match.group(4)), match.group(5), match.group(6)
+        if month:
+            date = _valid_date(int(year), month, int(day))
+            if date:
+                return date
+    return None
+
+
+def extract_phone_number(text: str):
+    # Dates, emails and member/policy IDs contain digit runs that look like phone numbers, so drop them first.
+    cleaned = EMAIL_RE.sub(" ", text)
+    for pattern in (ISO_DATE_RE, US_DATE_RE, MEMBER_ID_RE):
+        cleaned = pattern.sub(" ", cleaned)
+    for match in PHONE_RE.finditer(cleaned):
+        digits = re.sub(r"\D", "", match.group(0))
+        if 10 <= len(digits) <= 15:
+            return match.group(0).strip()
+    return None
+
+
+def extract_full_name(text: str):
+    """Only a name the patient introduces; anything else is left to the LLM."""
+    match = NAME_INTRO_RE.search(text)
+    return match.group(1).strip() if match else None
+
+
+def leading_name(text: str):
+    """
+    The capitalized words a message like "Jane Doe, 1990-01-01, jane@example.com" leads with.
+    Only a guess ("Hello Doctor" qualifies too), so it is not used as a rule.
+    """
+    for segment in re.split(r"[,;\n]", text):
+        match = NAME_ONLY_RE.match(segment)
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def extract_insurance_carrier(text: str):
+    if SELF_PAY_RE.search(text):
+        return "Self-Pay"
+    match = CARRIER_RE.search(text)
+    return KNOWN_CARRIERS[match.group(1).lower()] if match else None
+
+
+def extract_member_id(text: str):
+    if SELF_PAY_RE.search(text):
+        return "N/A"
+    match = MEMBER_ID_RE.search(text)
+    if match:
+        return match.group(1)
+    match = ALNUM_ID_RE.search(EMAIL_RE.sub(" ", text))
+    return match.group(0) if match else None
+
+
+FIELD_EXTRACTORS = {
+    "full_name": extract_full_name,
+    "date_of_birth": extract_date_of_birth,
+    "email": extract_email,
+    "phone_number": extract_phone_number,
+    "insurance_carrier": extract_insurance_carrier,
+    "member_id": extract_member_id,
+}
+
+
+def extract_fields(text: str, field_names: Iterable[str]) -> dict:
+    """Returns the subset of `field_names` that the rules could extract from `text`."""
+    found = {}
+    for field in field_names:
+        extractor = FIELD_EXTRACTORS.get(field)
+        if extractor is None:
+            continue
+        value = extractor(text or "")
+        if value:
+            found[field] = value
+    return found
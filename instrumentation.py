@@ -0,0 +1,226 @@
+# instrumentation.py
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing histograms for graph nodes, tools, LLM calls and email sends. Every instrumented
+# function gets a Span when it is wrapped, so a call costs two perf_counter reads, a
+# bisect over the bucket bounds and a few increments under an uncontended lock. Set
+# INSTRUMENTATION=0 to leave functions unwrapped. Export with prometheus_text() or
+# snapshot() (JSON). METRICS_PORT serves both over HTTP: /metrics and /metrics.json.
+
+# --- Configuration ---
+ENABLED = os.getenv("INSTRUMENTATION", "1") != "0"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = no HTTP endpoint
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # seconds
+
+
+class Span:
+    """Latency histogram and error count for one (kind, name)."""
+
+    __slots__ = ("kind", "name", "counts", "total", "count", "errors", "_lock")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        bucket = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.total += seconds
+            self.count += 1
+            if error:
+                self.errors += 1
+
+    def quantile(self, q: float):
+        """Estimated from the buckets by linear interpolation, in seconds."""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        target, seen = q * count, 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= target:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (target - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._tokens = {}
+
+    def span(self, kind: str, name: str) -> Span:
+        key = (kind, name)
+        span = self._spans.get(key)
+        if span is None:
+            with self._lock:
+                span = self._spans.setdefault(key, Span(kind, name))
+        return span
+
+    def add_tokens(self, model: str, prompt: int, completion: int) -> None:
+        with self._lock:
+            totals = self._tokens.setdefault(model, [0, 0])
+            totals[0] += prompt
+            totals[1] += completion
+
+    def spans(self) -> list:
+        with self._lock:
+            return sorted(self._spans.values(), key=lambda span: (span.kind, span.name))
+
+    def tokens(self) -> dict:
+        with self._lock:
+            return {model: {"prompt": prompt, "completion": completion} for model, (prompt, completion) in self._tokens.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            for span in self._spans.values():
+                with span._lock:
+                    span.counts, span.total, span.count, span.errors = [0] * (len(BUCKETS) + 1), 0.0, 0, 0
+            self._tokens.clear()
+
+
+registry = Registry()
+
+
+# --- Wrapping ---
+def timed(kind: str, name: str, func):
+    """Wraps a sync or async function so every call is recorded under (kind, name); exceptions count as errors."""
+    if not ENABLED or func is None:
+        return func
+    span = registry.span(kind, name)
+    clock = time.perf_counter
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException:
+                span.observe(clock() - started, error=True)
+                raise
+            span.observe(clock() - started)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = clock()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            span.observe(clock() - started, error=True)
+            raise
+        span.observe(clock() - started)
+        return result
+    return wrapper
+
+
+def observe(kind: str, name: str, seconds: float, error: bool = False) -> None:
+    """Records a measurement taken elsewhere (e.g. an LLM call timed by llm_backend)."""
+    if ENABLED:
+        registry.span(kind, name).observe(seconds, error)
+
+
+def add_tokens(model: str, prompt: int, completion: int) -> None:
+    if ENABLED:
+        registry.add_tokens(model, prompt, completion)
+
+
+# --- Export ---
+def _labels(span: Span, **extra) -> str:
+    pairs = {"kind": span.kind, "name": span.name, **extra}
+    return ",".join(f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in pairs.items())
+
+
+def prometheus_text() -> str:
+    """All spans and token counters in the Prometheus text exposition format."""
+    lines = [
+        "# HELP agent_span_seconds Latency of graph nodes, tools, LLM calls and email sends.",
+        "# TYPE agent_span_seconds histogram",
+    ]
+    spans = registry.spans()
+    for span in spans:
+        with span._lock:
+            counts, total, count = list(span.counts), span.total, span.count
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"agent_span_seconds_bucket{{{_labels(span, le=le)}}} {cumulative}")
+        lines.append(f"agent_span_seconds_sum{{{_labels(span)}}} {total}")
+        lines.append(f"agent_span_seconds_count{{{_labels(span)}}} {count}")
+    lines += ["# HELP agent_span_errors_total Calls that raised.", "# TYPE agent_span_errors_total counter"]
+    lines += [f"agent_span_errors_total{{{_labels(span)}}} {span.errors}" for span in spans]
+    lines += ["# HELP agent_llm_tokens_total LLM tokens by model and direction.", "# TYPE agent_llm_tokens_total counter"]
+    for model, tokens in sorted(registry.tokens().items()):
+        for direction, value in tokens.items():
+            lines.append(f'agent_llm_tokens_total{{model="{model}",type="{direction}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """JSON-friendly summary: per-span count, errors, mean and estimated p50/p95/p99 in milliseconds."""
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    spans = []
+    for span in registry.spans():
+        spans.append({
+            "kind": span.kind, "name": span.name, "count": span.count, "errors": span.errors,
+            "mean_ms": ms(span.total / span.count) if span.count else None,
+            "p50_ms": ms(span.quantile(0.5)), "p95_ms": ms(span.quantile(0.95)), "p99_ms": ms(span.quantile(0.99)),
+        })
+    return {"spans": spans, "tokens": registry.tokens()}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """Serves /metrics and /metrics.json on a background thread (once per process); no-op when port is 0."""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"--- Metrics on http://{host}:{port}/metrics ---")
+    return _server
@@ -0,0 +1,301 @@
+# llm_backend.py
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+import httpx
+import ollama
+from langchain_core.runnables import Runnable
+from langchain_ollama.chat_models import ChatOllama
+
+import instrumentation
+
+# Owns the extraction model. The model is preloaded in the background at startup and kept
+# resident with keep_alive; calls go through a concurrency cap with a bounded queue wait,
+# a per-request timeout with retries, and a circuit breaker that fails fast while Ollama is
+# down. Latency, queueing and token counts are recorded per call.
+# Point OLLAMA_BASE_URL at `python mock_ollama.py` to run everything without a model.
+
+# --- Configuration ---
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi3:mini")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "-1")  # -1 pins the model in memory; or a duration like "30m"
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))  # Ollama serializes a small model anyway
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # max seconds to wait for a free slot
+REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY = 0.5
+BREAKER_THRESHOLD = 5  # consecutive failures that open the circuit
+BREAKER_RESET_SECONDS = 30  # how long it stays open before one trial call is let through
+LATENCY_WINDOW = 1000  # recent calls kept for percentiles
+
+RETRYABLE_ERRORS = (httpx.TransportError, ollama.ResponseError, ConnectionError)
+
+
+def _keep_alive():
+    return int(KEEP_ALIVE) if KEEP_ALIVE.lstrip("-").isdigit() else KEEP_ALIVE
+
+
+class LLMUnavailableError(Exception):
+    """The model could not be reached: circuit open, queue wait exceeded, or retries exhausted."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures, self._opened_at, self._trial_in_flight = 0, None, False
+
+    def release(self) -> None:
+        """Gives back an admitted trial call that never reached the model."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._failures >= self.threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+
+class GuardedLLM(Runnable):
+    """Runnable wrapper that applies the backend's cap, retries, breaker and metrics to a chat model."""
+
+    def __init__(self, backend: "LLMBackend"):
+        self.backend = backend
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.backend.call(input, config, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.backend.acall(input, config, **kwargs)
+
+
+class LLMBackend:
+    def __init__(self, model: str = OLLAMA_MODEL, base_url: str = OLLAMA_BASE_URL, max_concurrency: int = MAX_CONCURRENCY,
+                 timeout: float = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES):
+        self.model = model
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.chat_model = self._new_chat_model()
+        # ChatOllama's async client is bound to the loop it was first used on; keep one per loop.
+        self._async_models = weakref.WeakKeyDictionary()
+        self.llm = GuardedLLM(self)
+        self.breaker = CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {"calls": 0, "failures": 0, "retries": 0, "rejected": 0, "in_flight": 0,
+                          "prompt_tokens": 0, "completion_tokens": 0, "queue_wait_total": 0.0, "queue_wait_max": 0.0}
+        self.warm = threading.Event()
+        self.warmup_seconds = None
+        self._warmup_started = False
+
+    def _new_chat_model(self) -> ChatOllama:
+        return ChatOllama(model=self.model, base_url=self.base_url, format="json", temperature=0,
+                          keep_alive=_keep_alive(), client_kwargs={"timeout": self.timeout})
+
+    def _async_chat_model(self) -> ChatOllama:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_models:
+                self._async_models[loop] = self._new_chat_model()
+            return self._async_models[loop]
+
+    # --- Warmup ---
+    def warmup(self) -> float:
+        """Loads the model into memory (an empty generate) and pins it with keep_alive."""
+        started = time.perf_counter()
+        ollama.Client(host=self.base_url, timeout=self.timeout).generate(model=self.model, prompt="", keep_alive=_keep_alive())
+        self.warmup_seconds = time.perf_counter() - started
+        self.warm.set()
+        return self.warmup_seconds
+
+    def start_warmup(self) -> "LLMBackend":
+        """Warms up in a background thread; only the first call per backend starts one."""
+        with self._lock:
+            if self._warmup_started:
+                return self
+            self._warmup_started = True
+
+        def run():
+            try:
+                print(f"LLM {self.model} warmed up in {self.warmup():.1f}s")
+            except Exception as e:
+                print(f"LLM warmup failed ({e}); the first request will load the model")
+        threading.Thread(target=run, name="llm-warmup", daemon=True).start()
+        return self
+
+    # --- Calls ---
+    def _record(self, started: float, waited: float, result=None, failed: bool = False) -> None:
+        usage = getattr(result, "usage_metadata", None) or {}
+        with self._lock:
+            counters = self._counters
+            counters["calls"] += 1
+            counters["failures"] += failed
+            counters["queue_wait_total"] += waited
+            counters["queue_wait_max"] = max(counters["queue_wait_max"], waited)
+            counters["prompt_tokens"] += usage.get("input_tokens", 0)
+            counters["completion_tokens"] += usage.get("output_tokens", 0)
+            if not failed:
+                self._latencies.append(time.perf_counter() - started)
+        instrumentation.observe("llm", self.model, time.perf_counter() - started, failed)
+        instrumentation.add_tokens(self.model, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+    def _count(self, name: str, delta=1) -> None:
+        with self._lock:
+            self._counters[name] += delta
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise LLMUnavailableError(f"circuit open for {self.model}")
+
+    def call(self, input, config=None, **kwargs):
+        self._admit()
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            self._count("rejected")
+            self.breaker.release()
+            raise LLMUnavailableError(f"no free LLM slot within {QUEUE_TIMEOUT}s")
+        waited = time.perf_counter() - queued
+        self._count("in_flight")
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    result = self.chat_model.invoke(input, config, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    self._record(started, waited, failed=True)
+                    if attempt == self.max_retries:
+                        self.breaker.record_failure()
+                        raise LLMUnavailableError(str(e)) from e
+                    self._count("retries")
+                    time.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+                    continue
+                except Exception:
+                    self._record(started, waited, failed=True)
+                    self.breaker.record_failure()
+                    raise
+                self._record(started, waited, result)
+                self.breaker.record_success()
+                return result
+        finally:
+            self._count("in_flight", -1)
+            self._slots.release()
+
+    async def _aacquire(self) -> bool:
+        # One cap for sync and async callers: poll the shared semaphore instead of blocking a thread.
+        deadline, delay = time.monotonic() + QUEUE_TIMEOUT, 0.005
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return True
+
+    async def acall(self, input, config=None, **kwargs):
+        self._admit()
+        queued = time.perf_counter()
+        if not await self._aacquire():
+            self._count("rejected")
+            self.breaker.release()
+            raise LLMUnavailableError(f"no free LLM slot within {QUEUE_TIMEOUT}s")
+        waited = time.perf_counter() - queued
+        self._count("in_flight")
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    result = await self._async_chat_model().ainvoke(input, config, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    self._record(started, waited, failed=True)
+                    if attempt == self.max_retries:
+                        self.breaker.record_failure()
+                        raise LLMUnavailableError(str(e)) from e
+                    self._count("retries")
+                    await asyncio.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+                    continue
+                except Exception:
+                    self._record(started, waited, failed=True)
+                    self.breaker.record_failure()
+                    raise
+                self._record(started, waited, result)
+                self.breaker.record_success()
+                return result
+        finally:
+            self._count("in_flight", -1)
+            self._slots.release()
+
+    # --- Metrics ---
+    def metrics(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+        successes = counters["calls"] - counters["failures"]
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+
+        return {
+            "model": self.model,
+            "warm": self.warm.is_set(),
+            "warmup_seconds": self.warmup_seconds,
+            "breaker": self.breaker.state,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": counters["in_flight"],
+            "calls": counters["calls"],
+            "failures": counters["failures"],
+            "retries": counters["retries"],
+            "rejected": counters["rejected"],
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "avg_queue_wait_ms": counters["queue_wait_total"] / counters["calls"] * 1000 if counters["calls"] else 0.0,
+            "max_queue_wait_ms": counters["queue_wait_max"] * 1000,
+            "prompt_tokens": counters["prompt_tokens"],
+            "completion_tokens": counters["completion_tokens"],
+            "avg_completion_tokens": counters["completion_tokens"] / successes if successes else 0.0,
+        }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """The process-wide backend, created on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = LLMBackend()
+    return _backend
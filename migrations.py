@@ -0,0 +1,274 @@
+# migrations.py
+
+import sqlite3
+import sys
+from patient_index import normalize_name
+
+# Versioned schema migrations. The applied version is stored in SQLite's
+# `PRAGMA user_version`, so existing clinic.db files are upgraded in place.
+DB_FILE = "data/clinic.db"
+
+
+def _column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def _create_base_tables(conn):
+    """ The original tables from setup_database.py (no-op on existing databases) """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS Patients (
+        PatientID INTEGER PRIMARY KEY AUTOINCREMENT,
+        FullName TEXT NOT NULL,
+        DateOfBirth TEXT NOT NULL,
+        Email TEXT,
+        PhoneNumber TEXT
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS DoctorSchedules (
+        ScheduleID INTEGER PRIMARY KEY AUTOINCREMENT,
+        DoctorName TEXT NOT NULL,
+        StartTime TEXT NOT NULL,
+        EndTime TEXT NOT NULL,
+        Status TEXT NOT NULL DEFAULT 'Available'
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS Appointments (
+        AppointmentID INTEGER PRIMARY KEY AUTOINCREMENT,
+        PatientID INTEGER,
+        DoctorName TEXT NOT NULL,
+        AppointmentTime TEXT NOT NULL,
+        Duration INTEGER NOT NULL,
+        InsuranceCarrier TEXT,
+        MemberID TEXT,
+        Status TEXT NOT NULL,
+        FOREIGN KEY (PatientID) REFERENCES Patients (PatientID)
+    )""")
+
+
+def _add_forms_filled_and_hot_path_indexes(conn):
+    """ FormsFilled for the reminder manager, plus indexes for slot, patient and reminder lookups """
+    if not _column_exists(conn, "Appointments", "FormsFilled"):
+        conn.execute("ALTER TABLE Appointments ADD COLUMN FormsFilled INTEGER DEFAULT 0")
+    # find_slots_tool: Status = 'Available' AND StartTime > ? ORDER BY StartTime (covering)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_schedules_status_start ON DoctorSchedules (Status, StartTime, DoctorName, EndTime)")
+    # book_appointment_tool: DoctorName = ? AND StartTime >= ? AND StartTime < ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_schedules_doctor_start ON DoctorSchedules (DoctorName, StartTime)")
+    # search_patient_tool: DateOfBirth = ? AND FullName ...
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_dob_name ON Patients (DateOfBirth, FullName)")
+    # reminder_manager: Status = ? AND AppointmentTime BETWEEN ? AND ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_status_time ON Appointments (Status, AppointmentTime)")
+
+
+def _add_normalized_patient_names(conn):
+    """ NormalizedName for indexed exact patient lookup (see patient_index.py) """
+    if not _column_exists(conn, "Patients", "NormalizedName"):
+        conn.execute("ALTER TABLE Patients ADD COLUMN NormalizedName TEXT")
+    conn.create_function("normalize_name", 1, normalize_name, deterministic=True)
+    conn.execute("UPDATE Patients SET NormalizedName = normalize_name(FullName) WHERE NormalizedName IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_name_dob ON Patients (NormalizedName, DateOfBirth)")
+
+
+def _add_doctor_slot_index(conn):
+    """ One-doctor slot search and the contiguous-row probes: DoctorName = ? AND Status = 'Available' AND StartTime ... (covering) """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_schedules_doctor_status_start ON DoctorSchedules (DoctorName, Status, StartTime, EndTime)")
+
+
+def _create_email_outbox(conn):
+    """ Durable queue of outgoing emails (see email_outbox.py) """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS EmailOutbox (
+        OutboxID INTEGER PRIMARY KEY AUTOINCREMENT,
+        PatientID INTEGER,
+        Recipient TEXT NOT NULL,
+        Subject TEXT NOT NULL,
+        Body TEXT NOT NULL,
+        AttachmentPath TEXT,
+        Status TEXT NOT NULL DEFAULT 'Pending', -- Pending, Sending, Sent, Failed
+        Attempts INTEGER NOT NULL DEFAULT 0,
+        NextAttemptAt TEXT NOT NULL,
+        LastError TEXT,
+        CreatedAt TEXT NOT NULL,
+        SentAt TEXT,
+        ClaimToken TEXT -- the worker holding the lease; results are only written under it
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON EmailOutbox (Status, NextAttemptAt)")
+
+
+def _create_appointment_change_feed(conn):
+    """ Append-only feed of inserted/changed appointments, consumed by the reminder daemon """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS AppointmentChanges (
+        ChangeID INTEGER PRIMARY KEY AUTOINCREMENT,
+        AppointmentID INTEGER NOT NULL,
+        ChangedAt TEXT -- lets one-shot reminder runs prune entries a daemon has long consumed
+    )""")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_appointments_insert_feed AFTER INSERT ON Appointments
+    BEGIN
+        INSERT INTO AppointmentChanges (AppointmentID, ChangedAt) VALUES (NEW.AppointmentID, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'));
+    END""")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_appointments_update_feed AFTER UPDATE OF Status, AppointmentTime ON Appointments
+    BEGIN
+        INSERT INTO AppointmentChanges (AppointmentID, ChangedAt) VALUES (NEW.AppointmentID, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'));
+    END""")
+
+
+def _create_export_watermarks(conn):
+    """ Last exported AppointmentID per named export, plus indexes for filtered exports (see report_export.py) """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ExportWatermarks (
+        ExportName TEXT PRIMARY KEY,
+        LastAppointmentID INTEGER NOT NULL,
+        UpdatedAt TEXT NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_time ON Appointments (AppointmentTime)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_time ON Appointments (DoctorName, AppointmentTime)")
+
+
+def _create_slot_holds(conn):
+    """ Short-lived reservations of schedule rows while a patient finishes a booking (see slot_holds.py) """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS SlotHolds (
+        ScheduleID INTEGER PRIMARY KEY REFERENCES DoctorSchedules (ScheduleID),
+        HoldToken TEXT NOT NULL,
+        ExpiresAt TEXT NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_slot_holds_token ON SlotHolds (HoldToken)")
+    # The sweeper: ExpiresAt <= now
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_slot_holds_expires ON SlotHolds (ExpiresAt)")
+
+
+MIGRATIONS = [
+    (1, "Create base tables", _create_base_tables),
+    (2, "Add FormsFilled and hot-path indexes", _add_forms_filled_and_hot_path_indexes),
+    (3, "Add normalized patient names", _add_normalized_patient_names),
+    (4, "Add doctor slot search index", _add_doctor_slot_index),
+    (5, "Create email outbox", _create_email_outbox),
+    (6, "Create appointment change feed", _create_appointment_change_feed),
+    (7, "Create export watermarks", _create_export_watermarks),
+    (8, "Create slot holds", _create_slot_holds),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, verbose: bool = False) -> int:
+    """
+    Applies all pending migrations, each in its own transaction, and returns the final version.
+    Safe to call from several processes at once: the version is re-read under a write lock.
+    """
+    if get_version(conn) >= LATEST_VERSION:
+        return get_version(conn)
+    for version, description, apply in MIGRATIONS:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if verbose:
+            print(f"Applied migration {version}: {description}")
+    return get_version(conn)
+
+
+# --- Query plan checks for the hot queries ---
+HOT_QUERIES = {
+    "find_slots": (
+        "SELECT s0.DoctorName, s0.StartTime, s0.EndTime, s0.ScheduleID FROM DoctorSchedules s0 WHERE s0.Status = 'Available' AND s0.StartTime > ? "
+        "AND NOT EXISTS (SELECT 1 FROM SlotHolds h WHERE h.ScheduleID = s0.ScheduleID AND h.HoldToken != ? AND h.ExpiresAt > ?) "
+        "ORDER BY s0.StartTime, s0.DoctorName LIMIT ?",
+        ("2000-01-01 00:00", "", "2000-01-01 00:00:00", 10),
+    ),
+    "find_slots_60": (
+        "SELECT s0.DoctorName, s0.StartTime, s1.EndTime, s0.ScheduleID, s1.ScheduleID FROM DoctorSchedules s0 "
+        "JOIN DoctorSchedules s1 ON s1.DoctorName = s0.DoctorName AND s1.StartTime = s0.EndTime AND s1.Status = 'Available' "
+        "WHERE s0.Status = 'Available' AND s0.StartTime > ? "
+        "AND NOT EXISTS (SELECT 1 FROM SlotHolds h WHERE h.ScheduleID = s0.ScheduleID AND h.HoldToken != ? AND h.ExpiresAt > ?) "
+        "AND NOT EXISTS (SELECT 1 FROM SlotHolds h WHERE h.ScheduleID = s1.ScheduleID AND h.HoldToken != ? AND h.ExpiresAt > ?) "
+        "ORDER BY s0.StartTime, s0.DoctorName LIMIT ?",
+        ("2000-01-01 00:00", "", "2000-01-01 00:00:00", "", "2000-01-01 00:00:00", 5),
+    ),
+    "find_slots_doctor": (
+        "SELECT s0.DoctorName, s0.StartTime, s0.EndTime, s0.ScheduleID FROM DoctorSchedules s0 "
+        "WHERE s0.Status = 'Available' AND s0.StartTime > ? AND s0.DoctorName = ? "
+        "AND NOT EXISTS (SELECT 1 FROM SlotHolds h WHERE h.ScheduleID = s0.ScheduleID AND h.HoldToken != ? AND h.ExpiresAt > ?) "
+        "ORDER BY s0.StartTime, s0.DoctorName LIMIT ?",
+        ("2000-01-01 00:00", "Dr. Smith", "", "2000-01-01 00:00:00", 10),
+    ),
+    "book_slot": (
+        "UPDATE DoctorSchedules SET Status = 'Booked' WHERE ScheduleID IN (?, ?) AND DoctorName = ? AND Status = 'Available' "
+        "AND NOT EXISTS (SELECT 1 FROM SlotHolds h WHERE h.ScheduleID = DoctorSchedules.ScheduleID AND h.HoldToken != ? AND h.ExpiresAt > ?)",
+        (1, 2, "Dr. Smith", "", "2000-01-01 00:00:00"),
+    ),
+    "expired_holds": (
+        "SELECT h.HoldToken, s.ScheduleID, s.DoctorName, s.StartTime, s.Status FROM SlotHolds h CROSS JOIN DoctorSchedules s ON s.ScheduleID = h.ScheduleID WHERE h.ExpiresAt <= ?",
+        ("2000-01-01 00:00:00",),
+    ),
+    "held_rows": (
+        "SELECT s.ScheduleID, s.DoctorName, s.StartTime, s.Status FROM SlotHolds h JOIN DoctorSchedules s ON s.ScheduleID = h.ScheduleID WHERE h.HoldToken = ?",
+        ("",),
+    ),
+    "search_patient": (
+        "SELECT PatientID, FullName, DateOfBirth, Email, PhoneNumber FROM Patients WHERE NormalizedName = ? AND DateOfBirth = ?",
+        ("john smith", "1990-01-01"),
+    ),
+    "search_patient_fuzzy": (
+        "SELECT PatientID, FullName, DateOfBirth, Email, PhoneNumber, NormalizedName FROM Patients WHERE DateOfBirth = ?",
+        ("1990-01-01",),
+    ),
+    "reminder_scan": (
+        "SELECT a.AppointmentID, a.Status, a.AppointmentTime, a.FormsFilled, p.FullName, p.PhoneNumber, p.Email "
+        "FROM Appointments a JOIN Patients p ON a.PatientID = p.PatientID "
+        "WHERE a.Status = ? AND a.AppointmentTime BETWEEN ? AND ? "
+        "AND (a.AppointmentTime, a.AppointmentID) > (?, ?) ORDER BY a.AppointmentTime, a.AppointmentID LIMIT ?",
+        ("Confirmed", "2000-01-02 00:00", "2000-01-04 00:00", "", 0, 1000),
+    ),
+}
+
+
+# Hot queries that some index serves, but only this one serves well.
+PINNED_INDEXES = {
+    # idx_schedules_status_start also works, by filtering every doctor's free rows by name.
+    "find_slots_doctor": "idx_schedules_doctor_status_start",
+}
+
+
+def check_query_plans(conn) -> dict:
+    """Runs EXPLAIN QUERY PLAN on each hot query; returns {name: (uses_index, plan lines)}."""
+    results = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        uses_index = all(
+            "USING" in line and ("INDEX" in line or "PRIMARY KEY" in line)
+            for line in plan if line.startswith(("SCAN", "SEARCH"))
+        ) and not any("USE TEMP B-TREE" in line for line in plan)
+        if name in PINNED_INDEXES:
+            uses_index = uses_index and any(PINNED_INDEXES[name] in line for line in plan)
+        results[name] = (uses_index, plan)
+    return results
+
+
+if __name__ == '__main__':
+    db_file = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("--") else DB_FILE
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    print(f"Schema version before: {get_version(conn)}")
+    print(f"Schema version after: {migrate(conn, verbose=True)}")
+    if "--check" in sys.argv:
+        all_indexed = True
+        for name, (uses_index, plan) in check_query_plans(conn).items():
+            all_indexed &= uses_index
+            print(f"[{'OK' if uses_index else 'SCAN'}] {name}: {' | '.join(plan)}")
+        conn.close()
+        sys.exit(0 if all_indexed else 1)
+    conn.close()
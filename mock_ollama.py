@@ -0,0 +1,202 @@
+# mock_ollama.py
+
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fast_extract import FIELD_EXTRACTORS, extract_fields, leading_name
+
+# Offline stand-in for the parts of the Ollama HTTP API the agent uses (/api/chat,
+# /api/generate, /api/tags, /api/ps, /api/version). Extraction requests are answered with
+# the regex extractor, so the full graph runs without a model. The server mimics the
+# behaviour that matters for load tests: a model load delay when the model isn't resident,
+# keep_alive residency, a fixed number of parallel requests, per-request latency and
+# streamed NDJSON responses with token counts.
+# With --synthesize, requested fields the rules can't find get plausible fake values, so
+# load tests can drive conversations whose messages carry no real details.
+# Usage: python mock_ollama.py --port 11434 --latency 0.3 --load-time 5
+
+DEFAULT_PORT = 11434
+
+
+def synthetic_value(field: str, text: str):
+    tag = zlib.crc32(text.encode()) % 100000
+    return {
+        "full_name": f"Test Patient {tag}",
+        "date_of_birth": "1980-01-01",
+        "email": f"patient{tag}@example.com",
+        "phone_number": "5550100100",
+        "insurance_carrier": "Aetna",
+        "member_id": f"M{tag}",
+    }.get(field)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _keep_alive_seconds(value, default=300.0) -> float:
+    """Ollama keep_alive: negative keeps the model loaded forever, numbers are seconds, or '5m' / '1h' / '30s'."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(value).strip())
+    if not match:
+        return default
+    number = float(match.group(1))
+    return float("inf") if number < 0 else number * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+class MockModelHost:
+    """Model residency, parallelism and request counters shared by all handler threads."""
+
+    def __init__(self, latency: float, load_time: float, parallel: int, synthesize: bool = False):
+        self.latency = latency
+        self.synthesize = synthesize
+        self.load_time = load_time
+        self._slots = threading.Semaphore(parallel)
+        self._lock = threading.Lock()
+        self._loaded_until = {}
+        self.requests = 0
+        self.loads = 0
+
+    def ensure_loaded(self, model: str, keep_alive) -> float:
+        """Blocks for the load time if `model` isn't resident; returns the load duration in seconds."""
+        with self._lock:
+            resident = self._loaded_until.get(model, 0) > time.monotonic()
+            self._loaded_until[model] = time.monotonic() + max(self.load_time, 0) + _keep_alive_seconds(keep_alive)
+            if not resident:
+                self.loads += 1
+        if resident:
+            return 0.0
+        time.sleep(self.load_time)
+        return self.load_time
+
+    def loaded_models(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [model for model, until in self._loaded_until.items() if until > now]
+
+    def answer(self, messages: list, schema) -> str:
+        text = messages[-1].get("content", "") if messages else ""
+        if "TEXT:\n" in text:
+            text = text.split("TEXT:\n", 1)[1]
+        fields = list(schema.get("properties", {})) if isinstance(schema, dict) else list(FIELD_EXTRACTORS)
+        found = extract_fields(text, fields)
+        # The rules leave bare names to the model; answer them the way a model would.
+        if "full_name" in fields and "full_name" not in found and leading_name(text):
+            found["full_name"] = leading_name(text)
+        if self.synthesize:
+            found = {**{field: synthetic_value(field, text) for field in fields}, **found}
+        return json.dumps(found)
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    host: MockModelHost = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, parts: list) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for part in parts:
+            line = (json.dumps(part) + "\n").encode()
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-mock"})
+        elif self.path in ("/api/tags", "/api/ps"):
+            self._send_json({"models": [{"name": model, "model": model} for model in self.host.loaded_models()]})
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = request.get("model", "mock")
+        if self.path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {"family": "mock"}})
+            return
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+            return
+        with self.host._lock:
+            self.host.requests += 1
+        started = time.perf_counter()
+        with self.host._slots:
+            load_duration = self.host.ensure_loaded(model, request.get("keep_alive"))
+            if self.path == "/api/generate" and not request.get("prompt"):
+                # An empty prompt only loads the model (used for warmup).
+                content, prompt_chars = "", 0
+            else:
+                time.sleep(self.host.latency)
+                if self.path == "/api/chat":
+                    messages = request.get("messages", [])
+                    content = self.host.answer(messages, request.get("format"))
+                    prompt_chars = sum(len(message.get("content", "")) for message in messages)
+                else:
+                    content = self.host.answer([{"content": request.get("prompt", "")}], request.get("format"))
+                    prompt_chars = len(request.get("prompt", ""))
+        final = {
+            "model": model, "created_at": _now(), "done": True, "done_reason": "stop" if content else "load",
+            "total_duration": int((time.perf_counter() - started) * 1e9), "load_duration": int(load_duration * 1e9),
+            "prompt_eval_count": max(1, prompt_chars // 4), "eval_count": max(1, len(content) // 4),
+        }
+        key = "message" if self.path == "/api/chat" else "response"
+
+        def body(text):
+            return {"role": "assistant", "content": text} if key == "message" else text
+
+        if not request.get("stream", True):
+            self._send_json({**final, key: body(content)})
+            return
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        parts = [{"model": model, "created_at": _now(), "done": False, key: body(piece)} for piece in pieces]
+        self._send_stream(parts + [{**final, key: body("")}])
+
+
+def serve(port: int = DEFAULT_PORT, latency: float = 0.3, load_time: float = 0.0, parallel: int = 1,
+          synthesize: bool = False, host: str = "127.0.0.1"):
+    """Starts the mock server on a background thread; returns the server (call .shutdown() to stop)."""
+    handler = type("Handler", (MockOllamaHandler,), {"host": MockModelHost(latency, load_time, parallel, synthesize)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-ollama", daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mock Ollama server for offline load tests")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per inference request")
+    parser.add_argument("--load-time", type=float, default=0.0, help="seconds to 'load' a model that isn't resident")
+    parser.add_argument("--parallel", type=int, default=1, help="requests processed at once (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--synthesize", action="store_true", help="fill fields the rules can't find with fake values")
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.load_time, args.parallel, args.synthesize)
+    print(f"--- Mock Ollama listening on http://127.0.0.1:{args.port} ---")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Requests: {server.RequestHandlerClass.host.requests}, model loads: {server.RequestHandlerClass.host.loads}")
+    except KeyboardInterrupt:
+        server.shutdown()
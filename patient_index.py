@@ -0,0 +1,92 @@
+# patient_index.py
+
+import re
+import unicodedata
+
+# Patient lookup by name + date of birth.
+# Exact matches go through idx_patients_name_dob on the normalized name. Otherwise the
+# DOB index narrows the search to the handful of patients sharing a birthday, and those
+# are ranked by character-trigram similarity, which tolerates typos and name order.
+# A fuzzy hit can be a different person sharing the birthday ("Jane Smith" for "John
+# Smith"), so callers only identify it once the patient confirms a contact on file.
+
+FUZZY_THRESHOLD = 0.45
+MAX_CANDIDATES = 5
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+_NON_DIGIT_RE = re.compile(r"\D+")
+_TITLES = {"mr", "mrs", "ms", "miss", "dr", "prof"}
+
+PATIENT_COLUMNS = "PatientID, FullName, DateOfBirth, Email, PhoneNumber"
+
+
+def normalize_name(full_name: str) -> str:
+    """Case-folds, strips accents, punctuation and titles, and sorts tokens: 'Smith, John' -> 'john smith'."""
+    if not full_name:
+        return ""
+    text = unicodedata.normalize("NFKD", full_name).encode("ascii", "ignore").decode("ascii").casefold()
+    tokens = [token for token in _NON_ALNUM_RE.split(text) if token and token not in _TITLES]
+    return " ".join(sorted(tokens))
+
+
+def name_trigrams(normalized_name: str) -> set:
+    trigrams = set()
+    for token in normalized_name.split():
+        padded = f"  {token} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def name_similarity(query: str, candidate: str) -> float:
+    """Jaccard similarity of the trigram sets of two normalized names, boosted for partial names."""
+    if not query or not candidate:
+        return 0.0
+    if query == candidate:
+        return 1.0
+    query_trigrams, candidate_trigrams = name_trigrams(query), name_trigrams(candidate)
+    score = len(query_trigrams & candidate_trigrams) / len(query_trigrams | candidate_trigrams)
+    # Keep the old substring behaviour: "Smith" still finds "John Smith".
+    if set(query.split()) <= set(candidate.split()):
+        score = max(score, 0.9)
+    return score
+
+
+def _row_to_patient(row, score, match):
+    return {
+        "patient_id": row[0],
+        "full_name": row[1],
+        "date_of_birth": row[2],
+        "email": row[3],
+        "phone_number": row[4],
+        "score": round(score, 3),
+        "match": match,
+    }
+
+
+def find_patients(conn, full_name: str, date_of_birth: str, limit: int = MAX_CANDIDATES) -> list:
+    """Returns up to `limit` ranked candidates for a name and DOB, best first."""
+    normalized = normalize_name(full_name)
+    rows = conn.execute(
+        f"SELECT {PATIENT_COLUMNS} FROM Patients WHERE NormalizedName = ? AND DateOfBirth = ? ORDER BY PatientID LIMIT ?",
+        (normalized, date_of_birth, limit),
+    ).fetchall()
+    if rows:
+        return [_row_to_patient(row, 1.0, "exact") for row in rows]
+
+    scored = []
+    for row in conn.execute(f"SELECT {PATIENT_COLUMNS}, NormalizedName FROM Patients WHERE DateOfBirth = ?", (date_of_birth,)):
+        score = name_similarity(normalized, row[5] or normalize_name(row[1]))
+        if score >= FUZZY_THRESHOLD:
+            scored.append((score, row))
+    scored.sort(key=lambda item: (-item[0], item[1][0]))
+    return [_row_to_patient(row, score, "fuzzy") for score, row in scored[:limit]]
+
+
+def contact_matches(patient: dict, email: str = None, phone_number: str = None) -> bool:
+    """True if `email` or `phone_number` matches the patient's record (case and punctuation ignored)."""
+    if email and patient.get("email") and email.strip().casefold() == patient["email"].strip().casefold():
+        return True
+    digits = _NON_DIGIT_RE.sub("", phone_number or "")
+    on_file = _NON_DIGIT_RE.sub("", patient.get("phone_number") or "")
+    # Compare the last 10 digits so "+1 555-..." matches "555-...".
+    return len(digits) >= 7 and digits[-10:] == on_file[-10:]
@@ -0,0 +1,7 @@
+# prompts.py
+
+# Fixed text the agent sends. Kept free of heavy imports so app.py can show the greeting
+# for a new conversation before agent.py (langchain, langgraph, the tools) is loaded.
+
+GREETING = ("Hello! To book an appointment, please provide your **full name** and **date of birth** (YYYY-MM-DD). "
+            "You can also include your email and phone number to speed things up.")
@@ -1,126 +1,353 @@
 # reminder_manager.py
 
+import argparse
+import heapq
+import json
+import os
 import sqlite3
+import threading
 from datetime import datetime, timedelta
+from db import connection, transaction
 
 DB_FILE = "data/clinic.db"
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+CHUNK_SIZE = 1000  # appointments classified, sent and updated per transaction
+DAEMON_POLL_INTERVAL = 30.0  # max seconds between checks of the appointment change feed
+# One-shot runs scan every appointment themselves, so they only prune the change feed; they
+# leave the newest entries for a daemon that may be polling it (every DAEMON_POLL_INTERVAL).
+CHANGE_FEED_RETENTION = timedelta(hours=24)
 
-# NOTE: This script assumes you've added a 'FormsFilled' column to your 'Appointments' table.
-# You can add it with the following SQL command:
-# ALTER TABLE Appointments ADD COLUMN FormsFilled INTEGER DEFAULT 0;
+# NOTE: The 'FormsFilled' column on 'Appointments' is added by migrations.py,
+# which runs automatically the first time the database is opened through db.py.
 
-def handle_first_reminders(cursor):
+# Reminder stages: the status an appointment must be in, and the status it moves to.
+STAGE_STATUSES = {
+    1: ("Confirmed", "Reminder 1 Sent"),
+    2: ("Reminder 1 Sent", "Reminder 2 Sent"),
+    3: ("Reminder 2 Sent", "Reminder 3 Sent"),
+}
+
+
+def simulate_notification(channel, recipient, subject, body):
+    """ SIMULATE SENDING SMS/EMAIL """
+    if channel == "SMS":
+        print(f"      - SIMULATING SMS to {recipient}: {body}")
+    else:
+        print(f"      - SIMULATING EMAIL to {recipient}: Subject: {subject}. Body: {body}")
+
+
+def reminder_windows(now):
+    """ The time boundaries used by classify_reminder, as strings comparable with AppointmentTime """
+    return {
+        "now": now.strftime(TIME_FORMAT),
+        "four_hours": (now + timedelta(hours=4)).strftime(TIME_FORMAT),
+        "one_day": (now + timedelta(days=1)).strftime(TIME_FORMAT),
+        "three_days": (now + timedelta(days=3)).strftime(TIME_FORMAT),
+    }
+
+
+def classify_reminder(status, appointment_time, windows):
+    """
+    Returns the reminder stage (1, 2 or 3) due for an appointment, or None.
+    Stage 1: 'Confirmed' and 1-3 days away.
+    Stage 2: 'Reminder 1 Sent' and within 24 hours.
+    Stage 3: 'Reminder 2 Sent' and within 4 hours.
+    """
+    if status == "Confirmed" and windows["one_day"] <= appointment_time <= windows["three_days"]:
+        return 1
+    if status == "Reminder 1 Sent" and appointment_time <= windows["one_day"]:
+        return 2
+    if status == "Reminder 2 Sent" and windows["now"] <= appointment_time <= windows["four_hours"]:
+        return 3
+    return None
+
+
+def send_first_reminder(name, phone, email, time_str, forms_filled, notify=simulate_notification):
     """
     Sends the initial reminder for appointments 1-3 days away.
-    Trigger: Status is 'Confirmed'.
-    Action: Sends a simple reminder and updates status to 'Reminder 1 Sent'.
-    """
-    print("\n[1] Checking for initial reminders (1-3 days out)...")
-    now = datetime.now()
-    one_day_from_now = now + timedelta(days=1)
-    three_days_from_now = now + timedelta(days=3)
-
-    cursor.execute("""
-        SELECT a.AppointmentID, p.FullName, p.PhoneNumber, p.Email, a.AppointmentTime
-        FROM Appointments a
-        JOIN Patients p ON a.PatientID = p.PatientID
-        WHERE a.Status = 'Confirmed' AND a.AppointmentTime BETWEEN ? AND ?
-    """, (one_day_from_now, three_days_from_now))
-    
-    appointments = cursor.fetchall()
-    if not appointments:
-        print("   -> No appointments need a first reminder.")
-        return 0
-
-    for appt_id, name, phone, email, time_str in appointments:
-        print(f"   -> Processing 1st reminder for {name} at {time_str}")
-        # SIMULATE SENDING SMS/EMAIL
-        print(f"      - SIMULATING SMS to {phone}: Hi {name}, this is a friendly reminder for your appointment on {time_str}.")
-        print(f"      - SIMULATING EMAIL to {email}: Subject: Appointment Reminder. Body: ...")
-        
-        cursor.execute("UPDATE Appointments SET Status = 'Reminder 1 Sent' WHERE AppointmentID = ?", (appt_id,))
-    return len(appointments)
-
-def handle_second_reminders(cursor):
+    Action: Sends a simple reminder.
+    """
+    notify("SMS", phone, None, f"Hi {name}, this is a friendly reminder for your appointment on {time_str}.")
+    notify("EMAIL", email, "Appointment Reminder", "...")
+
+
+def send_second_reminder(name, phone, email, time_str, forms_filled, notify=simulate_notification):
     """
     Sends the 24-hour reminder with action items.
-    Trigger: Status is 'Reminder 1 Sent' and appointment is within 24 hours.
-    Action: Checks form status, asks for confirmation, and updates status to 'Reminder 2 Sent'.
-    """
-    print("\n[2] Checking for second reminders (< 24 hours out)...")
-    now = datetime.now()
-    one_day_from_now = now + timedelta(days=1)
-
-    cursor.execute("""
-        SELECT a.AppointmentID, p.FullName, p.PhoneNumber, p.Email, a.AppointmentTime, a.FormsFilled
-        FROM Appointments a
-        JOIN Patients p ON a.PatientID = p.PatientID
-        WHERE a.Status = 'Reminder 1 Sent' AND a.AppointmentTime <= ?
-    """, (one_day_from_now,))
-
-    appointments = cursor.fetchall()
-    if not appointments:
-        print("   -> No appointments need a second reminder.")
-        return 0
-
-    for appt_id, name, phone, email, time_str, forms_filled in appointments:
-        print(f"   -> Processing 2nd reminder for {name} at {time_str}")
-        
-        # Action 1: Check if forms are filled
-        if forms_filled:
-            form_message = "We see you've already completed your intake forms - thank you!"
-        else:
-            form_message = "Please remember to fill out your patient intake forms sent to your email to ensure a quick check-in."
+    Action: Checks form status and asks for confirmation.
+    """
+    # Action 1: Check if forms are filled
+    if forms_filled:
+        form_message = "We see you've already completed your intake forms - thank you!"
+    else:
+        form_message = "Please remember to fill out your patient intake forms sent to your email to ensure a quick check-in."
 
-        # Action 2: Ask for confirmation
-        confirmation_prompt = "Please reply YES to confirm your visit, or call us to reschedule."
+    # Action 2: Ask for confirmation
+    confirmation_prompt = "Please reply YES to confirm your visit, or call us to reschedule."
 
-        # SIMULATE SENDING SMS/EMAIL
-        full_message = f"Hi {name}, your appointment is tomorrow at {time_str}. {form_message} {confirmation_prompt}"
-        print(f"      - SIMULATING SMS to {phone}: {full_message}")
-        print(f"      - SIMULATING EMAIL to {email}: Subject: Action Required: Confirm Your Appointment Tomorrow. Body: {full_message}")
+    full_message = f"Hi {name}, your appointment is tomorrow at {time_str}. {form_message} {confirmation_prompt}"
+    notify("SMS", phone, None, full_message)
+    notify("EMAIL", email, "Action Required: Confirm Your Appointment Tomorrow", full_message)
 
-        cursor.execute("UPDATE Appointments SET Status = 'Reminder 2 Sent' WHERE AppointmentID = ?", (appt_id,))
-    return len(appointments)
 
-def handle_third_reminders(cursor):
+def send_third_reminder(name, phone, email, time_str, forms_filled, notify=simulate_notification):
     """
     Sends the final reminder a few hours before the appointment.
-    Trigger: Status is 'Reminder 2 Sent' and appointment is within 4 hours.
-    Action: Sends a final "see you soon" message and updates status to 'Reminder 3 Sent'.
-    """
-    print("\n[3] Checking for final reminders (< 4 hours out)...")
-    now = datetime.now()
-    four_hours_from_now = now + timedelta(hours=4)
-
-    cursor.execute("""
-        SELECT a.AppointmentID, p.FullName, p.PhoneNumber, p.Email, a.AppointmentTime, a.FormsFilled
-        FROM Appointments a
-        JOIN Patients p ON a.PatientID = p.PatientID
-        WHERE a.Status = 'Reminder 2 Sent' AND a.AppointmentTime BETWEEN ? AND ?
-    """, (now, four_hours_from_now))
-    
-    appointments = cursor.fetchall()
-    if not appointments:
-        print("   -> No appointments need a final reminder.")
-        return 0
-        
-    for appt_id, name, phone, email, time_str, forms_filled in appointments:
-        print(f"   -> Processing 3rd (final) reminder for {name} at {time_str}")
-
-        if forms_filled:
-            form_message = "" # Don't bother them if they've already done it
-        else:
-            form_message = "PS: To speed up your check-in, please complete your intake forms before you arrive."
-        
-        full_message = f"Hi {name}, we look forward to seeing you for your appointment in a few hours at {time_str}. {form_message}"
-        
-        # SIMULATE SENDING SMS/EMAIL
-        print(f"      - SIMULATING SMS to {phone}: {full_message}")
-        print(f"      - SIMULATING EMAIL to {email}: Subject: See You Soon! Your Appointment is Today. Body: {full_message}")
-        
-        cursor.execute("UPDATE Appointments SET Status = 'Reminder 3 Sent' WHERE AppointmentID = ?", (appt_id,))
-    return len(appointments)
+    Action: Sends a final "see you soon" message.
+    """
+    if forms_filled:
+        form_message = "" # Don't bother them if they've already done it
+    else:
+        form_message = "PS: To speed up your check-in, please complete your intake forms before you arrive."
+
+    full_message = f"Hi {name}, we look forward to seeing you for your appointment in a few hours at {time_str}. {form_message}"
+    notify("SMS", phone, None, full_message)
+    notify("EMAIL", email, "See You Soon! Your Appointment is Today", full_message)
+
+
+STAGE_SENDERS = {1: send_first_reminder, 2: send_second_reminder, 3: send_third_reminder}
+
+APPOINTMENT_QUERY = """
+    SELECT a.AppointmentID, a.Status, a.AppointmentTime, a.FormsFilled, p.FullName, p.PhoneNumber, p.Email
+    FROM Appointments a
+    JOIN Patients p ON a.PatientID = p.PatientID
+"""
+
+
+def _apply_transitions(db_file, transitions):
+    """ Moves a chunk of appointments to their next status in one transaction """
+    with transaction(db_file) as conn:
+        # The Status guard keeps a concurrent run from moving an appointment twice.
+        conn.executemany("UPDATE Appointments SET Status = ? WHERE AppointmentID = ? AND Status = ?", transitions)
+
+
+# One stage's candidates in (AppointmentTime, AppointmentID) order, a chunk at a time after the
+# last row seen; the window only narrows the scan, classify_reminder still decides.
+STAGE_CHUNK_QUERY = (f"{APPOINTMENT_QUERY} WHERE a.Status = ? AND a.AppointmentTime BETWEEN ? AND ? "
+                     "AND (a.AppointmentTime, a.AppointmentID) > (?, ?) ORDER BY a.AppointmentTime, a.AppointmentID LIMIT ?")
+
+
+def stage_windows(windows):
+    """ (low, high) AppointmentTime bounds of each stage's candidates, as in classify_reminder """
+    return {
+        1: (windows["one_day"], windows["three_days"]),
+        2: ("", windows["one_day"]),
+        3: (windows["now"], windows["four_hours"]),
+    }
+
+
+def process_due_reminders(db_file=DB_FILE, now=None, notify=simulate_notification, chunk_size=CHUNK_SIZE, verbose=True):
+    """
+    Pages through every appointment that might need a reminder, one stage at a time, sends the
+    due reminder and applies the status transitions in chunked transactions.
+    Returns {stage: count}.
+    """
+    windows = reminder_windows(now or datetime.now())
+    counts = {1: 0, 2: 0, 3: 0}
+    # Each chunk is read on a pool connection that is released before the chunk's transitions
+    # are written, so a pass never holds two connections. The last stage goes first: an
+    # appointment only moves to a later stage's status, so no pass sees it twice.
+    for stage, (low, high) in sorted(stage_windows(windows).items(), reverse=True):
+        from_status, to_status = STAGE_STATUSES[stage]
+        after = ("", 0)
+        while True:
+            with connection(db_file) as conn:
+                rows = conn.execute(STAGE_CHUNK_QUERY, (from_status, low, high, *after, chunk_size)).fetchall()
+            if not rows:
+                break
+            after = (rows[-1][2], rows[-1][0])
+            transitions = []
+            for appt_id, status, time_str, forms_filled, name, phone, email in rows:
+                if classify_reminder(status, time_str, windows) != stage:
+                    continue
+                if verbose:
+                    print(f"   -> Processing reminder {stage} for {name} at {time_str}")
+                STAGE_SENDERS[stage](name, phone, email, time_str, forms_filled, notify)
+                transitions.append((to_status, appt_id, from_status))
+                counts[stage] += 1
+            if transitions:
+                _apply_transitions(db_file, transitions)
+    prune_change_feed(db_file)
+    return counts
+
+
+def prune_change_feed(db_file=DB_FILE, before=None):
+    """ Deletes AppointmentChanges entries older than `before`; returns how many """
+    before = before or datetime.now() - CHANGE_FEED_RETENTION
+    with transaction(db_file) as conn:
+        return conn.execute("DELETE FROM AppointmentChanges WHERE ChangedAt < ?", (before.strftime('%Y-%m-%d %H:%M:%S'),)).rowcount
+
+
+# --- Daemon mode ---
+STAGE_BY_STATUS = {from_status: stage for stage, (from_status, _) in STAGE_STATUSES.items()}
+# How long before the appointment each stage becomes due.
+STAGE_LEAD_TIMES = {1: timedelta(days=3), 2: timedelta(days=1), 3: timedelta(hours=4)}
+
+
+def next_reminder_due(status, appointment_time, now):
+    """
+    Returns (due_at, stage) for the next reminder an appointment will need, or None.
+    Mirrors classify_reminder: stage 1 lapses a day before the visit, stage 3 at the visit itself.
+    """
+    stage = STAGE_BY_STATUS.get(status)
+    if stage is None:
+        return None
+    try:
+        appointment_at = datetime.fromisoformat(appointment_time)
+    except ValueError:
+        return None
+    if stage == 1 and now > appointment_at - timedelta(days=1):
+        return None
+    if stage == 3 and now > appointment_at:
+        return None
+    return appointment_at - STAGE_LEAD_TIMES[stage], stage
+
+
+class ReminderDaemon:
+    """
+    Keeps a min-heap of upcoming reminder due times and sleeps until the next one.
+    New and changed appointments arrive through the AppointmentChanges feed, so the
+    table is only scanned once at start-up.
+    """
+
+    def __init__(self, db_file=DB_FILE, poll_interval=DAEMON_POLL_INTERVAL, notify=simulate_notification, health_file=None):
+        self.db_file = db_file
+        self.poll_interval = poll_interval
+        self.notify = notify
+        self.health_file = health_file
+        self._heap = []
+        self._scheduled = {}  # AppointmentID -> (due_at, stage) of its live heap entry
+        self._last_change_id = 0
+        self._stop = threading.Event()
+        self.reminders_sent = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self._total_lag_seconds = 0.0
+        self.last_loop_at = None
+
+    def _schedule(self, appt_id, status, appointment_time, now):
+        due = next_reminder_due(status, appointment_time, now)
+        if due is None:
+            self._scheduled.pop(appt_id, None)
+        elif self._scheduled.get(appt_id) != due:
+            # Older heap entries for this appointment are skipped lazily when popped.
+            self._scheduled[appt_id] = due
+            # A reminder that was already due when we learned about it is due "now", so the
+            # lag metric measures the daemon's delay rather than how late the booking was made.
+            heapq.heappush(self._heap, (max(due[0], now), appt_id, due[1], due[0]))
+
+    def load(self):
+        """ Builds the heap with one pass over appointments still awaiting a reminder """
+        now = datetime.now()
+        with connection(self.db_file) as conn:
+            self._last_change_id = conn.execute("SELECT COALESCE(MAX(ChangeID), 0) FROM AppointmentChanges").fetchone()[0]
+            for appt_id, status, appointment_time in conn.execute(
+                "SELECT AppointmentID, Status, AppointmentTime FROM Appointments WHERE Status IN ('Confirmed', 'Reminder 1 Sent', 'Reminder 2 Sent')"
+            ):
+                self._schedule(appt_id, status, appointment_time, now)
+
+    def poll_changes(self):
+        """ Reschedules appointments inserted or changed since the last poll """
+        now = datetime.now()
+        with connection(self.db_file) as conn:
+            # LEFT JOIN: a change to an appointment deleted since still advances the feed position.
+            changes = conn.execute(
+                "SELECT c.ChangeID, c.AppointmentID, a.Status, a.AppointmentTime FROM AppointmentChanges c "
+                "LEFT JOIN Appointments a ON a.AppointmentID = c.AppointmentID WHERE c.ChangeID > ? ORDER BY c.ChangeID",
+                (self._last_change_id,),
+            ).fetchall()
+        for _, appt_id, status, appointment_time in changes:
+            self._schedule(appt_id, status, appointment_time, now)
+        if changes:
+            # Only up to the last change actually read: anything committed after the SELECT stays in the feed.
+            self._last_change_id = changes[-1][0]
+            with transaction(self.db_file) as conn:
+                conn.execute("DELETE FROM AppointmentChanges WHERE ChangeID <= ?", (self._last_change_id,))
+
+    def fire_due(self):
+        """ Sends every reminder whose due time has passed; returns how many were sent """
+        now = datetime.now()
+        windows = reminder_windows(now)
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, appt_id, stage, scheduled_due = heapq.heappop(self._heap)
+            if self._scheduled.get(appt_id) == (scheduled_due, stage):
+                del self._scheduled[appt_id]
+                due.append((due_at, appt_id))
+        if not due:
+            return 0
+        due_at_by_id = dict((appt_id, due_at) for due_at, appt_id in due)
+        transitions = []
+        with connection(self.db_file) as conn:
+            for start in range(0, len(due), CHUNK_SIZE):
+                ids = [appt_id for _, appt_id in due[start:start + CHUNK_SIZE]]
+                placeholders = ",".join("?" * len(ids))
+                for appt_id, status, time_str, forms_filled, name, phone, email in conn.execute(
+                    f"{APPOINTMENT_QUERY} WHERE a.AppointmentID IN ({placeholders})", ids
+                ):
+                    # Re-check against the current row: it may have moved on since it was scheduled.
+                    stage = classify_reminder(status, time_str, windows)
+                    if stage is None:
+                        due_again = next_reminder_due(status, time_str, now)
+                        if due_again and due_again[0] > now:
+                            self._schedule(appt_id, status, time_str, now)
+                        continue
+                    print(f"   -> Processing reminder {stage} for {name} at {time_str}")
+                    STAGE_SENDERS[stage](name, phone, email, time_str, forms_filled, self.notify)
+                    from_status, to_status = STAGE_STATUSES[stage]
+                    transitions.append((to_status, appt_id, from_status))
+                    self._schedule(appt_id, to_status, time_str, now)
+                    self._record_lag((now - due_at_by_id[appt_id]).total_seconds())
+        if transitions:
+            _apply_transitions(self.db_file, transitions)
+        return len(transitions)
+
+    def _record_lag(self, lag_seconds):
+        self.reminders_sent += 1
+        self.last_lag_seconds = lag_seconds
+        self.max_lag_seconds = max(self.max_lag_seconds, lag_seconds)
+        self._total_lag_seconds += lag_seconds
+
+    def health(self):
+        """ Queue size and how late reminders went out relative to their due time """
+        next_due = self._heap[0][0].strftime('%Y-%m-%d %H:%M:%S') if self._heap else None
+        return {
+            "last_loop_at": self.last_loop_at,
+            "scheduled": len(self._scheduled),
+            "next_due_at": next_due,
+            "reminders_sent": self.reminders_sent,
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "avg_lag_seconds": round(self._total_lag_seconds / self.reminders_sent, 3) if self.reminders_sent else 0.0,
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+        }
+
+    def _write_health(self):
+        if not self.health_file:
+            return
+        tmp_path = f"{self.health_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.health(), f)
+        os.replace(tmp_path, self.health_file)
+
+    def run(self):
+        self.load()
+        print(f"--- Reminder daemon started with {len(self._scheduled)} scheduled reminder(s) ---")
+        while not self._stop.is_set():
+            try:
+                self.poll_changes()
+                self.fire_due()
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+            self.last_loop_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._write_health()
+            sleep_for = self.poll_interval
+            if self._heap:
+                sleep_for = min(sleep_for, (self._heap[0][0] - datetime.now()).total_seconds())
+            self._stop.wait(max(0.0, sleep_for))
+
+    def stop(self):
+        self._stop.set()
+
 
 def send_reminders():
     """
@@ -129,16 +356,10 @@ def send_reminders():
     """
     print(f"--- Running Reminder Check at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---")
     reminders_sent_count = 0
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        reminders_sent_count += handle_first_reminders(cursor)
-        reminders_sent_count += handle_second_reminders(cursor)
-        reminders_sent_count += handle_third_reminders(cursor)
-
-        conn.commit()
+        counts = process_due_reminders(DB_FILE)
+        reminders_sent_count = sum(counts.values())
+        print(f"\nReminders sent: 1st={counts[1]}, 2nd={counts[2]}, 3rd={counts[3]}")
 
         if reminders_sent_count == 0:
             print("\nConclusion: No reminders were sent in this run.")
@@ -147,13 +368,20 @@ def send_reminders():
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close()
 
 if __name__ == '__main__':
-    # To test this, you might need to manually set an appointment in your DB
-    # to be in the near future with the status 'Confirmed'.
-    send_reminders()
+    parser = argparse.ArgumentParser(description="Send appointment reminders.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and send each reminder when it falls due")
+    parser.add_argument("--poll-interval", type=float, default=DAEMON_POLL_INTERVAL, help="max seconds between checks for new bookings")
+    parser.add_argument("--health-file", help="write daemon health/lag metrics as JSON to this path after every loop")
+    args = parser.parse_args()
+    if args.daemon:
+        daemon = ReminderDaemon(DB_FILE, poll_interval=args.poll_interval, health_file=args.health_file)
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            print(f"\nStopping. Health: {daemon.health()}")
+    else:
+        # To test this, you might need to manually set an appointment in your DB
+        # to be in the near future with the status 'Confirmed'.
+        send_reminders()
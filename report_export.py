@@ -0,0 +1,229 @@
+# report_export.py
+
+import csv
+import os
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+
+from db import connection, transaction
+
+# Streaming export of appointments for the admin panel. Rows are read from the cursor in
+# chunks and written straight to a write-only workbook, CSV or Parquet file, so memory stays
+# flat regardless of table size. Exports can be filtered by date range and doctor, and an
+# incremental export only includes appointments added since the previous one of that name
+# and the same filters: each filter set keeps its own watermark, so a doctor's export never
+# moves the mark an unfiltered export resumes from.
+
+CHUNK_SIZE = 5000
+JOB_TTL_SECONDS = 3600  # finished jobs are forgotten this long after they end
+FORMATS = ("xlsx", "csv", "parquet")
+COLUMNS = ["AppointmentID", "FullName", "DoctorName", "AppointmentTime"]
+
+
+def _build_query(start_date=None, end_date=None, doctor_name=None, after_id=0):
+    conditions, params = ["a.AppointmentID > ?"], [after_id]
+    if start_date:
+        conditions.append("a.AppointmentTime >= ?")
+        params.append(str(start_date))
+    if end_date:
+        # Inclusive end date: everything before the start of the following day.
+        end = end_date if isinstance(end_date, date) else date.fromisoformat(end_date)
+        conditions.append("a.AppointmentTime < ?")
+        params.append((end + timedelta(days=1)).isoformat())
+    if doctor_name:
+        conditions.append("a.DoctorName = ?")
+        params.append(doctor_name)
+    where = " AND ".join(conditions)
+    select = f"SELECT a.AppointmentID, p.FullName, a.DoctorName, a.AppointmentTime FROM Appointments a JOIN Patients p ON a.PatientID = p.PatientID WHERE {where} ORDER BY a.AppointmentID"
+    count = f"SELECT COUNT(*) FROM Appointments a WHERE {where}"
+    return select, count, params
+
+
+# --- Writers: open(path) -> write(rows) -> close() ---
+class _CsvWriter:
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self._path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Appointments")
+        self._sheet.append(COLUMNS)
+
+    def write(self, rows):
+        for row in rows:
+            self._sheet.append(row)
+
+    def close(self):
+        self._workbook.save(self._path)
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([("AppointmentID", pa.int64()), ("FullName", pa.string()), ("DoctorName", pa.string()), ("AppointmentTime", pa.string())])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_batch(self._pa.record_batch([self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)], schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {"xlsx": _XlsxWriter, "csv": _CsvWriter, "parquet": _ParquetWriter}
+
+
+def _default_file_mode() -> int:
+    """The mode open() gives a new file: 0o666 less the umask (read once, at import)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# NamedTemporaryFile creates 0600 files; the finished report gets the mode any other new file would.
+REPORT_FILE_MODE = _default_file_mode()
+
+
+# --- Watermarks for incremental exports ---
+def watermark_key(export_name, start_date=None, end_date=None, doctor_name=None):
+    """The watermark name for an export and its filters; the unfiltered export keeps the bare name."""
+    filters = [f"{key}={value}" for key, value in (("from", start_date), ("to", end_date), ("doctor", doctor_name)) if value]
+    return "|".join([export_name, *filters])
+
+
+def get_watermark(db_file, export_name):
+    with connection(db_file) as conn:
+        row = conn.execute("SELECT LastAppointmentID FROM ExportWatermarks WHERE ExportName = ?", (export_name,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(db_file, export_name, last_appointment_id):
+    with transaction(db_file) as conn:
+        conn.execute(
+            "INSERT INTO ExportWatermarks (ExportName, LastAppointmentID, UpdatedAt) VALUES (?, ?, ?) "
+            "ON CONFLICT(ExportName) DO UPDATE SET LastAppointmentID = excluded.LastAppointmentID, UpdatedAt = excluded.UpdatedAt",
+            (export_name, last_appointment_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        )
+
+
+def export_appointments(db_file, path, fmt="xlsx", start_date=None, end_date=None, doctor_name=None,
+                        incremental=False, export_name="admin_report", progress=None):
+    """
+    Streams matching appointments into `path`. `progress(done, total)` is called after each chunk.
+    With `incremental`, only appointments newer than the last export named `export_name` with the
+    same filters are included, and that watermark advances once the file has been written.
+    Returns the number of rows written.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    key = watermark_key(export_name, start_date, end_date, doctor_name)
+    after_id = get_watermark(db_file, key) if incremental else 0
+    select, count, params = _build_query(start_date, end_date, doctor_name, after_id)
+    # A temp file of its own next to `path`, so concurrent exports to the same report never share one.
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.",
+                                     suffix=".part", delete=False) as tmp:
+        tmp_path = tmp.name
+    written, last_id = 0, after_id
+    with connection(db_file) as conn:
+        # One read transaction so the count and the rows come from the same snapshot.
+        conn.execute("BEGIN")
+        try:
+            total = conn.execute(count, params).fetchone()[0]
+            if progress:
+                progress(0, total)
+            writer = WRITERS[fmt](tmp_path)
+            try:
+                cursor = conn.execute(select, params)
+                while True:
+                    rows = cursor.fetchmany(CHUNK_SIZE)
+                    if not rows:
+                        break
+                    writer.write(rows)
+                    written += len(rows)
+                    last_id = rows[-1][0]
+                    if progress:
+                        progress(written, total)
+            finally:
+                writer.close()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            conn.rollback()
+    # Swap the finished file in so a failed export never leaves a truncated report behind.
+    os.chmod(tmp_path, REPORT_FILE_MODE)
+    os.replace(tmp_path, path)
+    if incremental and last_id > after_id:
+        set_watermark(db_file, key, last_id)
+    return written
+
+
+# --- Background jobs for the admin panel ---
+class ExportJob:
+    def __init__(self, db_file, path, fmt, **options):
+        self.job_id = uuid.uuid4().hex
+        self.db_file, self.path, self.fmt, self.options = db_file, path, fmt, options
+        self.status = "pending"  # pending, running, done, failed
+        self.rows_done, self.rows_total = 0, None
+        self.error = None
+        self.started_at = self.finished_at = None
+
+    def _progress(self, done, total):
+        self.rows_done, self.rows_total = done, total
+
+    def run(self):
+        self.status, self.started_at = "running", datetime.now()
+        try:
+            export_appointments(self.db_file, self.path, self.fmt, progress=self._progress, **self.options)
+            self.status = "done"
+        except Exception as e:
+            self.status, self.error = "failed", str(e)
+        self.finished_at = datetime.now()
+
+    @property
+    def fraction(self):
+        if self.status == "done":
+            return 1.0
+        return self.rows_done / self.rows_total if self.rows_total else 0.0
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _forget_finished_jobs():
+    cutoff = datetime.now() - timedelta(seconds=JOB_TTL_SECONDS)
+    for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+        del _jobs[job_id]
+
+
+def start_export_job(db_file, path, fmt="xlsx", **options) -> str:
+    """Runs an export on a background thread and returns its job id for polling (for JOB_TTL_SECONDS after it ends)."""
+    job = ExportJob(db_file, path, fmt, **options)
+    with _jobs_lock:
+        _forget_finished_jobs()
+        _jobs[job.job_id] = job
+    threading.Thread(target=job.run, name=f"export-{job.job_id[:8]}", daemon=True).start()
+    return job.job_id
+
+
+def get_export_job(job_id):
+    return _jobs.get(job_id)
@@ -1,119 +1,289 @@
-import sqlite3
+import argparse
+import multiprocessing
+import os
 import random
-from faker import Faker
-from datetime import datetime, timedelta
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from faker.providers.person.en_US import Provider as PersonProvider
+from migrations import migrate
+from patient_index import normalize_name
 
-# Initialize Faker for data generation
-fake = Faker()
+# Synthetic clinic data, from the 50-patient demo up to production-sized tables.
+#   python setup_database.py                                  # demo database
+#   python setup_database.py --db data/scale.db --reset --patients 2000000 --doctors 2000 \
+#       --days 90 --history-days 365 --workers 8 --seed 42
+# Rows are synthesized in chunks by a process pool; every chunk has its own RNG derived
+# from the seed, so the output is identical for any number of workers. Chunks are
+# inserted in order with executemany inside large transactions, under relaxed PRAGMAs,
+# and the tables' indexes and triggers are dropped for the load and rebuilt afterwards.
 
 # --- Configuration ---
 DB_FILE = "data/clinic.db"
 NUM_PATIENTS = 50
 NUM_DOCTORS = 3
 DAYS_TO_SCHEDULE = 14 # Generate schedule for the next 14 days
+HISTORY_DAYS = 30  # past days of schedules and appointments
+OCCUPANCY = 0.3  # share of schedule cells that start an appointment
+SEED = 42
 
-def create_connection(db_file):
-    """ Create a database connection to the SQLite database """
-    conn = None
-    try:
-        conn = sqlite3.connect(db_file)
-        print(f"SQLite version: {sqlite3.version}")
-        print(f"Successfully connected to {db_file}")
-    except sqlite3.Error as e:
-        print(e)
-    return conn
-
-def create_tables(conn):
-    """ Create the necessary tables if they don't exist """
-    try:
-        cursor = conn.cursor()
-        # Patients Table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Patients (
-            PatientID INTEGER PRIMARY KEY AUTOINCREMENT,
-            FullName TEXT NOT NULL,
-            DateOfBirth TEXT NOT NULL,
-            Email TEXT,
-            PhoneNumber TEXT
-        );
-        """)
-        
-        # Doctor Schedules Table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS DoctorSchedules (
-            ScheduleID INTEGER PRIMARY KEY AUTOINCREMENT,
-            DoctorName TEXT NOT NULL,
-            StartTime TEXT NOT NULL,
-            EndTime TEXT NOT NULL,
-            Status TEXT NOT NULL DEFAULT 'Available' -- Available, Booked
-        );
-        """)
-
-        # Appointments Table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Appointments (
-            AppointmentID INTEGER PRIMARY KEY AUTOINCREMENT,
-            PatientID INTEGER,
-            DoctorName TEXT NOT NULL,
-            AppointmentTime TEXT NOT NULL,
-            Duration INTEGER NOT NULL, -- in minutes (30 or 60)
-            InsuranceCarrier TEXT,
-            MemberID TEXT,
-            Status TEXT NOT NULL, -- e.g., Confirmed, Forms Sent, Reminder 1 Sent
-            FOREIGN KEY (PatientID) REFERENCES Patients (PatientID)
-        );
-        """)
-        print("Tables created successfully.")
-    except sqlite3.Error as e:
-        print(f"Error creating tables: {e}")
-
-
-def generate_synthetic_data(conn):
-    """ Generate and insert synthetic data into the tables """
-    cursor = conn.cursor()
-    
-    # 1. Generate Patients
-    patients = []
-    for _ in range(NUM_PATIENTS):
-        patients.append((
-            fake.name(),
-            fake.date_of_birth(minimum_age=1, maximum_age=90).strftime('%Y-%m-%d'),
-            fake.email(),
-            fake.phone_number()
+PATIENT_CHUNK = 50_000
+DOCTOR_CHUNK = 25  # doctors per schedule/appointment chunk
+TRANSACTION_ROWS = 250_000  # rows per COMMIT during the load
+
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",  # ~256 MB
+    "PRAGMA locking_mode = EXCLUSIVE",
+)
+RESTORE_PRAGMAS = (
+    "PRAGMA locking_mode = NORMAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+)
+
+LOADED_TABLES = ("Patients", "DoctorSchedules", "Appointments")
+SLOT_HOURS = [(9, 12), (13, 17)]  # morning and afternoon blocks, in 30-minute cells
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+CARRIERS = ["Aetna", "Blue Cross Blue Shield", "Cigna", "Humana", "UnitedHealthcare", "Kaiser Permanente", "Medicare", "Self-Pay"]
+EMAIL_DOMAINS = ["example.com", "mail.example.org", "inbox.example.net"]
+
+FIRST_NAMES = sorted(set(PersonProvider.first_names))
+LAST_NAMES = sorted(set(PersonProvider.last_names))
+
+
+def _rng(seed, table, chunk) -> random.Random:
+    return random.Random(f"{seed}:{table}:{chunk}")
+
+
+# --- Row synthesis (runs in worker processes) ---
+def _patient_rows(task):
+    """ (FullName, DateOfBirth, Email, PhoneNumber, NormalizedName) for patients [start, start + count) """
+    seed, chunk, start, count = task
+    rng = _rng(seed, "patients", chunk)
+    earliest = date(1935, 1, 1).toordinal()
+    span = date(2024, 12, 31).toordinal() - earliest
+    rows = []
+    for number in range(start, start + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        full_name = f"{first} {last}"
+        rows.append((
+            full_name,
+            date.fromordinal(earliest + rng.randrange(span)).isoformat(),
+            f"{first}.{last}{number}@{rng.choice(EMAIL_DOMAINS)}".lower(),
+            f"{rng.randint(201, 989)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            normalize_name(full_name),
         ))
-    cursor.executemany("INSERT INTO Patients (FullName, DateOfBirth, Email, PhoneNumber) VALUES (?, ?, ?, ?)", patients)
-    print(f"Inserted {len(patients)} synthetic patients.")
-
-    # 2. Generate Doctor Schedules
-    doctors = [f"Dr. {fake.last_name()}" for _ in range(NUM_DOCTORS)]
-    schedules = []
-    start_date = datetime.now().date()
-    
-    for day in range(DAYS_TO_SCHEDULE):
-        current_date = start_date + timedelta(days=day)
+    return rows
+
+
+def _appointment_status(rng, start: datetime, now: datetime) -> str:
+    """ Where the reminder pipeline (see reminder_manager.py) would have moved an appointment by `now` """
+    until = start - now
+    if until < timedelta(0):
+        return rng.choices(["Reminder 3 Sent", "Reminder 2 Sent", "Confirmed"], [85, 10, 5])[0]
+    if until <= timedelta(hours=4):
+        return rng.choice(["Reminder 2 Sent", "Reminder 3 Sent"])
+    if until <= timedelta(days=1):
+        return rng.choice(["Reminder 1 Sent", "Reminder 2 Sent"])
+    if until <= timedelta(days=3):
+        return rng.choice(["Confirmed", "Reminder 1 Sent"])
+    return "Confirmed"
+
+
+def _day_cells(first_day, num_days):
+    """ Per weekday: the blocks of (start datetime, start text, end text) cells, formatted once for all doctors """
+    days = []
+    for day in range(first_day, first_day + num_days):
+        current = date.fromordinal(day)
         # Skip weekends
-        if current_date.weekday() >= 5:
+        if current.weekday() >= 5:
             continue
-            
-        for doctor in doctors:
-            # Morning slots (9 AM to 12 PM)
-            for hour in range(9, 12):
-                schedules.append((doctor, f"{current_date} {hour:02d}:00", f"{current_date} {hour:02d}:30"))
-                schedules.append((doctor, f"{current_date} {hour:02d}:30", f"{current_date} {hour+1:02d}:00"))
-            # Afternoon slots (1 PM to 5 PM)
-            for hour in range(13, 17):
-                schedules.append((doctor, f"{current_date} {hour:02d}:00", f"{current_date} {hour:02d}:30"))
-                schedules.append((doctor, f"{current_date} {hour:02d}:30", f"{current_date} {hour+1:02d}:00"))
-
-    cursor.executemany("INSERT INTO DoctorSchedules (DoctorName, StartTime, EndTime) VALUES (?, ?, ?)", schedules)
-    print(f"Inserted {len(schedules)} available slots for {NUM_DOCTORS} doctors.")
-
-    conn.commit()
+        blocks = []
+        for first_hour, last_hour in SLOT_HOURS:
+            starts = [datetime(current.year, current.month, current.day, hour, minute)
+                      for hour in range(first_hour, last_hour) for minute in (0, 30)]
+            blocks.append([(start, start.strftime(TIME_FORMAT), (start + timedelta(minutes=30)).strftime(TIME_FORMAT)) for start in starts])
+        days.append(blocks)
+    return days
 
-if __name__ == '__main__':
-    conn = create_connection(DB_FILE)
-    if conn:
-        create_tables(conn)
-        generate_synthetic_data(conn)
+
+def _schedule_rows(task):
+    """ Schedule cells for a chunk of doctors, and the appointments booked into them """
+    seed, chunk, doctors, first_day, num_days, now, first_patient, num_patients, occupancy = task
+    rng = _rng(seed, "schedules", chunk)
+    days = _day_cells(first_day, num_days)
+    schedules, appointments = [], []
+    for doctor in doctors:
+        for blocks in days:
+            for cells in blocks:
+                index = 0
+                while index < len(cells):
+                    start, start_text, _ = cells[index]
+                    length = 1
+                    if num_patients and rng.random() < occupancy:
+                        length = 2 if index + 1 < len(cells) and rng.random() < 0.3 else 1
+                        carrier = rng.choice(CARRIERS)
+                        appointments.append((
+                            first_patient + rng.randrange(num_patients), doctor, start_text, 30 * length,
+                            carrier, "N/A" if carrier == "Self-Pay" else f"{carrier[:3].upper()}{rng.randint(100000, 999999)}",
+                            _appointment_status(rng, start, now), int(rng.random() < 0.6),
+                        ))
+                        status = "Booked"
+                    else:
+                        status = "Available"
+                    for _, cell_start, cell_end in cells[index:index + length]:
+                        schedules.append((doctor, cell_start, cell_end, status))
+                    index += length
+    return schedules, appointments
+
+
+def _map(func, tasks, workers):
+    """ Yields func(task) in task order, from a process pool when there is more than one chunk """
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(func, tasks)
+        return
+    with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+        yield from pool.imap(func, tasks)
+
+
+def _doctor_names(seed, count):
+    rng = _rng(seed, "doctors", 0)
+    names, seen = [], set()
+    while len(names) < count:
+        name = f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+# --- Loading ---
+class _Loader:
+    """ executemany in chunks, committing every TRANSACTION_ROWS rows; counts rows per table """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = {}
+        self._pending = 0
+        conn.execute("BEGIN")
+
+    def insert(self, table, sql, rows):
+        if not rows:
+            return
+        self.conn.executemany(sql, rows)
+        self.rows[table] = self.rows.get(table, 0) + len(rows)
+        self._pending += len(rows)
+        if self._pending >= TRANSACTION_ROWS:
+            self.conn.execute("COMMIT")
+            self.conn.execute("BEGIN")
+            self._pending = 0
+
+    def finish(self):
+        self.conn.execute("COMMIT")
+
+
+def _drop_indexes_and_triggers(conn):
+    """ Drops the loaded tables' secondary indexes and triggers; returns the SQL to recreate them """
+    placeholders = ", ".join("?" for _ in LOADED_TABLES)
+    objects = conn.execute(
+        f"SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        LOADED_TABLES,
+    ).fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(f"DROP {object_type.upper()} IF EXISTS {name}")
+    # Indexes before triggers, in their original order
+    return [sql for object_type, _, sql in objects if object_type == "index"] + [sql for object_type, _, sql in objects if object_type == "trigger"]
+
+
+def _rate(rows, seconds):
+    return f"{rows:,} rows in {seconds:.1f}s ({rows / seconds if seconds else 0:,.0f} rows/s)"
+
+
+def generate(db_file=DB_FILE, patients=NUM_PATIENTS, doctors=NUM_DOCTORS, days=DAYS_TO_SCHEDULE, history_days=HISTORY_DAYS,
+             occupancy=OCCUPANCY, seed=SEED, workers=None, reset=False) -> dict:
+    """
+    Generates the synthetic data into `db_file` and returns the number of rows inserted per table.
+    Raises ValueError if the database already has data, unless `reset` deletes it first.
+    """
+    workers = workers or os.cpu_count() or 1
+    if reset and os.path.exists(db_file):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+    directory = os.path.dirname(db_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    print(f"Successfully connected to {db_file}")
+    migrate(conn, verbose=True)
+    # A second run would add every doctor's schedule again on top of the first.
+    existing = [table for table in ("Patients", "DoctorSchedules", "Appointments")
+                if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()]
+    if existing:
         conn.close()
-        print("Database setup complete.")
+        raise ValueError(f"{db_file} already has data in {', '.join(existing)}; pass --reset to regenerate it")
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+    recreate = _drop_indexes_and_triggers(conn)
+    loader = _Loader(conn)
+    started = time.perf_counter()
+
+    # 1. Patients
+    first_patient = conn.execute("SELECT COALESCE(MAX(PatientID), 0) + 1 FROM Patients").fetchone()[0]
+    tasks = [(seed, chunk, first_patient + offset, min(PATIENT_CHUNK, patients - offset))
+             for chunk, offset in enumerate(range(0, patients, PATIENT_CHUNK))]
+    for rows in _map(_patient_rows, tasks, workers):
+        loader.insert("Patients", "INSERT INTO Patients (FullName, DateOfBirth, Email, PhoneNumber, NormalizedName) VALUES (?, ?, ?, ?, ?)", rows)
+    patients_done = time.perf_counter()
+    print(f"Inserted patients: {_rate(loader.rows.get('Patients', 0), patients_done - started)}")
+
+    # 2. Doctor schedules and the appointments booked into them
+    now = datetime.now()
+    first_day = now.date().toordinal() - history_days
+    names = _doctor_names(seed, doctors)
+    tasks = [(seed, chunk, names[offset:offset + DOCTOR_CHUNK], first_day, history_days + days, now, first_patient, patients, occupancy)
+             for chunk, offset in enumerate(range(0, doctors, DOCTOR_CHUNK))]
+    for schedules, appointments in _map(_schedule_rows, tasks, workers):
+        loader.insert("DoctorSchedules", "INSERT INTO DoctorSchedules (DoctorName, StartTime, EndTime, Status) VALUES (?, ?, ?, ?)", schedules)
+        loader.insert("Appointments", "INSERT INTO Appointments (PatientID, DoctorName, AppointmentTime, Duration, InsuranceCarrier, MemberID, Status, FormsFilled) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", appointments)
+    loader.finish()
+    loaded = time.perf_counter()
+    schedule_rows = loader.rows.get("DoctorSchedules", 0) + loader.rows.get("Appointments", 0)
+    print(f"Inserted schedules and appointments for {doctors} doctors: {_rate(schedule_rows, loaded - patients_done)}")
+
+    # 3. Indexes and triggers, built once over the loaded tables
+    for sql in recreate:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    for pragma in RESTORE_PRAGMAS:
+        conn.execute(pragma)
+    conn.close()
+    finished = time.perf_counter()
+    total = sum(loader.rows.values())
+    print(f"Rebuilt {len(recreate)} indexes/triggers in {finished - loaded:.1f}s")
+    print(f"Total: {_rate(total, finished - started)} with {workers} worker(s)")
+    return loader.rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic clinic database")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--patients", type=int, default=NUM_PATIENTS)
+    parser.add_argument("--doctors", type=int, default=NUM_DOCTORS)
+    parser.add_argument("--days", type=int, default=DAYS_TO_SCHEDULE, help="days of schedule from today")
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS, help="past days of schedules and appointments")
+    parser.add_argument("--occupancy", type=float, default=OCCUPANCY, help="share of schedule cells that start an appointment")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=None, help="synthesis processes (default: CPU count)")
+    parser.add_argument("--reset", action="store_true", help="delete the database file first (required if it has data)")
+    args = parser.parse_args()
+    try:
+        rows = generate(args.db, args.patients, args.doctors, args.days, args.history_days, args.occupancy, args.seed, args.workers, args.reset)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Database setup complete: {rows}")
@@ -0,0 +1,186 @@
+# slot_holds.py
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from db import transaction
+
+# Short reservations of a slot while the patient finishes booking it (typically typing their
+# insurance details). Selecting a slot writes one SlotHolds row per schedule row with an
+# expiry; slot search (slot_index.find_slots) skips held rows, and other sessions can neither
+# hold nor book them until the hold expires. Booking converts the hold (deletes it in the
+# booking transaction); picking another slot releases it; otherwise the sweeper deletes it
+# after ExpiresAt (indexed) and the rows show up in search again. One hold token (the
+# conversation's thread id) holds at most one slot at a time.
+
+# --- Configuration ---
+HOLD_TTL_SECONDS = int(os.getenv("SLOT_HOLD_TTL_SECONDS", "300"))
+SWEEP_INTERVAL = 15.0  # seconds between expiry sweeps
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Condition for schedule row `{table}` not being held by anyone else; params: (hold token, now).
+NOT_HELD_BY_OTHERS = ("NOT EXISTS (SELECT 1 FROM SlotHolds h WHERE h.ScheduleID = {table}.ScheduleID "
+                      "AND h.HoldToken != ? AND h.ExpiresAt > ?)")
+
+
+def now() -> str:
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+# --- Stats ---
+class HoldStats:
+    """Outcome counts for holds placed by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.placed = 0
+        self.conflicts = 0  # selections refused because another session holds or booked the slot
+        self.converted = 0
+        self.released = 0
+        self.expired = 0
+
+    def add(self, name: str, count: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            resolved = self.converted + self.released + self.expired
+            return {
+                "placed": self.placed,
+                "conflicts": self.conflicts,
+                "converted": self.converted,
+                "released": self.released,
+                "expired": self.expired,
+                "conversion_rate": self.converted / resolved if resolved else None,
+            }
+
+
+stats = HoldStats()
+
+
+def hold_stats() -> dict:
+    return stats.snapshot()
+
+
+# --- Holds ---
+def _held_rows(conn, hold_token: str) -> list:
+    return conn.execute(
+        "SELECT s.ScheduleID, s.DoctorName, s.StartTime, s.Status FROM SlotHolds h JOIN DoctorSchedules s ON s.ScheduleID = h.ScheduleID WHERE h.HoldToken = ?",
+        (hold_token,),
+    ).fetchall()
+
+
+def place_hold(db_file: str, hold_token: str, schedule_ids: list, ttl_seconds: float = HOLD_TTL_SECONDS) -> dict:
+    """
+    Holds every row in `schedule_ids` for `hold_token`, replacing the token's previous hold.
+    Returns {"held": bool, "expires_at": ..., "released": [(doctor_name, start_time), ...]}
+    where `released` are the previously held rows that are free again.
+    """
+    current = now()
+    expires_at = (datetime.now() + timedelta(seconds=ttl_seconds)).strftime(TIME_FORMAT)
+    placeholders = ", ".join("?" * len(schedule_ids))
+    with transaction(db_file, immediate=True) as conn:
+        previous = _held_rows(conn, hold_token)
+        free = conn.execute(
+            f"SELECT COUNT(*) FROM DoctorSchedules WHERE ScheduleID IN ({placeholders}) AND Status = 'Available' "
+            f"AND {NOT_HELD_BY_OTHERS.format(table='DoctorSchedules')}",
+            (*schedule_ids, hold_token, current),
+        ).fetchone()[0]
+        held = free == len(schedule_ids)
+        if held:
+            # Besides our previous hold, anything left on these rows is an expired hold the sweeper hasn't reached yet.
+            deleted = conn.execute(f"DELETE FROM SlotHolds WHERE HoldToken = ? OR ScheduleID IN ({placeholders}) RETURNING HoldToken",
+                                   (hold_token, *schedule_ids)).fetchall()
+            conn.executemany("INSERT INTO SlotHolds (ScheduleID, HoldToken, ExpiresAt) VALUES (?, ?, ?)",
+                             [(schedule_id, hold_token, expires_at) for schedule_id in schedule_ids])
+        else:
+            deleted = conn.execute("DELETE FROM SlotHolds WHERE HoldToken = ? RETURNING HoldToken", (hold_token,)).fetchall()
+    expired_tokens = len({token for token, in deleted} - {hold_token})
+    kept = set(schedule_ids) if held else set()
+    released = [(doctor, start) for schedule_id, doctor, start, status in previous
+                if schedule_id not in kept and status == "Available"]
+    if previous and not (held and {row[0] for row in previous} == kept):
+        stats.add("released")
+    stats.add("placed" if held else "conflicts")
+    if expired_tokens:
+        stats.add("expired", expired_tokens)
+    return {"held": held, "expires_at": expires_at if held else None, "released": released}
+
+
+def release_hold(db_file: str, hold_token: str) -> list:
+    """Drops the token's hold; returns the (doctor_name, start_time) rows that are free again."""
+    with transaction(db_file, immediate=True) as conn:
+        previous = _held_rows(conn, hold_token)
+        conn.execute("DELETE FROM SlotHolds WHERE HoldToken = ?", (hold_token,))
+    if previous:
+        stats.add("released")
+    return [(doctor, start) for _, doctor, start, status in previous if status == "Available"]
+
+
+def convert_hold(conn, hold_token: str) -> bool:
+    """Deletes the token's hold inside the caller's booking transaction; True if there was one."""
+    return conn.execute("DELETE FROM SlotHolds WHERE HoldToken = ?", (hold_token,)).rowcount > 0
+
+
+def sweep_expired(db_file: str) -> list:
+    """Deletes expired holds; returns the (doctor_name, start_time) rows that are free again."""
+    current = now()
+    with transaction(db_file, immediate=True) as conn:
+        # CROSS JOIN keeps SlotHolds as the outer loop (idx_slot_holds_expires, then schedule rows by
+        # primary key); with ANALYZE stats on an empty SlotHolds the planner would scan DoctorSchedules.
+        rows = conn.execute(
+            "SELECT h.HoldToken, s.ScheduleID, s.DoctorName, s.StartTime, s.Status FROM SlotHolds h "
+            "CROSS JOIN DoctorSchedules s ON s.ScheduleID = h.ScheduleID WHERE h.ExpiresAt <= ?",
+            (current,),
+        ).fetchall()
+        if rows:
+            conn.execute("DELETE FROM SlotHolds WHERE ExpiresAt <= ?", (current,))
+    if rows:
+        stats.add("expired", len({token for token, *_ in rows}))
+    return [(doctor, start) for _, _, doctor, start, status in rows if status == "Available"]
+
+
+# --- Sweeper ---
+class HoldSweeper:
+    """Background thread that expires holds and hands the freed rows to `on_released`."""
+
+    def __init__(self, db_file: str, on_released=None, interval: float = SWEEP_INTERVAL):
+        self.db_file = db_file
+        self.on_released = on_released
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                released = sweep_expired(self.db_file)
+                if released and self.on_released:
+                    self.on_released(released)
+            except Exception as e:
+                print(f"Slot hold sweeper error: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="slot-hold-sweeper", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+_sweepers = {}
+_sweepers_lock = threading.Lock()
+
+
+def start_hold_sweeper(db_file: str, on_released=None) -> HoldSweeper:
+    """Starts the expiry sweeper for `db_file` once per process."""
+    with _sweepers_lock:
+        sweeper = _sweepers.get(db_file)
+        if sweeper is None:
+            sweeper = _sweepers[db_file] = HoldSweeper(db_file, on_released).start()
+    return sweeper
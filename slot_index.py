@@ -0,0 +1,79 @@
+# slot_index.py
+
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from slot_holds import NOT_HELD_BY_OTHERS, now
+
+# Slot search over DoctorSchedules.
+#
+# A slot of D minutes is D/30 consecutive Available rows of one doctor, none of them under
+# an unexpired hold. The first row comes from idx_schedules_status_start in time order (or
+# idx_schedules_doctor_status_start for one doctor); each following row is a probe of
+# idx_schedules_doctor_status_start on (DoctorName, Status, StartTime = previous EndTime). The query stops
+# after `limit` results, so it never reads more of the calendar than it returns, and it
+# always sees committed bookings and holds: there is no copy to keep fresh.
+
+SLOT_MINUTES = 30
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+DISPLAY_FORMAT = '%Y-%m-%d %I:%M %p'
+
+
+def slot_label(slot: dict) -> str:
+    """A slot record's start time as shown to patients, e.g. '2025-03-04 09:30 AM'."""
+    return datetime.fromisoformat(slot["start_time"]).strftime(DISPLAY_FORMAT)
+
+
+@lru_cache(maxsize=None)
+def _slot_query(cells: int, by_doctor: bool, until: bool) -> str:
+    """SELECT for `cells` contiguous free rows; params: after, [doctor], [until], then (token, now) per row."""
+    columns = [f"s{i}.ScheduleID" for i in range(cells)]
+    joins = [f"JOIN DoctorSchedules s{i} ON s{i}.DoctorName = s0.DoctorName AND s{i}.StartTime = s{i - 1}.EndTime "
+             f"AND s{i}.Status = 'Available'" for i in range(1, cells)]
+    where = ["s0.Status = 'Available'", "s0.StartTime > ?"]
+    if by_doctor:
+        where.append("s0.DoctorName = ?")
+    if until:
+        where.append("s0.StartTime < ?")
+    where += [NOT_HELD_BY_OTHERS.format(table=f"s{i}") for i in range(cells)]
+    tables = " ".join(["DoctorSchedules s0", *joins])
+    return (f"SELECT s0.DoctorName, s0.StartTime, s{cells - 1}.EndTime, {', '.join(columns)} "
+            f"FROM {tables} WHERE {' AND '.join(where)} ORDER BY s0.StartTime, s0.DoctorName LIMIT ?")
+
+
+def find_slots(conn, duration: int, limit: int, after: Optional[datetime] = None, doctor_name: Optional[str] = None,
+               start_date: Optional[date] = None, end_date: Optional[date] = None) -> list:
+    """
+    Returns the next `limit` starts that have `duration` contiguous free minutes, ordered by time,
+    as records with schedule_id, schedule_ids (the rows the slot covers, in time order),
+    doctor_name, start_time and end_time.
+    """
+    after = after or datetime.now()
+    if start_date and datetime.combine(start_date, datetime.min.time()) > after:
+        after = datetime.combine(start_date, datetime.min.time()) - timedelta(minutes=1)
+    cells = max(1, -(-duration // SLOT_MINUTES))
+    params = [after.strftime(TIME_FORMAT)]
+    if doctor_name is not None:
+        params.append(doctor_name)
+    if end_date:
+        params.append((end_date + timedelta(days=1)).strftime(TIME_FORMAT))
+    # Any unexpired hold hides a row, including the searching session's own (no token matches '').
+    params += ["", now()] * cells
+    params.append(limit)
+    rows = conn.execute(_slot_query(cells, doctor_name is not None, end_date is not None), params).fetchall()
+    return [{"schedule_id": row[3], "schedule_ids": list(row[3:]), "doctor_name": row[0], "start_time": row[1], "end_time": row[2]}
+            for row in rows]
+
+
+def free_schedule_ids(conn, schedule_ids: list) -> set:
+    """The subset of `schedule_ids` still Available and not under an unexpired hold (a primary-key lookup)."""
+    if not schedule_ids:
+        return set()
+    placeholders = ", ".join("?" * len(schedule_ids))
+    rows = conn.execute(
+        f"SELECT ScheduleID FROM DoctorSchedules WHERE ScheduleID IN ({placeholders}) AND Status = 'Available' "
+        f"AND {NOT_HELD_BY_OTHERS.format(table='DoctorSchedules')}",
+        (*schedule_ids, "", now()),
+    )
+    return {row[0] for row in rows}
@@ -0,0 +1,142 @@
+# slot_prefetch.py
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+# Slot lookup doesn't depend on who the patient is, only on the appointment length, so a
+# conversation's slots for both lengths are fetched in the background while extraction and
+# the patient lookup run. The node that offers slots takes the prefetched result if it is
+# younger than the TTL, after `recheck` has dropped the slots other sessions booked or held
+# in the meantime (a primary-key lookup); only when none are left does it fetch again.
+# Prefetches run on their own small pool so they never queue ahead of the booking tools; one
+# that hasn't started by the time it is needed is cancelled and looked up directly instead.
+
+# --- Configuration ---
+DURATIONS = (30, 60)  # returning, new patient
+PREFETCH_TTL_SECONDS = 30
+MAX_THREADS = 1024  # conversations with a pending prefetch
+PREFETCH_WORKERS = 2
+
+
+class _Prefetch:
+    __slots__ = ("future", "started_at")
+
+    def __init__(self, future, started_at: float):
+        self.future = future
+        self.started_at = started_at
+
+
+class SlotPrefetcher:
+    """
+    Per-conversation slot prefetch. `fetch(duration)` returns the find_slots_tool result and
+    `afetch` is its async twin for lookups on the critical path; `recheck(result)` returns the
+    result without slots taken since, or None if nothing usable is left.
+    """
+
+    def __init__(self, fetch: Callable[[int], dict], recheck: Callable[[dict], Optional[dict]] = lambda result: result,
+                 afetch: Optional[Callable[[int], Awaitable[dict]]] = None,
+                 ttl_seconds: float = PREFETCH_TTL_SECONDS, max_threads: int = MAX_THREADS,
+                 executor: Optional[Executor] = None):
+        self.fetch = fetch
+        self.recheck = recheck
+        self.afetch = afetch
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self._executor = executor or ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="slot-prefetch")
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+
+    def _fresh(self, entry: _Prefetch) -> bool:
+        return time.monotonic() - entry.started_at <= self.ttl_seconds
+
+    def start(self, thread_id: Optional[str]) -> None:
+        """Starts fetching both durations for `thread_id`, unless a fresh prefetch is already pending."""
+        if thread_id is None:
+            return
+        with self._lock:
+            entries = self._pending.get(thread_id)
+            if entries and all(self._fresh(entry) for entry in entries.values()):
+                return
+            # Run in the caller's context so the lookups show up under the graph run's callbacks.
+            self._pending[thread_id] = {
+                duration: _Prefetch(self._executor.submit(contextvars.copy_context().run, self.fetch, duration),
+                                    time.monotonic())
+                for duration in DURATIONS
+            }
+            self._pending.move_to_end(thread_id)
+            while len(self._pending) > self.max_threads:
+                self._pending.popitem(last=False)
+
+    def _take(self, thread_id: Optional[str], duration: int) -> Optional[_Prefetch]:
+        """Removes the conversation's prefetch; returns the entry for `duration` if there is one."""
+        with self._lock:
+            entries = self._pending.pop(thread_id, None) if thread_id is not None else None
+            entry = entries.get(duration) if entries else None
+            # Still queued behind other conversations' prefetches: looking it up directly is sooner.
+            if entry is not None and entry.future.cancel():
+                entry = None
+            if entry is None:
+                self.misses += 1
+            return entry
+
+    def _count_stale(self) -> None:
+        with self._lock:
+            self.stale += 1
+
+    def _count_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def _checked(self, entry: _Prefetch, result: dict) -> Optional[dict]:
+        """The prefetched result if young enough and slots are left after the re-check, else None (counted stale)."""
+        checked = self.recheck(result) if self._fresh(entry) else None
+        if checked is None:
+            self._count_stale()
+        else:
+            self._count_hit()
+        return checked
+
+    def get(self, thread_id: Optional[str], duration: int) -> dict:
+        """The prefetched slots for `duration` that are still free (waiting for them if in flight), else a new lookup."""
+        entry = self._take(thread_id, duration)
+        if entry is not None:
+            try:
+                checked = self._checked(entry, entry.future.result())
+                if checked is not None:
+                    return checked
+            except Exception as e:
+                print(f"Slot prefetch failed, fetching again: {e}")
+        return self.fetch(duration)
+
+    async def aget(self, thread_id: Optional[str], duration: int) -> dict:
+        entry = self._take(thread_id, duration)
+        if entry is not None:
+            try:
+                result = await asyncio.wrap_future(entry.future)
+                checked = await asyncio.get_running_loop().run_in_executor(None, self._checked, entry, result)
+                if checked is not None:
+                    return checked
+            except Exception as e:
+                print(f"Slot prefetch failed, fetching again: {e}")
+        if self.afetch is not None:
+            return await self.afetch(duration)
+        return await asyncio.get_running_loop().run_in_executor(None, self.fetch, duration)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.stale + self.misses
+            return {
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "stale": self.stale,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,44 @@
+# tests/test_fast_extract.py
+
+from fast_extract import extract_fields, extract_full_name, extract_phone_number, leading_name
+
+PATIENT_FIELDS = ("full_name", "date_of_birth", "email", "phone_number")
+INSURANCE_FIELDS = ("insurance_carrier", "member_id")
+
+
+# --- Names: only introduced names are rules ---
+def test_introduced_name_is_extracted():
+    assert extract_full_name("Hi, my name is Jane Doe") == "Jane Doe"
+    assert extract_full_name("I'm Oscar Jones, born 1990-01-01") == "Oscar Jones"
+    assert extract_full_name("this is Mary Ann Smith") == "Mary Ann Smith"
+
+
+def test_greetings_are_not_names():
+    for text in ("Hello Doctor", "Thanks So Much", "Good Morning", "Yes Please"):
+        assert extract_full_name(text) is None
+        assert "full_name" not in extract_fields(text, PATIENT_FIELDS)
+
+
+def test_bare_leading_name_is_left_to_the_llm():
+    text = "Jane Doe, 1990-01-01, jane@example.com, 555-123-4567"
+    found = extract_fields(text, PATIENT_FIELDS)
+    assert "full_name" not in found
+    assert found == {"date_of_birth": "1990-01-01", "email": "jane@example.com", "phone_number": "555-123-4567"}
+    assert leading_name(text) == "Jane Doe"
+
+
+# --- Member and policy IDs are not phone numbers ---
+def test_member_id_is_not_a_phone_number():
+    text = "my member id is 123456789012"
+    assert extract_phone_number(text) is None
+    assert extract_fields(text, PATIENT_FIELDS + INSURANCE_FIELDS) == {"member_id": "123456789012"}
+
+
+def test_policy_number_is_not_a_phone_number():
+    assert extract_phone_number("Policy number: 5551234567") is None
+    assert extract_phone_number("policy # 5551234567, call me at (555) 123-4567") == "(555) 123-4567"
+
+
+def test_phone_number_is_still_extracted():
+    assert extract_phone_number("You can reach me at 555-123-4567") == "555-123-4567"
+    assert extract_phone_number("+1 (555) 123-4567") == "+1 (555) 123-4567"
@@ -1,17 +1,23 @@
 # tools.py - COMPLETE AND UPDATED FILE
 
 # --- All necessary imports ---
+import asyncio
+import functools
 import sqlite3
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
 import os
-import smtplib
 from dotenv import load_dotenv
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from langchain_core.tools import tool
+from db import POOL_SIZE, connection, transaction
+from patient_index import contact_matches, find_patients, normalize_name
+from slot_index import find_slots, free_schedule_ids
+from booking import book_slot, BOOKING_SUCCESSFUL, SLOT_TAKEN
+from slot_holds import place_hold, release_hold, start_hold_sweeper
+from email_outbox import enqueue_email, sender_address, start_outbox_workers
+from report_export import export_appointments
+from instrumentation import timed
 
 # --- Load environment variables from .env file ---
 load_dotenv()
@@ -21,39 +27,61 @@ DB_FILE = "data/clinic.db"
 PDF_FORM_PATH = "forms/New Patient Intake Form.pdf"
 
 
+def recheck_slots(result: dict) -> Optional[dict]:
+    """
+    Re-validates an earlier find_slots_tool result: drops slots booked or held since it was fetched.
+    Returns None if none are left, so the caller searches again.
+    """
+    slots = result.get("available_slots")
+    if not slots:
+        return None
+    with connection(DB_FILE) as conn:
+        free = free_schedule_ids(conn, [schedule_id for slot in slots for schedule_id in slot["schedule_ids"]])
+    slots = [slot for slot in slots if free.issuperset(slot["schedule_ids"])]
+    return {**result, "available_slots": slots} if slots else None
+
+
 # --- Tools Updated for New UI ---
 
 @tool
-def search_patient_tool(full_name: str, date_of_birth: str) -> dict:
+def search_patient_tool(full_name: str, date_of_birth: str, email: Optional[str] = None, phone_number: Optional[str] = None) -> dict:
     """
     Searches for a patient and returns their full details to populate the dashboard.
+    A close but inexact name only counts once `email` or `phone_number` matches the record;
+    until then the status is 'Confirmation Needed' and no patient details are returned.
     """
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        # Select all relevant fields needed by the app
-        cursor.execute("SELECT PatientID, FullName, DateOfBirth, Email, PhoneNumber FROM Patients WHERE FullName LIKE ? AND DateOfBirth = ?", (f"%{full_name}%", date_of_birth))
-        patient = cursor.fetchone()
-        if patient:
-            # Return a full dictionary that matches the app's expectations
-            return {
-                "status": "Patient Found",
-                "patient_id": patient[0],
-                "full_name": patient[1],
-                "date_of_birth": patient[2],
-                "email": patient[3],
-                "phone_number": patient[4]
-            }
+    with connection(DB_FILE) as conn:
+        # Indexed exact match on normalized name + DOB, with a typo-tolerant ranked fallback
+        candidates = find_patients(conn, full_name, date_of_birth)
+    if candidates and candidates[0]["match"] == "exact":
+        return _patient_found(candidates[0])
+    confirmed = [candidate for candidate in candidates if contact_matches(candidate, email, phone_number)]
+    if confirmed:
+        return _patient_found(confirmed[0], "confirmed")
+    if candidates and not (email or phone_number):
+        return {"status": "Confirmation Needed"}
     return {"status": "Patient Not Found"}
 
+def _patient_found(patient: dict, match: Optional[str] = None) -> dict:
+    # Return a full dictionary that matches the app's expectations
+    return {
+        "status": "Patient Found",
+        "patient_id": patient["patient_id"],
+        "full_name": patient["full_name"],
+        "date_of_birth": patient["date_of_birth"],
+        "email": patient["email"],
+        "phone_number": patient["phone_number"],
+        "match": match or patient["match"],
+    }
+
 @tool
 def add_new_patient_tool(full_name: str, date_of_birth: str, email: str, phone_number: str) -> dict:
     """
     Adds a new patient to the database and returns their full record for the dashboard.
     """
-    with sqlite3.connect(DB_FILE) as conn:
+    with transaction(DB_FILE) as conn:
         cursor = conn.cursor()
-        cursor.execute("INSERT INTO Patients (FullName, DateOfBirth, Email, PhoneNumber) VALUES (?, ?, ?, ?)", (full_name, date_of_birth, email, phone_number))
-        conn.commit()
+        cursor.execute("INSERT INTO Patients (FullName, DateOfBirth, Email, PhoneNumber, NormalizedName) VALUES (?, ?, ?, ?, ?)", (full_name, date_of_birth, email, phone_number, normalize_name(full_name)))
         new_patient_id = cursor.lastrowid
     # Return the complete patient record, which the app now needs
     return {
@@ -66,38 +94,49 @@ def add_new_patient_tool(full_name: str, date_of_birth: str, email: str, phone_n
     }
 
 @tool
-def find_slots_tool(duration: int) -> dict:
-    """Tool to find available appointment slots. Duration is 30 for returning patients, 60 for new patients."""
+def find_slots_tool(duration: int, doctor_name: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
+    """Tool to find available appointment slots. Duration is 30 for returning patients, 60 for new patients. Optionally filter by doctor and a YYYY-MM-DD date range. Each slot is a record with schedule_id, schedule_ids, doctor_name, start_time and end_time."""
     try:
         limit = 10 if duration == 30 else 5
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DoctorName, StartTime FROM DoctorSchedules WHERE Status = 'Available' AND datetime(StartTime) > datetime('now') ORDER BY StartTime LIMIT ?", (limit,))
-            slots = cursor.fetchall()
-            if not slots:
-                return {"status": "No slots available in the near future."}
-            # Format slots for display
-            formatted_slots = [f"{s[0]} at {datetime.strptime(s[1], '%Y-%m-%d %H:%M').strftime('%Y-%m-%d %I:%M %p')}" for s in slots]
-        return {"available_slots": formatted_slots}
+        # Only starts with `duration` contiguous free minutes qualify; see slot_index.find_slots.
+        with connection(DB_FILE) as conn:
+            slots = find_slots(
+                conn,
+                duration,
+                limit,
+                doctor_name=doctor_name,
+                start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+                end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            )
+        if not slots:
+            return {"status": "No slots available in the near future."}
+        return {"available_slots": slots}
     except sqlite3.Error as e:
         return {"status": f"Error: Could not access calendar: {e}"}
 
 @tool
-def book_appointment_tool(patient_id: int, doctor_name: str, appointment_time: str, duration: int, insurance_carrier: str, member_id: str) -> dict:
-    """Tool to book an appointment for a patient using their ID, chosen doctor, time, insurance, and member ID."""
-    time_db_format = datetime.strptime(appointment_time, '%Y-%m-%d %I:%M %p').strftime('%Y-%m-%d %H:%M')
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO Appointments (PatientID, DoctorName, AppointmentTime, Duration, InsuranceCarrier, MemberID, Status) VALUES (?, ?, ?, ?, ?, ?, 'Confirmed')", (patient_id, doctor_name, time_db_format, duration, insurance_carrier, member_id))
-        cursor.execute("UPDATE DoctorSchedules SET Status = 'Booked' WHERE DoctorName = ? AND StartTime LIKE ?", (doctor_name, f"{time_db_format}%"))
-        conn.commit()
-    return {"status": "Booking Successful"}
+def hold_slot_tool(hold_token: str, schedule_ids: list[int]) -> dict:
+    """Reserves a slot from find_slots_tool (its schedule_ids) for the conversation `hold_token` for a few minutes, so other patients can't take it while the booking is finished. Returns status 'Held' or 'Slot Taken'."""
+    start_hold_sweeper(DB_FILE)
+    result = place_hold(DB_FILE, hold_token, schedule_ids)
+    if not result["held"]:
+        return {"status": SLOT_TAKEN}
+    return {"status": "Held", "expires_at": result["expires_at"]}
+
+@tool
+def book_appointment_tool(patient_id: int, schedule_ids: list[int], doctor_name: str, start_time: str, duration: int, insurance_carrier: str, member_id: str, hold_token: Optional[str] = None) -> dict:
+    """Tool to book a slot from find_slots_tool for a patient: its schedule_ids, doctor_name and start_time, plus duration, insurance and member ID. `hold_token` converts the conversation's hold on the slot. Returns status 'Slot Taken' if someone else booked it first."""
+    result = book_slot(DB_FILE, patient_id, doctor_name, start_time, duration, insurance_carrier, member_id,
+                       schedule_ids=schedule_ids, hold_token=hold_token)
+    if result["status"] == SLOT_TAKEN and hold_token:
+        release_hold(DB_FILE, hold_token)
+    return result
 
 @tool
 def send_confirmation_email_tool(patient_id: int, appointment_time: str) -> dict:
-    """Sends a REAL confirmation email to the patient with their intake form."""
+    """Queues a REAL confirmation email to the patient with their intake form; it is sent in the background."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with connection(DB_FILE) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT FullName, Email FROM Patients WHERE PatientID = ?", (patient_id,))
             patient_info = cursor.fetchone()
@@ -106,46 +145,41 @@ def send_confirmation_email_tool(patient_id: int, appointment_time: str) -> dict
             return {"email_status": "Failed: No email on file"}
 
         patient_name, patient_email = patient_info
-        sender_email = os.getenv("EMAIL_HOST_USER")
-        password = os.getenv("EMAIL_HOST_PASSWORD")
-
-        if not sender_email or not password:
-            print("ERROR: Email credentials not found in .env file.")
-            return {"status": "Error", "message": "Email server not configured."}
+        if not sender_address() or not os.getenv("EMAIL_HOST"):
+            print("ERROR: Email server settings not found in .env file.")
+            return {"email_status": "Failed: Email server not configured."}
 
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = patient_email
-        msg['Subject'] = f"Appointment Confirmed: {appointment_time}"
+        subject = f"Appointment Confirmed: {appointment_time}"
         body = f"Dear {patient_name},\n\nThis confirms your appointment for {appointment_time}.\nPlease find your intake form attached.\n\nThank you,\nAura Health"
-        msg.attach(MIMEText(body, 'plain'))
-
-        with open(PDF_FORM_PATH, "rb") as attachment:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-        
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f"attachment; filename={os.path.basename(PDF_FORM_PATH)}")
-        msg.attach(part)
-
-        with smtplib.SMTP(os.getenv("EMAIL_HOST"), int(os.getenv("EMAIL_PORT"))) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.send_message(msg)
-
-        print(f"Confirmation email successfully sent to {patient_email}")
-        return {"email_status": "Sent"}
+        # The SMTP round trip happens in the outbox workers, not in the patient's turn.
+        start_outbox_workers(DB_FILE)
+        enqueue_email(DB_FILE, patient_email, subject, body, PDF_FORM_PATH, patient_id)
+        return {"email_status": "Queued"}
 
     except Exception as e:
-        print(f"FAILED TO SEND EMAIL: {e}")
+        print(f"FAILED TO QUEUE EMAIL: {e}")
         return {"email_status": f"Failed: {e}"}
 
 # --- Admin Helper Function (Not an LLM tool) ---
-def generate_admin_report():
-    """Generates an Excel report of all appointments."""
-    with sqlite3.connect(DB_FILE) as conn:
-        query = "SELECT a.AppointmentID, p.FullName, a.DoctorName, a.AppointmentTime FROM Appointments a JOIN Patients p ON a.PatientID = p.PatientID;"
-        df = pd.read_sql_query(query, conn)
-        report_path = "admin_report.xlsx"
-        df.to_excel(report_path, index=False)
-        return report_path
+def generate_admin_report(fmt: str = "xlsx", **filters):
+    """Generates a report of all appointments (optionally filtered, see report_export.export_appointments)."""
+    report_path = f"admin_report.{fmt}"
+    export_appointments(DB_FILE, report_path, fmt, **filters)
+    return report_path
+
+
+# --- Async variants ---
+# The tool bodies are blocking SQLite work. Under ainvoke they run on an executor sized to the
+# connection pool, so async callers never queue more threads than there are connections.
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="tools-io")
+
+
+def _offloaded(func):
+    async def run(**kwargs):
+        return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, functools.partial(func, **kwargs))
+    return run
+
+
+for _tool in (search_patient_tool, add_new_patient_tool, find_slots_tool, hold_slot_tool, book_appointment_tool, send_confirmation_email_tool):
+    _tool.func = timed("tool", _tool.name, _tool.func)
+    _tool.coroutine = _offloaded(_tool.func)